@@ -0,0 +1,153 @@
+"""
+Crawl progress events for WebSocket clients.
+
+Jobs ``publish`` themselves whenever their state changes; that only marks
+them dirty. A single broadcaster wakes at most once per ``interval``, takes
+one snapshot of each changed job (so any number of updates in between are
+coalesced into one message) and hands it to the subscribers:
+
+- subscribers to a job get that job's snapshots;
+- subscribers to everything get a summary of all unfinished jobs.
+
+Each subscriber keeps only the newest undelivered message per job (or
+summary), so a client that reads slowly sees fewer, fresher updates rather
+than a growing backlog. A client whose send blocks for longer than
+``send_timeout`` is dropped.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set
+
+SUMMARY = 'summary'
+
+
+class Subscription:
+    """One client's pending messages, newest per key."""
+
+    def __init__(self, job_id: Optional[str] = None):
+        self.job_id = job_id
+        self.closed = False
+        self._pending: Dict[str, dict] = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def offer(self, key: str, message: dict):
+        """Queue a message, replacing any undelivered one with the same key."""
+        if self.closed:
+            return
+        self._pending.pop(key, None)
+        self._pending[key] = message
+        self._ready.set()
+
+    async def get(self) -> Optional[dict]:
+        """The next message, or None once the subscription is closed."""
+        while not self._pending:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        _, message = self._pending.popitem(last=False)
+        return message
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+
+class EventHub:
+    """Coalesce job updates and fan them out to subscribed clients."""
+
+    def __init__(
+        self,
+        summary: Callable[[], dict],
+        interval: float = 0.25,
+        send_timeout: float = 10.0
+    ):
+        self.summary = summary
+        self.interval = interval
+        self.send_timeout = send_timeout
+        self.subscriptions: Set[Subscription] = set()
+        self.dropped = 0
+        self._dirty: Dict[str, Any] = {}
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._broadcast())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for subscription in self.subscriptions:
+            subscription.close()
+        self.subscriptions.clear()
+
+    def publish(self, job):
+        """Note that a job changed; it is snapshotted on the next broadcast."""
+        self._dirty[job.id] = job
+        self._changed.set()
+
+    def subscribe(self, job_id: Optional[str] = None, initial: Optional[dict] = None) -> Subscription:
+        """Subscribe to one job, or to the summary of all jobs when ``job_id`` is None."""
+        subscription = Subscription(job_id)
+        subscription.offer(job_id or SUMMARY, initial if initial is not None else self.summary())
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.close()
+        self.subscriptions.discard(subscription)
+
+    async def _broadcast(self):
+        while True:
+            await self._changed.wait()
+            # Let updates arriving within the interval collapse into one message
+            await asyncio.sleep(self.interval)
+            self._changed.clear()
+            dirty, self._dirty = self._dirty, {}
+            if not self.subscriptions:
+                continue
+            messages = {job_id: job.event() for job_id, job in dirty.items()}
+            summary = self.summary()
+            for subscription in list(self.subscriptions):
+                if subscription.job_id is None:
+                    subscription.offer(SUMMARY, summary)
+                elif subscription.job_id in messages:
+                    subscription.offer(subscription.job_id, messages[subscription.job_id])
+
+    async def serve(self, websocket, job_id: Optional[str] = None, initial: Optional[dict] = None):
+        """Stream events to an accepted WebSocket until it disconnects or is dropped."""
+        subscription = self.subscribe(job_id, initial)
+
+        async def send():
+            while True:
+                message = await subscription.get()
+                if message is None:
+                    return
+                try:
+                    await asyncio.wait_for(websocket.send_json(message), self.send_timeout)
+                except asyncio.TimeoutError:
+                    self.dropped += 1
+                    print(f"Dropping slow WebSocket client after {self.send_timeout}s")
+                    await websocket.close(code=1013)  # try again later
+                    return
+
+        async def receive():
+            # Clients don't send anything; this only notices disconnects
+            while (await websocket.receive())['type'] != 'websocket.disconnect':
+                pass
+
+        tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            # wait(), unlike gather(), doesn't swallow the handler's own cancellation
+            await asyncio.wait(tasks)
+            self.unsubscribe(subscription)
@@ -0,0 +1,372 @@
+"""
+Background crawl jobs.
+
+``POST /crawl`` only queues a job and returns its id; a fixed number of
+worker tasks take jobs from the queue and run them, so several crawls run
+at once and none is tied to an HTTP request. Each job tracks its own status,
+progress and results, and can be cancelled while queued or running. Changes
+are published to an ``EventHub`` for WebSocket clients. Jobs submitted with
+``trace`` write a trace timeline (and with ``profile``, a conversion
+profile) to ``CRAWL_TRACE_DIR`` when they finish. Crawls are checkpointed in
+the crawl database; ``resume`` queues a job that continues an interrupted
+crawl, such as one cut short by a restart, from its last checkpoint.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+from crawler.utils.config import config
+from scripts.checkpoint import load_crawl_state
+from scripts.crawl_history import CrawlSession
+from scripts.frontier import CrawlFrontier, ScopeFilter
+from scripts.storage import create_storage
+from scripts.tracing import Tracer, use_tracer
+from scripts.webpage_to_markdown import crawl_site, process_documents
+from src.events import EventHub
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = {COMPLETED, FAILED, CANCELLED}
+
+
+@dataclass
+class JobResult:
+    """One page or document a job processed."""
+    url: str
+    kind: str  # 'page' or 'document'
+    ok: bool
+
+
+@dataclass
+class CrawlJob:
+    """A crawl request with its status, progress and results."""
+    id: str
+    url: str
+    s3_bucket: str
+    skip_docs: bool = False
+    trace: bool = False
+    profile: bool = False
+    resume_from: Optional[int] = None  # crawl id whose checkpoint the job continues
+    crawl_id: Optional[int] = None  # id in the crawl database, once started
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    pages_failed: int = 0
+    documents_found: int = 0
+    documents_processed: int = 0
+    documents_failed: int = 0
+    trace_path: Optional[str] = None
+    profile_path: Optional[str] = None
+    results: List[JobResult] = field(default_factory=list)
+    frontier: Optional[CrawlFrontier] = field(default=None, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def pages_visited(self) -> int:
+        return self.frontier.stats.visited if self.frontier is not None else 0
+
+    @property
+    def pages_queued(self) -> int:
+        if self.frontier is None:
+            return 0
+        return len(self.frontier) + self.frontier.in_flight
+
+    @property
+    def documents_queued(self) -> int:
+        return max(0, self.documents_found - self.documents_processed - self.documents_failed)
+
+    def progress(self) -> dict:
+        return {
+            'pages_visited': self.pages_visited,
+            'pages_failed': self.pages_failed,
+            'pages_queued': self.pages_queued,
+            'documents_found': self.documents_found,
+            'documents_processed': self.documents_processed,
+            'documents_failed': self.documents_failed,
+            'documents_queued': self.documents_queued,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.id,
+            'crawl_id': self.crawl_id,
+            'url': self.url,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'trace': self.trace_path is not None,
+            'profile': self.profile_path is not None,
+            'progress': self.progress(),
+        }
+
+    def event(self) -> dict:
+        """The job's state as sent to WebSocket subscribers."""
+        event = self.to_dict()
+        event['type'] = 'job'
+        event['current_url'] = self.results[-1].url if self.results else ''
+        return event
+
+
+class JobManager:
+    """Queue crawl jobs and run them on a fixed number of background workers.
+
+    The browser pool, static fetcher, crawl database, uploader and
+    politeness scheduler are shared by every job. Finished jobs are kept
+    for inspection, up to ``history`` of them. Job changes are published
+    to ``events``.
+    """
+
+    def __init__(
+        self,
+        browser_pool=None,
+        static_fetcher=None,
+        crawl_db=None,
+        uploader=None,
+        scheduler=None,
+        workers: int = 2,
+        history: int = 100,
+        event_interval: float = 0.25,
+        event_send_timeout: float = 10.0
+    ):
+        self.browser_pool = browser_pool
+        self.static_fetcher = static_fetcher
+        self.crawl_db = crawl_db
+        self.uploader = uploader
+        self.scheduler = scheduler
+        self.workers = max(1, workers)
+        self.history = history
+        self.jobs: Dict[str, CrawlJob] = OrderedDict()
+        self.recent: Deque[str] = deque(maxlen=100)
+        self.events = EventHub(self.summary, event_interval, event_send_timeout)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def start(self):
+        """Start the workers; idempotent."""
+        if self._queue is not None:
+            return
+        self.events.start()
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        """Cancel every unfinished job, wait for it to clean up, and stop the workers."""
+        running = [job.task for job in self.jobs.values() if job.task is not None and not job.task.done()]
+        for job in self.active():
+            self.cancel(job.id)
+        await asyncio.gather(*running, return_exceptions=True)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        await self.events.close()
+
+    def submit(
+        self,
+        url: str,
+        s3_bucket: str,
+        skip_docs: bool = False,
+        trace: bool = False,
+        profile: bool = False
+    ) -> CrawlJob:
+        """Queue a crawl and return its job right away."""
+        self.start()
+        job = CrawlJob(
+            id=uuid.uuid4().hex,
+            url=url,
+            s3_bucket=s3_bucket,
+            skip_docs=skip_docs,
+            trace=trace or profile,
+            profile=profile
+        )
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job.id)
+        self.events.publish(job)
+        return job
+
+    async def resume(self, crawl_id: int, trace: bool = False, profile: bool = False) -> CrawlJob:
+        """Queue a job that continues crawl ``crawl_id`` from its last checkpoint.
+
+        Raises LookupError if the crawl is unknown and ValueError if it cannot
+        be resumed: it completed, or a job is already running it.
+        """
+        if self.crawl_db is None:
+            raise ValueError("Resuming a crawl needs the crawl database")
+        state = await load_crawl_state(self.crawl_db, crawl_id)
+        if state is None:
+            raise LookupError(f"Unknown crawl: {crawl_id}")
+        if state.status == 'completed':
+            raise ValueError(f"Crawl {crawl_id} already completed")
+        if any(job.resume_from == crawl_id or job.crawl_id == crawl_id for job in self.active()):
+            raise ValueError(f"Crawl {crawl_id} is already running")
+        self.start()
+        job = CrawlJob(
+            id=uuid.uuid4().hex,
+            url=state.start_url,
+            s3_bucket=state.s3_bucket or '',
+            skip_docs=state.skip_docs,
+            trace=trace or profile,
+            profile=profile,
+            resume_from=crawl_id
+        )
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job.id)
+        self.events.publish(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[CrawlJob]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[CrawlJob]:
+        """Every known job, newest first."""
+        return list(reversed(self.jobs.values()))
+
+    def active(self) -> List[CrawlJob]:
+        return [job for job in self.jobs.values() if job.status not in FINISHED]
+
+    def summary(self) -> dict:
+        """Totals over unfinished jobs, as sent to WebSocket clients watching every job."""
+        active = self.active()
+        latest = [job.results[-1].url for job in active if job.results]
+        return {
+            'type': 'summary',
+            'status': 'active' if active else 'idle',
+            'jobs': len(active),
+            'processed': sum(len(job.results) for job in active),
+            'queued': sum(job.pages_queued + job.documents_queued for job in active),
+            'currentUrl': latest[-1] if latest else '',
+        }
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; False if it is unknown or already finished."""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        if job.status == QUEUED:
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            self.events.publish(job)
+        elif job.task is not None:
+            job.task.cancel()
+        return True
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = self.jobs.get(await self._queue.get())
+            if job is None or job.status != QUEUED:
+                continue  # cancelled while queued
+            job.task = asyncio.create_task(self._run(job))
+            try:
+                # wait() returns when the job ends, including when it is cancelled
+                await asyncio.wait([job.task])
+            except asyncio.CancelledError:
+                job.task.cancel()
+                raise
+            finally:
+                self._prune()
+
+    def _write_trace(self, job: CrawlJob, tracer: Tracer):
+        try:
+            job.trace_path = str(tracer.write(os.path.join(config.trace_dir, f"{job.id}.json")))
+            profile = tracer.write_profile(os.path.join(config.trace_dir, f"{job.id}.folded"))
+            job.profile_path = str(profile) if profile is not None else None
+        except OSError as e:
+            print(f"Could not write trace of crawl job {job.id}: {str(e)}")
+
+    async def _run(self, job: CrawlJob):
+        job.status = RUNNING
+        job.started_at = time.time()
+        job.frontier = CrawlFrontier(
+            ScopeFilter.from_config(job.url, config),
+            max_depth=config.max_depth,
+            max_pages=config.max_pages
+        )
+        self.events.publish(job)
+
+        async def on_page(url: str, ok: bool):
+            if not ok:
+                job.pages_failed += 1
+            job.results.append(JobResult(url, 'page', ok))
+            self.events.publish(job)
+
+        async def on_document(url: str, ok: bool):
+            if ok:
+                job.documents_processed += 1
+            else:
+                job.documents_failed += 1
+            job.results.append(JobResult(url, 'document', ok))
+            self.events.publish(job)
+
+        tracer = None
+        if job.trace:
+            tracer = Tracer(job.url, profile_interval=config.profile_interval if job.profile else None)
+
+        # Tasks the crawl starts inherit the tracer
+        with use_tracer(tracer):
+            crawl_session = CrawlSession(self.crawl_db, config, self.scheduler)
+            storage = create_storage(config, job.s3_bucket, self.uploader)
+            status = FAILED
+            try:
+                if job.resume_from is not None:
+                    await crawl_session.resume(job.resume_from)
+                else:
+                    await crawl_session.start(job.url, job.s3_bucket, job.skip_docs)
+                job.crawl_id = crawl_session.crawl_id
+                self.events.publish(job)
+                await storage.open()
+                document_urls = await crawl_site(
+                    job.url,
+                    job.s3_bucket,
+                    self.browser_pool,
+                    self.static_fetcher,
+                    config,
+                    frontier=job.frontier,
+                    crawl_session=crawl_session,
+                    storage=storage,
+                    on_page=on_page
+                )
+                self.recent.append("Scraped content for " + job.url)
+
+                if document_urls and not job.skip_docs:
+                    job.documents_found = len(document_urls)
+                    await process_documents(
+                        document_urls,
+                        job.s3_bucket,
+                        on_complete=on_document,
+                        crawl_session=crawl_session,
+                        storage=storage
+                    )
+                status = COMPLETED
+            except asyncio.CancelledError:
+                status = CANCELLED
+            except Exception as e:
+                print(f"Crawl job {job.id} failed: {str(e)}")
+                job.error = str(e)
+            finally:
+                try:
+                    await storage.close()
+                    await crawl_session.finish(status)
+                    if tracer is not None:
+                        await asyncio.to_thread(self._write_trace, job, tracer)
+                finally:
+                    job.status = status
+                    job.finished_at = time.time()
+                    self.events.publish(job)
@@ -6,15 +6,59 @@ import uvicorn
 
 # Add the backend directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add the repository root so the shared scripts/ and crawler/ packages resolve
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from src.routes import crawler
+from crawler.utils.config import config
+from scripts.change_detection import open_crawl_database
+import scripts.metrics  # registers the crawl stage metrics before the first scrape
+from scripts.politeness import create_scheduler
+from src.jobs import JobManager
+from scripts.s3_uploader import create_uploader
+from scripts.webpage_to_markdown import create_browser_pool, create_static_fetcher
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Share one browser pool, static fetcher, S3 uploader, crawl database and politeness scheduler across crawl jobs; browsers launch on first use."""
+    app.state.browser_pool = create_browser_pool()
+    app.state.static_fetcher = create_static_fetcher()
+    app.state.crawl_db = open_crawl_database(config)
+    app.state.uploader = create_uploader(config)
+    app.state.scheduler = create_scheduler(config)
+    app.state.jobs = JobManager(
+        app.state.browser_pool,
+        app.state.static_fetcher,
+        app.state.crawl_db,
+        app.state.uploader,
+        app.state.scheduler,
+        workers=config.job_workers,
+        history=config.job_history,
+        event_interval=config.event_interval,
+        event_send_timeout=config.event_send_timeout
+    )
+    app.state.jobs.start()
+    try:
+        yield
+    finally:
+        # Stop crawl jobs before the resources they use
+        await app.state.jobs.close()
+        await app.state.browser_pool.close()
+        await app.state.uploader.close()
+        if app.state.static_fetcher is not None:
+            await app.state.static_fetcher.close()
+        if app.state.crawl_db is not None:
+            app.state.crawl_db.dispose()
 
 app = FastAPI(
     title="GrowAgent API",
     description="API for webpage crawling and markdown conversion",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -34,6 +78,11 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency, bytes, in-flight work and errors"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     port = int(os.getenv("BACKEND_PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
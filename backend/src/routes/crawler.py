@@ -1,8 +1,9 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
-import asyncio
-from crawl4ai import WebCrawler
-from crawl4ai.extractor import LLMContentExtractor
+import os
+from crawler.utils.config import config
+from src.jobs import JobManager
 
 router = APIRouter()
 
@@ -11,15 +12,63 @@ class CrawlRequest(BaseModel):
     s3_bucket: str
     skip_docs: bool = False
     download_files: bool = False
+    trace: bool = False
+    profile: bool = False
+
+class ResumeRequest(BaseModel):
+    trace: bool = False
+    profile: bool = False
 
 class CrawlResponse(BaseModel):
     success: bool
     message: str
     page_url: str | None = None
     document_urls: list[str] = []
+    job_id: str | None = None
+    status: str | None = None
 
 class CrawlStatusResponse(BaseModel):
     status: str
+    active_jobs: int = 0
+    queued_jobs: int = 0
+    hosts: dict[str, dict] = {}
+
+class JobProgress(BaseModel):
+    pages_visited: int
+    pages_failed: int
+    pages_queued: int
+    documents_found: int
+    documents_processed: int
+    documents_failed: int
+    documents_queued: int
+
+class JobResponse(BaseModel):
+    job_id: str
+    crawl_id: int | None = None
+    url: str
+    status: str
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    error: str | None = None
+    trace: bool = False
+    profile: bool = False
+    progress: JobProgress
+
+class JobListResponse(BaseModel):
+    jobs: list[JobResponse]
+
+class JobResult(BaseModel):
+    url: str
+    kind: str
+    ok: bool
+
+class JobResultsResponse(BaseModel):
+    job_id: str
+    total: int
+    offset: int
+    limit: int
+    results: list[JobResult]
 
 class ConfigRequest(BaseModel):
     max_depth: int
@@ -35,69 +84,166 @@ class ConfigResponse(BaseModel):
 class RecentContentResponse(BaseModel):
     content: list[str]
 
-active_crawl = False
-recent_content = []
+def get_jobs(http_request: Request) -> JobManager:
+    return http_request.app.state.jobs
+
+def get_job_or_404(http_request: Request, job_id: str):
+    job = get_jobs(http_request).get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown crawl job: {job_id}")
+    return job
 
-@router.post("/crawl", response_model=CrawlResponse)
-async def crawl_webpage(request: CrawlRequest):
+@router.post("/crawl", response_model=CrawlResponse, status_code=202)
+async def crawl_webpage(request: CrawlRequest, http_request: Request):
     """
-    Endpoint to crawl a webpage and convert it to markdown.
-    The markdown files will be stored in the specified S3 bucket.
+    Endpoint to start crawling a webpage, and the pages it links to up to
+    the configured depth, converting them to markdown.
+    The crawl runs as a background job; the response carries its id, to
+    follow with /jobs/{job_id} and stop with /stop. With trace, the job
+    records a timeline, served by /jobs/{job_id}/trace once it finishes;
+    profile also samples the conversion workers (/jobs/{job_id}/profile).
+    The markdown files will be stored in the specified S3 bucket when S3
+    storage is enabled, and under the local storage path otherwise.
     """
-    global active_crawl, recent_content
-    active_crawl = True
-    recent_content = []
+    job = get_jobs(http_request).submit(
+        request.url,
+        request.s3_bucket,
+        request.skip_docs,
+        trace=request.trace,
+        profile=request.profile
+    )
+    return CrawlResponse(
+        success=True,
+        message="Crawl queued",
+        page_url=request.url,
+        job_id=job.id,
+        status=job.status
+    )
+
+@router.post("/crawls/{crawl_id}/resume", response_model=CrawlResponse, status_code=202)
+async def resume_crawl(crawl_id: int, http_request: Request, request: ResumeRequest | None = None):
+    """
+    Endpoint to resume an interrupted crawl (failed, cancelled, or cut short
+    by a restart) from its last checkpoint. Pages and documents finished
+    before the checkpoint are not fetched again. The crawl id is the job's
+    crawl_id. Like /crawl, it queues a job and returns its id.
+    """
+    request = request or ResumeRequest()
     try:
-        # Initialize WebCrawler
-        crawler = WebCrawler(
-            strategy="cosypage",
-            extractor=LLMContentExtractor(llm_api_key=os.getenv("OPENAI_API_KEY")),
-            enable_javascript=True
-        )
+        job = await get_jobs(http_request).resume(crawl_id, trace=request.trace, profile=request.profile)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return CrawlResponse(
+        success=True,
+        message=f"Resume of crawl {crawl_id} queued",
+        page_url=job.url,
+        job_id=job.id,
+        status=job.status
+    )
 
-        # Start crawling
-        crawler.start(request.url)
+@router.get("/jobs", response_model=JobListResponse)
+async def list_jobs(http_request: Request):
+    """
+    Endpoint to list crawl jobs, newest first.
+    """
+    return JobListResponse(jobs=[JobResponse(**job.to_dict()) for job in get_jobs(http_request).list()])
 
-        # Simulate storing recent content dynamically
-        recent_content.append("Scraped content for " + request.url)
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, http_request: Request):
+    """
+    Endpoint to get the status and progress of a crawl job.
+    """
+    return JobResponse(**get_job_or_404(http_request, job_id).to_dict())
 
-        return CrawlResponse(
-            success=True,
-            message="Webpage successfully processed and stored",
-            page_url=request.url,
-            document_urls=crawler.get_document_urls() if crawler.get_document_urls() else []
-        )
+@router.get("/jobs/{job_id}/results", response_model=JobResultsResponse)
+async def get_job_results(
+    job_id: str,
+    http_request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Endpoint to page through the pages and documents a crawl job processed.
+    """
+    job = get_job_or_404(http_request, job_id)
+    page = job.results[offset:offset + limit]
+    return JobResultsResponse(
+        job_id=job.id,
+        total=len(job.results),
+        offset=offset,
+        limit=limit,
+        results=[JobResult(url=r.url, kind=r.kind, ok=r.ok) for r in page]
+    )
 
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error processing webpage: {str(e)}"
-        )
-    finally:
-        active_crawl = False
+@router.get("/jobs/{job_id}/trace")
+async def get_job_trace(job_id: str, http_request: Request):
+    """
+    Endpoint to download the trace timeline of a finished, traced crawl job
+    as Chrome trace-event JSON (open it in https://ui.perfetto.dev).
+    """
+    job = get_job_or_404(http_request, job_id)
+    if job.trace_path is None:
+        raise HTTPException(status_code=404, detail=f"No trace for crawl job {job_id}")
+    return FileResponse(job.trace_path, media_type="application/json", filename=f"{job_id}.json")
+
+@router.get("/jobs/{job_id}/profile")
+async def get_job_profile(job_id: str, http_request: Request):
+    """
+    Endpoint to download the conversion profile of a finished, profiled
+    crawl job as folded stacks (for flamegraph.pl or speedscope).
+    """
+    job = get_job_or_404(http_request, job_id)
+    if job.profile_path is None:
+        raise HTTPException(status_code=404, detail=f"No profile for crawl job {job_id}")
+    return FileResponse(job.profile_path, media_type="text/plain", filename=f"{job_id}.folded")
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, http_request: Request):
+    """
+    Endpoint to cancel a queued or running crawl job.
+    """
+    job = get_job_or_404(http_request, job_id)
+    if not get_jobs(http_request).cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Crawl job {job_id} already {job.status}")
+    return {"status": "cancelling", "job_id": job_id}
 
 @router.get("/recent", response_model=RecentContentResponse)
-async def get_recent_content():
+async def get_recent_content(http_request: Request):
     """
     Endpoint to get recent content.
     """
-    global recent_content
-    return RecentContentResponse(content=recent_content)
+    return RecentContentResponse(content=list(get_jobs(http_request).recent))
 
 @router.post("/stop")
-async def stop_crawl():
-    global active_crawl
-    active_crawl = False
-    return {"status": "stopped"}
+async def stop_crawl(http_request: Request, job_id: str | None = None):
+    """
+    Endpoint to stop one crawl job, or every queued and running job when
+    no job_id is given.
+    """
+    jobs = get_jobs(http_request)
+    targets = [job_id] if job_id else [job.id for job in jobs.active()]
+    stopped = [target for target in targets if jobs.cancel(target)]
+    return {"status": "stopped", "jobs": stopped}
 
 @router.get("/status", response_model=CrawlStatusResponse)
-async def get_crawl_status():
+async def get_crawl_status(http_request: Request):
     """
-    Endpoint to get the status of the crawling process.
+    Endpoint to get the status of the crawling process, with the current
+    request rate, concurrency cap and throttling counts of each host.
     """
-    global active_crawl
-    status = "Crawling in progress..." if active_crawl else "Idle"
-    return CrawlStatusResponse(status=status)
+    active = get_jobs(http_request).active()
+    running = sum(1 for job in active if job.status == 'running')
+    status = "Crawling in progress..." if running else "Idle"
+    scheduler = http_request.app.state.scheduler
+    hosts = scheduler.snapshot() if scheduler is not None else {}
+    return CrawlStatusResponse(
+        status=status,
+        active_jobs=running,
+        queued_jobs=len(active) - running,
+        hosts=hosts
+    )
 
 @router.post("/config", response_model=ConfigResponse)
 async def update_config(request: ConfigRequest):
@@ -112,6 +258,13 @@ async def update_config(request: ConfigRequest):
         os.environ["CRAWL_PARALLEL_DOWNLOADS"] = str(request.parallel_downloads)
         os.environ["CRAWL_FILE_TYPES"] = request.file_types
 
+        # Apply to the running configuration as well, which was read at startup
+        config.max_depth = request.max_depth
+        config.stay_on_domain = request.stay_on_domain
+        config.follow_subdomains = request.follow_subdomains
+        config.parallel_downloads = request.parallel_downloads
+        config.allowed_file_types = request.file_types.split(',')
+
         return ConfigResponse(
             success=True,
             message="Configuration updated successfully"
@@ -124,22 +277,19 @@ async def update_config(request: ConfigRequest):
         )
 
 @router.websocket("/ws/logs")
-async def websocket_logs(websocket: WebSocket):
+async def websocket_logs(websocket: WebSocket, job_id: str | None = None):
+    """
+    Stream crawl progress: a summary of all unfinished jobs, or the state
+    of one job with ?job_id=. Messages are sent when something changes,
+    coalesced to a few per second.
+    """
+    jobs = websocket.app.state.jobs
+    job = jobs.get(job_id) if job_id else None
+    if job_id and job is None:
+        await websocket.close(code=1008)  # unknown job
+        return
     await websocket.accept()
     try:
-        while True:
-            # Get real crawl metrics
-            if active_crawl:
-                await websocket.send_json({
-                    "status": "active",
-                    "processed": len(recent_content),
-                    "queued": 0,  # Would need queue tracking
-                    "currentUrl": recent_content[-1] if recent_content else ""
-                })
-            else:
-                await websocket.send_json({"status": "idle"})
-
-            await asyncio.sleep(0.5)
-
-    except WebSocketDisconnect:
+        await jobs.events.serve(websocket, job_id, job.event() if job is not None else None)
+    except (WebSocketDisconnect, RuntimeError):
         print("Client disconnected")
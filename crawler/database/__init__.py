@@ -1,8 +1,29 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
 from .models import Base
 
+# Applied to every SQLite connection. WAL lets readers run alongside the
+# writer, and busy_timeout makes a second writer wait for the lock instead of
+# failing with "database is locked".
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",  # safe with WAL; only a power loss can drop the last commits
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA cache_size=-65536",  # 64 MB
+    "PRAGMA temp_store=MEMORY",
+)
+
+class SchemaError(RuntimeError):
+    """The database's tables differ from the models in a way that cannot be upgraded in place."""
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
 class DatabaseManager:
     def __init__(self, config):
         self.config = config
@@ -11,14 +32,16 @@ class DatabaseManager:
 
     def _create_engine(self):
         if self.config.db_type == 'sqlite':
-            # SQLite specific configuration
-            return create_engine(
+            # SQLite specific configuration: SQLAlchemy's default pool for
+            # file databases, with WAL and the pragmas above on each connection.
+            # Writes are batched by the crawl's WriteBuffer, so a large pool
+            # would only add connections waiting on the single writer lock.
+            engine = create_engine(
                 self.config.db_uri,
-                connect_args={"check_same_thread": False},
-                poolclass=QueuePool,
-                pool_size=10,
-                max_overflow=20
+                connect_args={"check_same_thread": False, "timeout": 30}
             )
+            event.listen(engine, "connect", _apply_sqlite_pragmas)
+            return engine
         else:
             # PostgreSQL configuration
             return create_engine(
@@ -29,8 +52,49 @@ class DatabaseManager:
             )
 
     def create_database(self):
-        """Create all database tables"""
+        """Create all database tables, and add columns and indexes missing from existing ones"""
         Base.metadata.create_all(bind=self.engine)
+        self.upgrade_schema()
+
+    def upgrade_schema(self):
+        """Add columns and indexes that newer versions of the models define to existing tables.
+
+        ``create_all`` only creates missing tables. Nullable columns can be
+        added in place; anything else needs a manual migration, so a
+        SchemaError is raised rather than letting every write fail later.
+        Missing indexes are created too, so lookups on upgraded tables do
+        not scan them.
+        """
+        inspector = inspect(self.engine)
+        preparer = self.engine.dialect.identifier_preparer
+        statements = []
+        indexes = []
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable or column.primary_key:
+                    raise SchemaError(
+                        f"Table {table.name} lacks column {column.name}, which cannot be added "
+                        f"automatically; migrate the database or start a new one"
+                    )
+                statements.append(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                    f"{preparer.format_column(column)} {column.type.compile(dialect=self.engine.dialect)}"
+                )
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            indexes.extend(index for index in table.indexes if index.name not in existing_indexes)
+        if not statements and not indexes:
+            return
+        with self.engine.begin() as connection:
+            for statement in statements:
+                print(f"Upgrading crawl database: {statement}")
+                connection.execute(text(statement))
+            # After the columns, which new indexes may cover
+            for index in indexes:
+                print(f"Upgrading crawl database: creating index {index.name}")
+                index.create(bind=connection, checkfirst=True)
 
     def get_session(self):
         """Get a new database session"""
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Float, ForeignKey, Text, Boolean, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -19,6 +19,7 @@ class ContentVersion(Base):
     # Track content location
     storage_type = Column(String(10))  # 'local' or 's3'
     storage_path = Column(String(1024))
+    storage_target = Column(String(1024))  # bucket or directory, and layout, the path is under
     
     def __repr__(self):
         return f"<ContentVersion(url_hash='{self.url_hash}', created_at='{self.created_at}')>"
@@ -35,10 +36,20 @@ class CrawlHistory(Base):
     total_documents = Column(Integer, default=0)
     error_count = Column(Integer, default=0)
     
+    # Conditional request (ETag / Last-Modified) revalidation
+    revalidation_hits = Column(Integer, default=0)
+    revalidation_misses = Column(Integer, default=0)
+    bytes_saved = Column(BigInteger, default=0)
+    
     # Configuration used
     max_depth = Column(Integer)
     stay_on_domain = Column(Boolean)
     storage_type = Column(String(10))
+    s3_bucket = Column(String(255))
+    skip_docs = Column(Boolean, default=False)
+    
+    # Last time the crawl's frontier and totals were checkpointed
+    checkpoint_at = Column(DateTime)
     
     # Relationships
     versions = relationship("ContentVersion", backref="crawl")
@@ -54,10 +65,46 @@ class DocumentMetadata(Base):
     url = Column(String(2048))
     document_type = Column(String(10))  # 'pdf', 'doc', 'xls', etc.
     original_filename = Column(String(512))
-    content_hash = Column(String(64))
+    content_hash = Column(String(64), index=True)  # sha256 of the raw document bytes
     extraction_status = Column(String(50))
     created_at = Column(DateTime, default=datetime.utcnow)
     crawl_id = Column(Integer, ForeignKey('crawl_history.id'))
     
+    # Where the converted markdown is stored; shared by documents with the same bytes
+    storage_path = Column(String(1024))
+    storage_target = Column(String(1024))
+    
     def __repr__(self):
         return f"<DocumentMetadata(url='{self.url}', type='{self.document_type}')>"
+
+class HttpValidator(Base):
+    __tablename__ = 'http_validators'
+    
+    id = Column(Integer, primary_key=True)
+    url_hash = Column(String(64), unique=True, index=True)
+    url = Column(String(2048))
+    etag = Column(String(512))
+    last_modified = Column(String(64))
+    content_length = Column(BigInteger)  # body size when last fetched, counted as saved on a 304
+    links = Column(Text)  # JSON page/document links of a page, reused on a 304
+    storage_target = Column(String(1024))  # where the content was stored; other targets ignore the row
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<HttpValidator(url='{self.url}', etag='{self.etag}')>"
+
+class CrawlFrontierEntry(Base):
+    __tablename__ = 'crawl_frontier'
+    __table_args__ = (UniqueConstraint('crawl_id', 'kind', 'url_hash'),)
+    
+    id = Column(Integer, primary_key=True)
+    crawl_id = Column(Integer, ForeignKey('crawl_history.id'), nullable=False)
+    kind = Column(String(10))  # 'page' or 'document'
+    url_hash = Column(String(64))
+    url = Column(String(2048))
+    depth = Column(Integer)
+    state = Column(String(10))  # 'queued', 'leased', 'done' or 'failed'
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<CrawlFrontierEntry(url='{self.url}', state='{self.state}')>"
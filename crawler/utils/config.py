@@ -1,7 +1,7 @@
 import os
 from pathlib import Path
 from typing import Optional, Literal
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -20,25 +20,127 @@ class CrawlConfig:
     # Storage configuration
     use_s3_storage: bool = os.getenv('CRAWL_USE_S3', '').lower() == 'true'
     s3_bucket: Optional[str] = os.getenv('CRAWL_S3_BUCKET')
-    s3_region: str = os.getenv('CRAWL_S3_REGION', 'us-east-1')
+    s3_region: str = os.getenv('CRAWL_S3_REGION', os.getenv('AWS_REGION', 'us-east-1'))
     local_storage_path: str = os.getenv('CRAWL_STORAGE_PATH', './crawl_output')
+    # Local files are fsynced in batches of this many writes (and on close)
+    local_fsync_batch: int = int(os.getenv('CRAWL_LOCAL_FSYNC_BATCH', '64'))
+    # Store each distinct markdown output once under objects/<sha256>.md
+    dedup_storage: bool = os.getenv('CRAWL_DEDUP_STORAGE', 'false').lower() == 'true'
+    # Also write refs/<key> objects naming each URL's object (one more write each)
+    dedup_refs: bool = os.getenv('CRAWL_DEDUP_REFS', 'false').lower() == 'true'
+    # 'files' writes one object per page/document; 'shards' packs them into
+    # rolling gzip JSONL shards, written when they reach either limit
+    output_mode: str = os.getenv('CRAWL_OUTPUT_MODE', 'files')
+    shard_max_mb: int = int(os.getenv('CRAWL_SHARD_MAX_MB', '64'))
+    shard_max_records: int = int(os.getenv('CRAWL_SHARD_MAX_RECORDS', '10000'))
+
+    # S3 uploads: endpoint override for MinIO / moto_server, pooled connections,
+    # objects above the threshold go up in parts, throttling is retried
+    s3_endpoint_url: Optional[str] = os.getenv('CRAWL_S3_ENDPOINT_URL') or None
+    s3_max_connections: int = int(os.getenv('CRAWL_S3_MAX_CONNECTIONS', '32'))
+    s3_multipart_threshold_mb: int = int(os.getenv('CRAWL_S3_MULTIPART_THRESHOLD_MB', '16'))
+    s3_max_attempts: int = int(os.getenv('CRAWL_S3_MAX_ATTEMPTS', '5'))
 
     # Crawling behavior
     max_depth: int = int(os.getenv('CRAWL_MAX_DEPTH', '3'))
     stay_on_domain: bool = os.getenv('CRAWL_STAY_ON_DOMAIN', 'true').lower() == 'true'
     follow_subdomains: bool = os.getenv('CRAWL_FOLLOW_SUBDOMAINS', 'false').lower() == 'true'
+    max_pages: int = int(os.getenv('CRAWL_MAX_PAGES', '0'))  # 0 = no limit
+    parallel_pages: int = int(os.getenv('CRAWL_PARALLEL_PAGES', '8'))
     parallel_downloads: int = int(os.getenv('CRAWL_PARALLEL_DOWNLOADS', '5'))
+    parallel_conversions: int = int(os.getenv('CRAWL_PARALLEL_CONVERSIONS', '2'))
+    parallel_uploads: int = int(os.getenv('CRAWL_PARALLEL_UPLOADS', '8'))
+
+    # HTTP connection pooling
+    http_max_connections: int = int(os.getenv('CRAWL_HTTP_MAX_CONNECTIONS', '100'))
+    http_connections_per_host: int = int(os.getenv('CRAWL_HTTP_CONNECTIONS_PER_HOST', '8'))
+
+    # Download streaming: bodies above the spool threshold go to a temp file,
+    # bodies above the download limit are abandoned (0 disables the limit)
+    spool_threshold_mb: int = int(os.getenv('CRAWL_SPOOL_THRESHOLD_MB', '4'))
+    max_download_mb: int = int(os.getenv('CRAWL_MAX_DOWNLOAD_MB', '500'))
+    # Probe documents with HEAD (or a ranged GET) before downloading them:
+    # 'auto' for links that don't name a document type, 'always' or 'never'
+    probe_documents: str = os.getenv('CRAWL_PROBE_DOCUMENTS', 'auto')
+
+    # Conversion worker processes (0 uses one per CPU); workers are replaced
+    # after max_jobs_per_worker jobs, and jobs are killed after the timeout
+    conversion_workers: int = int(os.getenv('CRAWL_CONVERSION_WORKERS', '0'))
+    conversion_timeout: float = float(os.getenv('CRAWL_CONVERSION_TIMEOUT', '300'))
+    conversion_max_jobs_per_worker: int = int(os.getenv('CRAWL_CONVERSION_MAX_JOBS', '50'))
+    # PDFs: stop after this many pages or characters (0 = no limit); longer
+    # PDFs are split into chunks of pdf_chunk_pages converted in parallel
+    pdf_max_pages: int = int(os.getenv('CRAWL_PDF_MAX_PAGES', '0'))
+    pdf_max_chars: int = int(os.getenv('CRAWL_PDF_MAX_CHARS', '0'))
+    pdf_chunk_pages: int = int(os.getenv('CRAWL_PDF_CHUNK_PAGES', '50'))
+    # CSV and Excel: rows per table (per sheet) and columns kept (0 = all);
+    # rows are read and converted table_chunk_rows at a time
+    table_max_rows: int = int(os.getenv('CRAWL_TABLE_MAX_ROWS', '0'))
+    table_max_columns: int = int(os.getenv('CRAWL_TABLE_MAX_COLUMNS', '0'))
+    table_chunk_rows: int = int(os.getenv('CRAWL_TABLE_CHUNK_ROWS', '10000'))
+
+    # Browser pool: concurrent pages per browser, and when to replace a browser
+    # (after N pages, or when average browser RSS passes the ceiling; 0 = off)
+    browsers: int = int(os.getenv('CRAWL_BROWSERS', '2'))
+    pages_per_browser: int = int(os.getenv('CRAWL_PAGES_PER_BROWSER', '4'))
+    browser_recycle_pages: int = int(os.getenv('CRAWL_BROWSER_RECYCLE_PAGES', '200'))
+    browser_memory_mb: int = int(os.getenv('CRAWL_BROWSER_MEMORY_MB', '0'))
+
+    # Fetch pages over plain HTTP first and only render JS-dependent ones
+    static_fetch: bool = os.getenv('CRAWL_STATIC_FETCH', 'true').lower() == 'true'
+
+    # Per-host politeness: request rate and burst, and the ceiling of the
+    # adaptive concurrency cap (it shrinks on 429/503/timeouts, grows while
+    # responses stay under the target latency)
+    politeness: bool = os.getenv('CRAWL_POLITENESS', 'true').lower() == 'true'
+    host_rate: float = float(os.getenv('CRAWL_HOST_RATE', '4'))
+    host_burst: int = int(os.getenv('CRAWL_HOST_BURST', '8'))
+    host_max_concurrency: int = int(os.getenv('CRAWL_HOST_MAX_CONCURRENCY', '8'))
+    host_target_latency: float = float(os.getenv('CRAWL_HOST_TARGET_LATENCY', '2'))
 
     # File types to process
-    allowed_file_types: list[str] = os.getenv(
+    allowed_file_types: list[str] = field(default_factory=lambda: os.getenv(
         'CRAWL_FILE_TYPES',
         '.pdf,.doc,.docx,.xls,.xlsx,.csv'
-    ).split(',')
+    ).split(','))
+
+    # Distributed crawls: workers sharing a crawl id coordinate through Redis;
+    # a lease not acknowledged within the timeout goes back on the queue
+    redis_url: str = os.getenv('CRAWL_REDIS_URL', 'redis://localhost:6379/0')
+    lease_timeout: float = float(os.getenv('CRAWL_LEASE_TIMEOUT', '600'))
+
+    # Backend crawl jobs: crawls run at once, and finished jobs kept for status
+    job_workers: int = int(os.getenv('CRAWL_JOB_WORKERS', '2'))
+    job_history: int = int(os.getenv('CRAWL_JOB_HISTORY', '100'))
+    # Progress pushed to WebSocket clients at most once per interval (seconds);
+    # clients whose sends block longer than the timeout are dropped
+    event_interval: float = float(os.getenv('CRAWL_EVENT_INTERVAL', '0.25'))
+    event_send_timeout: float = float(os.getenv('CRAWL_EVENT_SEND_TIMEOUT', '10'))
+
+    # Checkpoints for resuming interrupted crawls: frontier changes are
+    # written every checkpoint_interval seconds (0 disables checkpoints), or
+    # sooner once checkpoint_batch_size of them are waiting
+    checkpoint_interval: float = float(os.getenv('CRAWL_CHECKPOINT_INTERVAL', '5'))
+    checkpoint_batch_size: int = int(os.getenv('CRAWL_CHECKPOINT_BATCH_SIZE', '500'))
+
+    # Crawl database writes (change detection, revalidation) are buffered and
+    # written in batches of db_batch_size rows, at least every
+    # db_flush_interval seconds; workers wait once db_max_pending rows are queued
+    db_batch_size: int = int(os.getenv('CRAWL_DB_BATCH_SIZE', '500'))
+    db_flush_interval: float = float(os.getenv('CRAWL_DB_FLUSH_INTERVAL', '1'))
+    db_max_pending: int = int(os.getenv('CRAWL_DB_MAX_PENDING', '5000'))
+
+    # Tracing (--trace, or trace=true on the job API): where traces are
+    # written, and the stack sampling interval (seconds) of --profile
+    trace_dir: str = os.getenv('CRAWL_TRACE_DIR', './traces')
+    profile_interval: float = float(os.getenv('CRAWL_PROFILE_INTERVAL', '0.005'))
 
     # Change detection
     enable_change_detection: bool = os.getenv('CRAWL_CHANGE_DETECTION', 'true').lower() == 'true'
     change_strategy: Literal['content_hash', 'structural'] = os.getenv('CRAWL_CHANGE_STRATEGY', 'structural')
     force_refresh: bool = os.getenv('CRAWL_FORCE_REFRESH', 'false').lower() == 'true'
+    # Send stored ETag / Last-Modified validators so unchanged content answers 304
+    revalidate: bool = os.getenv('CRAWL_REVALIDATE', 'true').lower() == 'true'
 
     @property
     def db_uri(self) -> str:
@@ -65,6 +167,9 @@ class CrawlConfig:
         ]):
             raise ValueError("PostgreSQL configuration incomplete")
 
+        if self.output_mode not in ('files', 'shards'):
+            raise ValueError(f"Unknown output mode: {self.output_mode}")
+
         # Create local storage directory if it doesn't exist
         if not self.use_s3_storage:
             Path(self.local_storage_path).mkdir(parents=True, exist_ok=True)
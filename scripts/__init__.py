@@ -3,6 +3,6 @@ Scripts package for webpage and document processing.
 """
 
 from .webpage_to_markdown import main as process_webpage
-from .document_processor import DocumentProcessor
+from .document_processor import DocumentProcessor, HttpClientConfig
 
-__all__ = ['process_webpage', 'DocumentProcessor']
+__all__ = ['process_webpage', 'DocumentProcessor', 'HttpClientConfig']
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the webpage and document processing pipeline.
+
+Run individual benchmarks as modules from the repository root, e.g.:
+
+    python -m scripts.benchmarks.http_client
+"""
@@ -0,0 +1,274 @@
+"""
+End-to-end crawl benchmark against a synthetic local site.
+
+Generates a site (see ``site.py``), serves it on localhost and runs the real
+crawl: pages through ``crawl_site`` (static fetch, markdown extraction,
+change detection) and linked documents through ``process_documents``
+(download, conversion, upload). Output goes to local storage and a SQLite
+crawl database in a temporary directory, so no network, browser or AWS
+account is needed.
+
+    python -m scripts.benchmarks.crawl --pages 200 --fanout 6 --depth 3
+    python -m scripts.benchmarks.crawl --pdfs 20 --pdf-kb 1024 --output results.json
+    python -m scripts.benchmarks.crawl --output new.json --compare results.json
+
+Reports pages/sec, docs/sec, p50/p95/p99 latency of every stage and queue
+wait (taken from a crawl trace), and the peak RSS of the crawler together
+with its conversion workers. ``--output`` writes the results as JSON;
+``--compare`` prints the change against an earlier results file.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, replace
+from typing import Dict, List, Optional
+
+import psutil
+
+from crawler.utils.config import config
+from ..change_detection import open_crawl_database
+from ..crawl_history import CrawlSession
+from ..storage import create_storage
+from ..tracing import Tracer, use_tracer
+from ..webpage_to_markdown import crawl_site, create_static_fetcher, process_documents
+from .site import DOC_TYPES, SiteSpec, build_site, serve_site
+
+# Lower is better for these; higher is better for the rest
+LOWER_IS_BETTER = ('seconds', 'p50', 'p95', 'p99', 'rss')
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of unsorted values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class PeakRSS:
+    """Sample the RSS of this process and its children until stopped."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self):
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass  # exited between listing and reading
+        self.peak = max(self.peak, total)
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.sample()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stage_latencies(tracer: Tracer) -> Dict[str, dict]:
+    latencies = {}
+    for name, values in sorted(tracer.durations().items()):
+        latencies[name] = {
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+        }
+    return latencies
+
+
+async def run(spec: SiteSpec, seed: int, crawl_overrides: dict) -> dict:
+    generated = time.perf_counter()
+    site = build_site(spec, seed)
+    print(
+        f"Generated {len(site.page_paths)} pages and {len(site.document_paths)} documents "
+        f"({site.bytes / 1024 / 1024:.1f} MB) in {time.perf_counter() - generated:.1f}s"
+    )
+    runner, base_url = await serve_site(site)
+    rss = PeakRSS()
+    tracer = Tracer('benchmark')
+    try:
+        with tempfile.TemporaryDirectory() as output, use_tracer(tracer):
+            crawl_config = replace(
+                config,
+                local_storage_path=output,
+                db_type='sqlite',
+                use_s3_storage=False,
+                static_fetch=True,
+                max_depth=spec.depth,
+                max_pages=0,
+                **crawl_overrides
+            )
+            db = open_crawl_database(crawl_config)
+            crawl_session = CrawlSession(db, crawl_config)
+            await crawl_session.start(base_url + '/index.html')
+            static_fetcher = create_static_fetcher(crawl_config)
+            rss.start()
+            status = 'failed'
+            try:
+                async with create_storage(crawl_config, 'benchmark') as storage:
+                    started = time.perf_counter()
+                    try:
+                        document_urls = await crawl_site(
+                            base_url + '/index.html', 'benchmark', None, static_fetcher, crawl_config,
+                            crawl_session=crawl_session,
+                            storage=storage
+                        )
+                    finally:
+                        await static_fetcher.close()
+                    crawled = time.perf_counter()
+                    stats = await process_documents(
+                        document_urls, 'benchmark', crawl_config,
+                        crawl_session=crawl_session,
+                        storage=storage
+                    )
+                    finished = time.perf_counter()
+                status = 'completed'
+            finally:
+                await rss.stop()
+                await crawl_session.finish(status)
+                if db is not None:
+                    db.dispose()
+    finally:
+        await runner.cleanup()
+
+    pages = crawl_session.recorder.total_pages if crawl_session.recorder is not None else len(site.page_paths)
+    documents = stats[-1].completed if stats else 0
+    page_seconds = crawled - started
+    document_seconds = finished - crawled
+    return {
+        'benchmark': 'crawl',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seed': seed,
+        'site': asdict(spec),
+        'crawl': crawl_overrides,
+        'results': {
+            'pages': pages,
+            'pages_expected': len(site.page_paths),
+            'documents': documents,
+            'documents_expected': len(site.document_paths),
+            'page_seconds': page_seconds,
+            'document_seconds': document_seconds,
+            'total_seconds': finished - started,
+            'pages_per_sec': pages / page_seconds if page_seconds > 0 else 0.0,
+            'docs_per_sec': documents / document_seconds if document_seconds > 0 else 0.0,
+            'peak_rss_mb': rss.peak / 1024 / 1024,
+            # ru_maxrss is in KB on Linux and bytes on macOS
+            'max_rss_self_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        },
+        'latency': stage_latencies(tracer),
+    }
+
+
+def report(results: dict):
+    r = results['results']
+    print(f"\nPages:     {r['pages']}/{r['pages_expected']} in {r['page_seconds']:.2f}s "
+          f"({r['pages_per_sec']:.1f} pages/sec)")
+    print(f"Documents: {r['documents']}/{r['documents_expected']} in {r['document_seconds']:.2f}s "
+          f"({r['docs_per_sec']:.1f} docs/sec)")
+    print(f"Peak RSS:  {r['peak_rss_mb']:.0f} MB with conversion workers, "
+          f"{r['max_rss_self_mb']:.0f} MB crawler process")
+    print(f"\n{'stage':<22} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, latency in results['latency'].items():
+        print(
+            f"{name:<22} {latency['count']:>6} {latency['p50'] * 1000:>9.1f} "
+            f"{latency['p95'] * 1000:>9.1f} {latency['p99'] * 1000:>9.1f}"
+        )
+
+
+def compare(results: dict, baseline: dict):
+    """Print the relative change of every throughput, time and latency against a baseline."""
+    def change(name: str, new: float, old: float):
+        if not old:
+            return
+        delta = (new - old) / old * 100
+        better = delta < 0 if any(k in name for k in LOWER_IS_BETTER) else delta > 0
+        verdict = 'better' if better else 'worse'
+        print(f"{name:<30} {old:>11.4g} -> {new:<11.4g} {delta:+7.1f}% {verdict if abs(delta) >= 5 else ''}")
+
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'}:")
+    for key in ('pages_per_sec', 'docs_per_sec', 'total_seconds', 'peak_rss_mb'):
+        change(key, results['results'][key], baseline['results'].get(key, 0))
+    for name, latency in results['latency'].items():
+        old = baseline.get('latency', {}).get(name)
+        if old is not None:
+            change(f"{name} p95", latency['p95'], old['p95'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark a full crawl of a synthetic local site')
+    parser.add_argument('--pages', type=int, default=100, help='Pages to generate, at most')
+    parser.add_argument('--fanout', type=int, default=5, help='Links from each page to the next level')
+    parser.add_argument('--depth', type=int, default=3, help='Levels of pages below the home page')
+    parser.add_argument('--page-kb', type=int, default=8, help='Text per page in KB')
+    for doc_type in DOC_TYPES:
+        defaults = SiteSpec()
+        parser.add_argument(f'--{doc_type}s', type=int, default=defaults.documents[doc_type],
+                            help=f'{doc_type.upper()} documents to generate')
+        parser.add_argument(f'--{doc_type}-kb', type=int, default=defaults.document_kb[doc_type],
+                            help=f'Size of each {doc_type.upper()} document in KB')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the generated site')
+    parser.add_argument('--politeness', action='store_true',
+                        help='Keep per-host rate limiting on (it throttles the single local host)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Compare with the results JSON of an earlier run')
+
+    args = parser.parse_args()
+
+    spec = SiteSpec(
+        pages=args.pages,
+        fanout=args.fanout,
+        depth=args.depth,
+        page_kb=args.page_kb,
+        documents={t: getattr(args, f'{t}s') for t in DOC_TYPES},
+        document_kb={t: getattr(args, f'{t}_kb') for t in DOC_TYPES}
+    )
+    overrides = {'politeness': args.politeness}
+    results = asyncio.run(run(spec, args.seed, overrides))
+    report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
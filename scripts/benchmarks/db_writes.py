@@ -0,0 +1,174 @@
+"""
+Compare crawl database write throughput of per-row commits and the WriteBuffer.
+
+Concurrent workers record ``content_versions`` and ``document_metadata`` rows
+the way a crawl does: first with a session and commit per row in a thread
+(the previous behaviour), then through a ``WriteBuffer`` that writes them in
+bulk. SQLite runs in a temporary directory, with the previous engine setup
+(rollback journal, QueuePool) and with the current one (WAL and tuned
+pragmas). ``--postgres`` adds the same passes against the PostgreSQL
+database configured by ``CRAWL_DB_HOST``, ``CRAWL_DB_NAME`` etc.; the rows it
+inserts are deleted afterwards.
+
+    python -m scripts.benchmarks.db_writes --rows 20000 --workers 32
+    python -m scripts.benchmarks.db_writes --rows 20000 --postgres
+"""
+
+import argparse
+import asyncio
+import hashlib
+import tempfile
+import time
+from dataclasses import replace
+from typing import List, Tuple
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.pool import QueuePool
+
+from crawler.database import DatabaseManager
+from crawler.database.models import ContentVersion, DocumentMetadata
+from crawler.utils.config import config
+from ..write_buffer import WriteBuffer
+
+URL_PREFIX = 'https://db-benchmark.invalid/'
+
+
+class LegacySQLiteManager(DatabaseManager):
+    """The engine setup before WAL: rollback journal, no pragmas, QueuePool of 10 + 20."""
+
+    def _create_engine(self):
+        return create_engine(
+            self.config.db_uri,
+            connect_args={"check_same_thread": False},
+            poolclass=QueuePool,
+            pool_size=10,
+            max_overflow=20
+        )
+
+
+def make_rows(count: int) -> List[Tuple[type, dict]]:
+    """Page versions, with a document record for every fourth row."""
+    rows = []
+    for i in range(count):
+        digest = hashlib.sha256(str(i).encode()).hexdigest()
+        url = f"{URL_PREFIX}{i}"
+        if i % 4 == 3:
+            rows.append((DocumentMetadata, dict(
+                url_hash=digest, url=url + '.pdf', document_type='pdf', original_filename=f'{i}.pdf',
+                content_hash=digest, extraction_status='converted', storage_path=f'documents/{i}.md'
+            )))
+        else:
+            rows.append((ContentVersion, dict(
+                url_hash=digest, url=url, content_hash=digest, structural_hash=digest,
+                storage_type='local', storage_path=f'pages/{i}.md'
+            )))
+    return rows
+
+
+def insert_row(db: DatabaseManager, model, row: dict):
+    """The pre-buffer write path: one session and commit per record."""
+    with db.get_session() as session:
+        session.add(model(**row))
+        session.commit()
+
+
+async def run_workers(rows: List[Tuple[type, dict]], workers: int, write):
+    """Write all rows from ``workers`` concurrent coroutines."""
+    async def worker(index: int):
+        for model, row in rows[index::workers]:
+            await write(model, row)
+
+    await asyncio.gather(*(worker(i) for i in range(workers)))
+
+
+async def per_row(db: DatabaseManager, rows, workers: int) -> float:
+    """Rows/sec with a commit per row."""
+    started = time.perf_counter()
+    await run_workers(rows, workers, lambda model, row: asyncio.to_thread(insert_row, db, model, row))
+    elapsed = time.perf_counter() - started
+    return len(rows) / elapsed if elapsed > 0 else 0.0
+
+
+async def buffered(db: DatabaseManager, rows, workers: int, batch_size: int, max_pending: int) -> float:
+    """Rows/sec through a WriteBuffer, counting until the last row is written."""
+    buffer = WriteBuffer(db, batch_size=batch_size, max_pending=max_pending)
+    started = time.perf_counter()
+    await run_workers(rows, workers, buffer.insert)
+    await buffer.close()
+    elapsed = time.perf_counter() - started
+    if buffer.failed:
+        print(f"  {buffer.failed} rows failed to write")
+    return len(rows) / elapsed if elapsed > 0 else 0.0
+
+
+def open_database(manager, db_config) -> DatabaseManager:
+    db = manager(db_config)
+    db.create_database()
+    return db
+
+
+def cleanup(db: DatabaseManager):
+    with db.get_session() as session:
+        for model in (ContentVersion, DocumentMetadata):
+            session.execute(delete(model).where(model.url.startswith(URL_PREFIX)))
+        session.commit()
+
+
+async def run_sqlite(rows, workers: int, batch_size: int, max_pending: int):
+    print(f"SQLite: {len(rows)} rows from {workers} workers")
+    results = {}
+    passes = (
+        ('per-row, rollback journal', LegacySQLiteManager, False),
+        ('per-row, WAL', DatabaseManager, False),
+        ('WriteBuffer, WAL', DatabaseManager, True),
+    )
+    for name, manager, use_buffer in passes:
+        # A fresh file per pass: the journal mode is stored in the database
+        with tempfile.TemporaryDirectory() as directory:
+            db = open_database(manager, replace(config, db_type='sqlite', local_storage_path=directory))
+            try:
+                if use_buffer:
+                    results[name] = await buffered(db, rows, workers, batch_size, max_pending)
+                else:
+                    results[name] = await per_row(db, rows, workers)
+            finally:
+                db.dispose()
+        print(f"  {name + ':':28} {results[name]:10.1f} rows/sec")
+    before = results['per-row, rollback journal']
+    if before > 0:
+        print(f"  {'speedup:':28} {results['WriteBuffer, WAL'] / before:10.2f}x")
+
+
+async def run_postgres(rows, workers: int, batch_size: int, max_pending: int):
+    print(f"PostgreSQL ({config.db_host}/{config.db_name}): {len(rows)} rows from {workers} workers")
+    db = open_database(DatabaseManager, replace(config, db_type='postgres'))
+    try:
+        before = await per_row(db, rows, workers)
+        print(f"  {'per-row:':28} {before:10.1f} rows/sec")
+        after = await buffered(db, rows, workers, batch_size, max_pending)
+        print(f"  {'WriteBuffer:':28} {after:10.1f} rows/sec")
+        if before > 0:
+            print(f"  {'speedup:':28} {after / before:10.2f}x")
+    finally:
+        cleanup(db)
+        db.dispose()
+
+
+async def main(rows: int, workers: int, batch_size: int, max_pending: int, postgres: bool):
+    records = make_rows(rows)
+    await run_sqlite(records, workers, batch_size, max_pending)
+    if postgres:
+        await run_postgres(records, workers, batch_size, max_pending)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark per-row vs buffered crawl database writes')
+    parser.add_argument('--rows', type=int, default=20000, help='Rows to write per pass')
+    parser.add_argument('--workers', type=int, default=32, help='Concurrent writers')
+    parser.add_argument('--batch-size', type=int, default=500, help='WriteBuffer batch size')
+    parser.add_argument('--max-pending', type=int, default=5000, help='WriteBuffer rows queued before writers wait')
+    parser.add_argument('--postgres', action='store_true', help='Also run against the configured PostgreSQL database')
+
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rows, args.workers, args.batch_size, args.max_pending, args.postgres))
@@ -0,0 +1,107 @@
+"""
+Compare document download throughput with and without the pooled session.
+
+Starts a local aiohttp server that serves synthetic documents, then downloads
+them twice: once opening a new ClientSession per URL (the previous
+behaviour) and once through a single DocumentProcessor session.
+
+    python -m scripts.benchmarks.http_client --docs 500 --size-kb 64
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from ..document_processor import DocumentProcessor, HttpClientConfig
+
+
+def build_app(size: int) -> web.Application:
+    """Serve /docs/<n>.pdf with a fixed-size body."""
+    body = os.urandom(size)
+
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(body=body, content_type='application/pdf')
+
+    app = web.Application()
+    app.router.add_get('/docs/{name}', handler)
+    return app
+
+
+async def download_per_request_session(url: str) -> Optional[bytes]:
+    """The pre-pooling download path: one session (and connection) per URL."""
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return await response.read()
+                return None
+    except Exception as e:
+        print(f"Error downloading {url}: {str(e)}")
+        return None
+
+
+async def run_batch(urls: List[str], fetch, concurrency: int) -> float:
+    """Download all URLs with bounded concurrency and return docs/sec."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(url: str):
+        async with semaphore:
+            return await fetch(url)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(bounded(u) for u in urls))
+    elapsed = time.perf_counter() - started
+
+    failed = sum(1 for r in results if not r)
+    if failed:
+        print(f"  {failed} downloads failed")
+    return len(urls) / elapsed if elapsed > 0 else 0.0
+
+
+async def main(docs: int, size_kb: int, concurrency: int, per_host: int):
+    runner = web.AppRunner(build_app(size_kb * 1024), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    urls = [f"http://127.0.0.1:{port}/docs/{i}.pdf" for i in range(docs)]
+
+    try:
+        print(f"Downloading {docs} x {size_kb} KB documents, concurrency={concurrency}")
+
+        before = await run_batch(urls, download_per_request_session, concurrency)
+        print(f"  session per request: {before:8.1f} docs/sec")
+
+        http_config = HttpClientConfig(max_connections_per_host=per_host)
+        async with DocumentProcessor(http_config) as processor:
+            async def pooled_download(url: str) -> bool:
+                download = await processor.download_file(url)
+                if download is None:
+                    return False
+                download.close()
+                return True
+
+            after = await run_batch(urls, pooled_download, concurrency)
+        print(f"  pooled session:      {after:8.1f} docs/sec")
+
+        if before > 0:
+            print(f"  speedup:             {after / before:8.2f}x")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark pooled vs per-request HTTP sessions')
+    parser.add_argument('--docs', type=int, default=500, help='Number of documents to download')
+    parser.add_argument('--size-kb', type=int, default=64, help='Size of each document in KB')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent downloads')
+    parser.add_argument('--per-host', type=int, default=8, help='Pooled connections per host')
+
+    args = parser.parse_args()
+
+    asyncio.run(main(args.docs, args.size_kb, args.concurrency, args.per_host))
@@ -0,0 +1,73 @@
+"""
+Compare S3 upload throughput of blocking put_object calls and the S3Uploader.
+
+Needs an S3-compatible endpoint; run a local stand-in such as moto_server or
+MinIO so no AWS account is involved:
+
+    moto_server -p 5000 &
+    python -m scripts.benchmarks.s3_upload --endpoint-url http://127.0.0.1:5000 --objects 500 --size-kb 32
+
+The first pass calls ``put_object`` on the event loop one object at a time
+(the previous behaviour); the second goes through the uploader's thread pool.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import boto3
+
+from ..s3_uploader import S3UploadConfig, S3Uploader
+
+
+async def blocking_uploads(client, bucket: str, keys, body: bytes) -> float:
+    """The pre-uploader path: synchronous put_object inside a coroutine. Returns objects/sec."""
+    async def upload(key: str):
+        client.put_object(Bucket=bucket, Key=key, Body=body, ContentType='text/markdown')
+
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(k) for k in keys))
+    elapsed = time.perf_counter() - started
+    return len(keys) / elapsed if elapsed > 0 else 0.0
+
+
+async def main(endpoint_url: str, bucket: str, objects: int, size_kb: int, workers: int):
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    client = boto3.client('s3', endpoint_url=endpoint_url, region_name='us-east-1')
+    try:
+        client.create_bucket(Bucket=bucket)
+    except client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+    body = os.urandom(size_kb * 1024)
+    print(f"Uploading {objects} x {size_kb} KB objects to {endpoint_url}")
+
+    before = await blocking_uploads(client, bucket, [f"blocking/{i}.md" for i in range(objects)], body)
+    print(f"  blocking put_object: {before:8.1f} objects/sec")
+
+    uploader = S3Uploader(S3UploadConfig(endpoint_url=endpoint_url, region='us-east-1', workers=workers))
+    async with uploader:
+        futures = [await uploader.submit(bucket, f"pooled/{i}.md", body) for i in range(objects)]
+        results = await asyncio.gather(*futures)
+    stats = uploader.stats
+    print(f"  S3Uploader:          {stats.objects_per_second:8.1f} objects/sec, {stats.mb_per_second:.2f} MB/s")
+    if not all(results):
+        print(f"  {results.count(False)} uploads failed")
+
+    if before > 0:
+        print(f"  speedup:             {stats.objects_per_second / before:8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark blocking vs pooled S3 uploads')
+    parser.add_argument('--endpoint-url', required=True, help='S3-compatible endpoint (moto_server, MinIO)')
+    parser.add_argument('--bucket', default='upload-benchmark', help='Bucket to upload into (created if missing)')
+    parser.add_argument('--objects', type=int, default=500, help='Number of objects to upload')
+    parser.add_argument('--size-kb', type=int, default=32, help='Size of each object in KB')
+    parser.add_argument('--workers', type=int, default=16, help='Uploader threads')
+
+    args = parser.parse_args()
+
+    asyncio.run(main(args.endpoint_url, args.bucket, args.objects, args.size_kb, args.workers))
@@ -0,0 +1,290 @@
+"""
+Synthetic website for benchmarks.
+
+``build_site`` generates a deterministic site from a ``SiteSpec`` and a seed:
+HTML pages arranged as a tree with a fixed link fan-out and depth, and PDF,
+DOCX, XLSX and CSV documents of configurable sizes linked from the pages.
+Everything is generated in memory; ``serve_site`` serves it from a local
+aiohttp server.
+
+Document sizes are approximate. For the zipped formats (DOCX, XLSX) they
+are the size of the content before compression.
+"""
+
+import csv
+import io
+import random
+import zipfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+from openpyxl import Workbook
+
+WORDS = (
+    'crawl page document table heading section report budget summary quarter '
+    'revenue policy growth market customer product service region analysis '
+    'forecast metric network storage index archive content version change '
+    'review planning schedule program project result value annual figure'
+).split()
+
+CONTENT_TYPES = {
+    'html': 'text/html; charset=utf-8',
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+DOC_TYPES = ('pdf', 'docx', 'xlsx', 'csv')
+
+
+@dataclass
+class SiteSpec:
+    """Shape of the synthetic site."""
+    pages: int = 100
+    fanout: int = 5  # links from each page to pages one level deeper
+    depth: int = 3
+    page_kb: int = 8
+    documents: Dict[str, int] = field(default_factory=lambda: {t: 5 for t in DOC_TYPES})
+    document_kb: Dict[str, int] = field(default_factory=lambda: {
+        'pdf': 256, 'docx': 128, 'xlsx': 256, 'csv': 512,
+    })
+
+
+@dataclass
+class Site:
+    """Generated files by path, plus what the crawl should find."""
+    files: Dict[str, Tuple[bytes, str]]
+    page_paths: List[str]
+    document_paths: List[str]
+
+    @property
+    def bytes(self) -> int:
+        return sum(len(body) for body, _ in self.files.values())
+
+
+def sentence(rng: random.Random, words: int = 12) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def make_page(rng: random.Random, title: str, links: List[str], size: int) -> bytes:
+    """An HTML page with headings, paragraphs and the given links."""
+    parts = [f"<html><head><title>{title}</title></head><body><h1>{title}</h1>"]
+    total = 0
+    while total < size:
+        paragraph = ' '.join(sentence(rng) for _ in range(6))
+        parts.append(f"<h2>{sentence(rng, 4)}</h2><p>{paragraph}</p>")
+        total += len(paragraph) + 40
+    parts.append('<ul>')
+    parts.extend(f'<li><a href="{link}">{link.rsplit("/", 1)[-1]}</a></li>' for link in links)
+    parts.append('</ul></body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def make_csv(rng: random.Random, size: int) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['id', 'region', 'product', 'quarter', 'revenue', 'notes'])
+    row = 0
+    while out.tell() < size:
+        writer.writerow([
+            row, rng.choice(WORDS), rng.choice(WORDS), f"Q{rng.randint(1, 4)}",
+            round(rng.uniform(0, 100000), 2), sentence(rng, 6)
+        ])
+        row += 1
+    return out.getvalue().encode('utf-8')
+
+
+def make_xlsx(rng: random.Random, size: int) -> bytes:
+    """A workbook with two sheets sharing the rows."""
+    workbook = Workbook(write_only=True)
+    sheets = [workbook.create_sheet('Summary'), workbook.create_sheet('Detail')]
+    for sheet in sheets:
+        sheet.append(['id', 'region', 'product', 'quarter', 'revenue', 'notes'])
+    total, row = 0, 0
+    while total < size:
+        notes = sentence(rng, 6)
+        sheets[row % 2].append([
+            row, rng.choice(WORDS), rng.choice(WORDS), f"Q{rng.randint(1, 4)}",
+            round(rng.uniform(0, 100000), 2), notes
+        ])
+        total += len(notes) + 40
+        row += 1
+    out = io.BytesIO()
+    workbook.save(out)
+    return out.getvalue()
+
+
+def make_docx(rng: random.Random, size: int) -> bytes:
+    """A minimal Word document: headings, paragraphs and a table."""
+    def paragraph(text: str, style: str = '') -> str:
+        props = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+        return f'<w:p>{props}<w:r><w:t>{escape(text)}</w:t></w:r></w:p>'
+
+    def cell(text: str) -> str:
+        return f'<w:tc>{paragraph(text)}</w:tc>'
+
+    body, total = [], 0
+    while total < size:
+        body.append(paragraph(sentence(rng, 4), 'Heading1'))
+        for _ in range(4):
+            text = ' '.join(sentence(rng) for _ in range(5))
+            body.append(paragraph(text))
+            total += len(text)
+        rows = [
+            '<w:tr>' + ''.join(cell(rng.choice(WORDS)) for _ in range(4)) + '</w:tr>'
+            for _ in range(5)
+        ]
+        body.append('<w:tbl>' + ''.join(rows) + '</w:tbl>')
+        total += 400
+    ns = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    document = f'<?xml version="1.0" encoding="UTF-8"?><w:document {ns}><w:body>{"".join(body)}</w:body></w:document>'
+    styles = (
+        f'<?xml version="1.0" encoding="UTF-8"?><w:styles {ns}>'
+        '<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/></w:style>'
+        '</w:styles>'
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '<Override PartName="/word/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+        '</Types>'
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/></Relationships>'
+    )
+    document_rels = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/></Relationships>'
+    )
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', content_types)
+        archive.writestr('_rels/.rels', rels)
+        archive.writestr('word/_rels/document.xml.rels', document_rels)
+        archive.writestr('word/document.xml', document)
+        archive.writestr('word/styles.xml', styles)
+    return out.getvalue()
+
+
+def make_pdf(rng: random.Random, size: int) -> bytes:
+    """A text PDF: per page a heading, a ruled 4x3 table and about 35 lines of text."""
+    def pdf_text(text: str) -> str:
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    streams, total = [], 0
+    while total < size or not streams:
+        lines = [f"BT /F1 16 Tf 72 760 Td ({pdf_text(sentence(rng, 4))}) Tj ET"]
+        # Table: 4 rows of 3 ruled cells, 150 x 18 points each
+        for row in range(4):
+            top = 730 - row * 18
+            for column in range(3):
+                x = 72 + column * 150
+                lines.append(f"{x} {top - 18} 150 18 re S")
+                label = ('Region', 'Quarter', 'Revenue')[column] if row == 0 else rng.choice(WORDS)
+                lines.append(f"BT /F1 10 Tf {x + 4} {top - 13} Td ({label}) Tj ET")
+        y = 640
+        for _ in range(35):
+            text = sentence(rng, 11)
+            lines.append(f"BT /F1 10 Tf 72 {y} Td ({pdf_text(text)}) Tj ET")
+            y -= 15
+            total += len(text) + 30
+        streams.append('\n'.join(lines).encode('latin-1'))
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content per page
+    page_ids = [4 + 2 * i for i in range(len(streams))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{p} 0 R' for p in page_ids)}] /Count {len(streams)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, stream in zip(page_ids, streams):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+MAKERS = {'pdf': make_pdf, 'docx': make_docx, 'xlsx': make_xlsx, 'csv': make_csv}
+
+
+def build_site(spec: SiteSpec, seed: int = 0) -> Site:
+    """Generate the site; the same spec and seed always give the same bytes."""
+    rng = random.Random(seed)
+
+    # Pages form a tree: page i links to pages fanout*i+1 .. fanout*i+fanout
+    depths = [0]
+    children: Dict[int, List[int]] = {}
+    for index in range(1, spec.pages):
+        parent = (index - 1) // max(1, spec.fanout)
+        if depths[parent] >= spec.depth:
+            break
+        depths.append(depths[parent] + 1)
+        children.setdefault(parent, []).append(index)
+    page_paths = ['/index.html'] + [f"/pages/{i}.html" for i in range(1, len(depths))]
+
+    files: Dict[str, Tuple[bytes, str]] = {}
+    document_paths: List[str] = []
+    page_documents: Dict[int, List[str]] = {}
+    for doc_type in DOC_TYPES:
+        size = spec.document_kb.get(doc_type, 64) * 1024
+        for n in range(spec.documents.get(doc_type, 0)):
+            path = f"/files/{doc_type}/{n}.{doc_type}"
+            files[path] = (MAKERS[doc_type](rng, size), CONTENT_TYPES[doc_type])
+            document_paths.append(path)
+            page_documents.setdefault(rng.randrange(len(page_paths)), []).append(path)
+
+    for index, path in enumerate(page_paths):
+        links = [page_paths[child] for child in children.get(index, [])]
+        links.extend(page_documents.get(index, []))
+        title = 'Home' if index == 0 else f"Page {index}"
+        files[path] = (make_page(rng, title, links, spec.page_kb * 1024), CONTENT_TYPES['html'])
+
+    return Site(files, page_paths, document_paths)
+
+
+async def serve_site(site: Site, host: str = '127.0.0.1', port: int = 0) -> Tuple[web.AppRunner, str]:
+    """Serve the site; returns the runner (call ``cleanup()`` when done) and the base URL."""
+    async def handler(request: web.Request) -> web.Response:
+        entry = site.files.get(request.path)
+        if entry is None:
+            raise web.HTTPNotFound()
+        body, content_type = entry
+        return web.Response(body=body, headers={'Content-Type': content_type})
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site_server = web.TCPSite(runner, host, port)
+    await site_server.start()
+    bound_port = site_server._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
@@ -0,0 +1,190 @@
+"""
+Pool of long-lived headless browsers for page rendering.
+
+Launching Chromium costs more than rendering most pages, so the pool starts
+its browsers once and leases them to concurrent ``arun`` calls. Each browser
+serves a bounded number of pages at a time and is replaced after a set
+number of pages, or when the browsers' combined memory grows past a ceiling.
+A replacement that fails to launch is retried by later leases, with backoff.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+
+import psutil
+from crawl4ai.async_configs import BrowserConfig
+from crawl4ai.async_webcrawler import AsyncWebCrawler
+
+# Process names of the browsers and the Playwright driver that runs them;
+# other child processes, such as conversion workers, are not browsers
+BROWSER_PROCESS_NAMES = ('chrom', 'headless_shell', 'firefox', 'webkit', 'node', 'playwright')
+
+
+@dataclass
+class _PooledBrowser:
+    crawler: AsyncWebCrawler
+    pages_served: int = 0
+    in_flight: int = 0
+    retiring: bool = False
+
+
+class BrowserPool:
+    """Lease pages from a fixed set of running browsers."""
+
+    # Memory is sampled at most this often; walking the process tree is not free
+    MEMORY_CHECK_INTERVAL = 5.0
+    # Seconds between attempts to relaunch a browser that failed to start, doubling up to the maximum
+    RELAUNCH_BACKOFF = 1.0
+    MAX_RELAUNCH_BACKOFF = 60.0
+
+    def __init__(
+        self,
+        browsers: int = 2,
+        pages_per_browser: int = 4,
+        max_pages_per_browser: int = 200,
+        memory_ceiling_mb: Optional[int] = None,
+        browser_config: Optional[BrowserConfig] = None
+    ):
+        self.size = max(1, browsers)
+        self.pages_per_browser = max(1, pages_per_browser)
+        self.max_pages_per_browser = max_pages_per_browser
+        self.memory_ceiling_mb = memory_ceiling_mb
+        self.browser_config = browser_config or BrowserConfig(
+            browser_type="chromium",
+            headless=True
+        )
+        self._browsers: List[_PooledBrowser] = []
+        self._slots = asyncio.Semaphore(self.size * self.pages_per_browser)
+        self._lock = asyncio.Lock()
+        self._relaunch_lock = asyncio.Lock()
+        self._started = False
+        self._relaunch_at = 0.0
+        self._relaunch_delay = 0.0
+        self._last_memory_check = 0.0
+        self.recycled = 0
+
+    async def __aenter__(self) -> 'BrowserPool':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _launch(self) -> _PooledBrowser:
+        crawler = AsyncWebCrawler(config=self.browser_config)
+        await crawler.start()
+        return _PooledBrowser(crawler)
+
+    async def start(self):
+        """Launch the pool's browsers. Safe to call more than once."""
+        async with self._lock:
+            if self._started:
+                return
+            self._browsers = list(await asyncio.gather(
+                *(self._launch() for _ in range(self.size))
+            ))
+            self._started = True
+
+    async def close(self):
+        """Close every browser in the pool."""
+        async with self._lock:
+            browsers, self._browsers = self._browsers, []
+            self._started = False
+        for browser in browsers:
+            await self._close_browser(browser)
+
+    async def _close_browser(self, browser: _PooledBrowser):
+        try:
+            await browser.crawler.close()
+        except Exception as e:
+            print(f"Error closing browser: {str(e)}")
+
+    def _pick(self) -> _PooledBrowser:
+        """Choose the least busy browser that is not being retired."""
+        candidates = [
+            b for b in self._browsers
+            if not b.retiring and b.in_flight < self.pages_per_browser
+        ]
+        if not candidates:
+            # Every browser is retiring; keep serving until replacements start
+            candidates = self._browsers
+        return min(candidates, key=lambda b: b.in_flight)
+
+    def _browser_memory_mb(self) -> Optional[float]:
+        """Average resident memory per browser, from this process's browser processes."""
+        now = time.monotonic()
+        if not self.memory_ceiling_mb or now - self._last_memory_check < self.MEMORY_CHECK_INTERVAL:
+            return None
+        self._last_memory_check = now
+
+        total = 0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                name = child.name().lower()
+                if any(marker in name for marker in BROWSER_PROCESS_NAMES):
+                    total += child.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return total / (1024 * 1024) / max(1, len(self._browsers))
+
+    def _should_recycle(self, browser: _PooledBrowser) -> bool:
+        if self.max_pages_per_browser and browser.pages_served >= self.max_pages_per_browser:
+            return True
+        memory = self._browser_memory_mb()
+        return memory is not None and memory > self.memory_ceiling_mb
+
+    async def _replace(self, browser: _PooledBrowser):
+        """Swap a drained, retiring browser for a fresh one."""
+        await self._close_browser(browser)
+        async with self._lock:
+            if browser not in self._browsers:
+                return
+            self._browsers.remove(browser)
+        self.recycled += 1
+        await self._refill()
+
+    async def _refill(self):
+        """Launch a browser if the pool is short of one, unless the last attempt failed too recently."""
+        if not self._started or len(self._browsers) >= self.size or time.monotonic() < self._relaunch_at:
+            return
+        async with self._relaunch_lock:
+            if not self._started or len(self._browsers) >= self.size or time.monotonic() < self._relaunch_at:
+                return
+            try:
+                fresh = await self._launch()
+            except Exception as e:
+                self._relaunch_delay = min(self.MAX_RELAUNCH_BACKOFF, max(self.RELAUNCH_BACKOFF, self._relaunch_delay * 2))
+                self._relaunch_at = time.monotonic() + self._relaunch_delay
+                print(f"Error relaunching browser, retrying in {self._relaunch_delay:.1f}s: {str(e)}")
+                return
+            self._relaunch_delay = 0.0
+            async with self._lock:
+                if self._started:
+                    self._browsers.append(fresh)
+                    fresh = None
+        if fresh is not None:
+            await self._close_browser(fresh)
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[AsyncWebCrawler]:
+        """Borrow a running crawler for one ``arun`` call."""
+        await self.start()
+        async with self._slots:
+            await self._refill()
+            async with self._lock:
+                if not self._browsers:
+                    raise RuntimeError("Browser pool has no running browsers")
+                browser = self._pick()
+                browser.in_flight += 1
+            try:
+                yield browser.crawler
+            finally:
+                browser.in_flight -= 1
+                browser.pages_served += 1
+                if not browser.retiring and self._should_recycle(browser):
+                    browser.retiring = True
+                if browser.retiring and browser.in_flight == 0:
+                    await self._replace(browser)
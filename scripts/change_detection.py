@@ -0,0 +1,295 @@
+"""
+Change detection for recrawls.
+
+Pages are fingerprinted after markdown extraction and documents by the hash
+of their raw bytes. If a fingerprint matches the latest version recorded in
+the crawl database, the page upload, or the document conversion and upload,
+is skipped.
+
+Two page strategies are supported (``CrawlConfig.change_strategy``):
+
+- ``content_hash``: any change to the markdown counts
+- ``structural``: only the skeleton counts (block types, heading text, table
+  shapes and link targets), so volatile text such as timestamps, counters or
+  rotating teasers does not trigger a re-upload
+
+Versions are only compared with versions stored to the same target
+(``storage_target``: S3 bucket or local directory, and layout), so a crawl
+into a new bucket stores everything again.
+
+Lookups go through an in-process LRU of url_hash -> latest hash, so the
+database is only queried once per URL per process. New versions are queued on
+a ``WriteBuffer`` and written in bulk; the LRU already holds them, so the
+crawl does not wait for the write.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+from sqlalchemy import select
+
+from crawler.database import DatabaseManager, SchemaError
+from crawler.database.models import ContentVersion, DocumentMetadata
+from .frontier import canonicalize_url
+from .write_buffer import WriteBuffer
+
+HEADING = re.compile(r'^(#{1,6})\s+(.*)$')
+LIST_ITEM = re.compile(r'^\s*(?:[-*+]|\d+[.)])\s+')
+TABLE_ROW = re.compile(r'^\s*\|.*\|\s*$')
+TABLE_RULE = re.compile(r'^\s*\|?[\s:|-]+\|?\s*$')
+LINK_TARGET = re.compile(r'\]\(([^)\s]+)')
+DIGITS = re.compile(r'\d+')
+
+
+def url_hash(url: str) -> str:
+    """Stable key for a URL in the crawl database."""
+    return hashlib.sha256((canonicalize_url(url) or url).encode('utf-8')).hexdigest()
+
+
+def content_hash(markdown: str) -> str:
+    """Hash of the full markdown text, ignoring whitespace-only differences."""
+    normalized = '\n'.join(line.rstrip() for line in markdown.strip().splitlines())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def structural_hash(markdown: str) -> str:
+    """Hash of the markdown skeleton, ignoring the wording of body text.
+
+    Each block contributes a token: headings keep their level and text (with
+    numbers masked), tables their column count, and any line its link
+    targets (without query strings). Paragraph and list text is reduced to
+    its block type.
+    """
+    tokens = []
+    in_code = False
+    for line in markdown.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('```'):
+            in_code = not in_code
+            tokens.append('code')
+            continue
+        if in_code or not stripped:
+            continue
+
+        heading = HEADING.match(stripped)
+        if heading:
+            text = DIGITS.sub('#', heading.group(2).lower())
+            tokens.append(f"h{len(heading.group(1))}:{text}")
+        elif TABLE_ROW.match(stripped):
+            if not TABLE_RULE.match(stripped):
+                tokens.append(f"tr{stripped.strip('|').count('|') + 1}")
+        elif LIST_ITEM.match(line):
+            tokens.append('li')
+        else:
+            tokens.append('p')
+
+        for target in LINK_TARGET.findall(stripped):
+            tokens.append('a:' + target.split('?', 1)[0].split('#', 1)[0])
+
+    return hashlib.sha256('\n'.join(tokens).encode('utf-8')).hexdigest()
+
+
+@dataclass
+class PageFingerprint:
+    content_hash: str
+    structural_hash: str
+
+
+def fingerprint_page(markdown: str) -> PageFingerprint:
+    return PageFingerprint(content_hash(markdown), structural_hash(markdown))
+
+
+class ChangeDetector:
+    """Decide whether pages and documents changed since the last crawl."""
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        strategy: str = 'structural',
+        force_refresh: bool = False,
+        cache_size: int = 100_000,
+        storage_type: str = 's3',
+        writes: Optional[WriteBuffer] = None,
+        storage_target: Optional[str] = None
+    ):
+        self.db = db
+        # Shared with the rest of the crawl session, which closes it
+        self.writes = writes or WriteBuffer(db)
+        self.strategy = strategy
+        self.force_refresh = force_refresh
+        self.cache_size = cache_size
+        self.storage_type = storage_type
+        self.storage_target = storage_target  # set by the crawl session once it knows the bucket
+        self.crawl_id: Optional[int] = None
+        self._cache: 'OrderedDict[Tuple[str, str], Optional[str]]' = OrderedDict()
+        self.unchanged = 0
+        self.changed = 0
+
+    def _page_key(self, fingerprint: PageFingerprint) -> str:
+        if self.strategy == 'content_hash':
+            return fingerprint.content_hash
+        return fingerprint.structural_hash
+
+    def _cache_get(self, key: Tuple[str, str]):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return True, self._cache[key]
+        return False, None
+
+    def _cache_put(self, key: Tuple[str, str], value: Optional[str]):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _latest_page_hash(self, key: str) -> Optional[str]:
+        column = ContentVersion.content_hash if self.strategy == 'content_hash' else ContentVersion.structural_hash
+        with self.db.get_session() as session:
+            return session.execute(
+                select(column)
+                .where(ContentVersion.url_hash == key)
+                .where(ContentVersion.storage_target == self.storage_target)
+                .order_by(ContentVersion.id.desc())
+                .limit(1)
+            ).scalar()
+
+    def _latest_document_hash(self, key: str) -> Optional[str]:
+        with self.db.get_session() as session:
+            return session.execute(
+                select(DocumentMetadata.content_hash)
+                .where(DocumentMetadata.url_hash == key)
+                .where(DocumentMetadata.storage_target == self.storage_target)
+                .where(DocumentMetadata.extraction_status == 'converted')
+                .order_by(DocumentMetadata.id.desc())
+                .limit(1)
+            ).scalar()
+
+    async def _is_unchanged(self, kind: str, url: str, digest: str, lookup) -> bool:
+        if self.force_refresh:
+            return False
+        key = url_hash(url)
+        found, previous = self._cache_get((kind, key))
+        if not found:
+            previous = await asyncio.to_thread(lookup, key)
+            self._cache_put((kind, key), previous)
+
+        if previous == digest:
+            self.unchanged += 1
+            return True
+        self.changed += 1
+        return False
+
+    async def page_unchanged(self, url: str, fingerprint: PageFingerprint) -> bool:
+        """True if the page matches its latest recorded version under the configured strategy."""
+        return await self._is_unchanged('page', url, self._page_key(fingerprint), self._latest_page_hash)
+
+    async def document_unchanged(self, url: str, raw_hash: str) -> bool:
+        """True if the document's bytes match the last successfully converted version."""
+        return await self._is_unchanged('document', url, raw_hash, self._latest_document_hash)
+
+    def _find_conversion(self, raw_hash: str) -> Optional[str]:
+        with self.db.get_session() as session:
+            return session.execute(
+                select(DocumentMetadata.storage_path)
+                .where(DocumentMetadata.content_hash == raw_hash)
+                .where(DocumentMetadata.storage_target == self.storage_target)
+                .where(DocumentMetadata.extraction_status == 'converted')
+                .where(DocumentMetadata.storage_path.isnot(None))
+                .order_by(DocumentMetadata.id.desc())
+                .limit(1)
+            ).scalar()
+
+    async def find_conversion(self, raw_hash: str) -> Optional[str]:
+        """Storage key of an earlier conversion of the same bytes, under any URL, in this storage target."""
+        if self.force_refresh:
+            return None
+        found, key = self._cache_get(('conversion', raw_hash))
+        if not found:
+            key = await asyncio.to_thread(self._find_conversion, raw_hash)
+            if key is not None:
+                self._cache_put(('conversion', raw_hash), key)
+        return key
+
+    async def record_page(self, url: str, fingerprint: PageFingerprint, storage_path: str):
+        """Store a new page version and make it the cached latest."""
+        key = url_hash(url)
+        await self.writes.insert(ContentVersion, dict(
+            url_hash=key,
+            url=url,
+            content_hash=fingerprint.content_hash,
+            structural_hash=fingerprint.structural_hash,
+            crawl_id=self.crawl_id,
+            storage_type=self.storage_type,
+            storage_path=storage_path,
+            storage_target=self.storage_target
+        ))
+        self._cache_put(('page', key), self._page_key(fingerprint))
+
+    async def record_document(
+        self,
+        url: str,
+        raw_hash: str,
+        status: str = 'converted',
+        storage_path: Optional[str] = None
+    ):
+        """Store document metadata; only converted documents count for change checks."""
+        key = url_hash(url)
+        filename = os.path.basename(urlparse(url).path)
+        await self.writes.insert(DocumentMetadata, dict(
+            url_hash=key,
+            url=url,
+            document_type=os.path.splitext(filename)[1].lstrip('.').lower()[:10],
+            original_filename=filename[:512],
+            content_hash=raw_hash,
+            extraction_status=status,
+            crawl_id=self.crawl_id,
+            storage_path=storage_path,
+            storage_target=self.storage_target
+        ))
+        if status == 'converted':
+            self._cache_put(('document', key), raw_hash)
+            if storage_path is not None:
+                self._cache_put(('conversion', raw_hash), storage_path)
+
+
+def open_crawl_database(crawl_config) -> Optional[DatabaseManager]:
+    """Open the crawl database and create missing tables, or return None if it is unavailable.
+
+    Raises SchemaError if its tables are out of date in a way that cannot be
+    upgraded in place: the crawl would otherwise lose every write.
+    """
+    try:
+        if crawl_config.db_type == 'sqlite':
+            Path(crawl_config.local_storage_path).mkdir(parents=True, exist_ok=True)
+        db = DatabaseManager(crawl_config)
+        db.create_database()
+        return db
+    except SchemaError:
+        raise
+    except Exception as e:
+        print(f"Crawl database unavailable, change detection and revalidation disabled: {str(e)}")
+        return None
+
+
+def create_change_detector(
+    crawl_config,
+    db: Optional[DatabaseManager],
+    writes: Optional[WriteBuffer] = None
+) -> Optional[ChangeDetector]:
+    """Build a change detector from the crawl configuration, or None if disabled."""
+    if db is None or not crawl_config.enable_change_detection:
+        return None
+    return ChangeDetector(
+        db,
+        strategy=crawl_config.change_strategy,
+        force_refresh=crawl_config.force_refresh,
+        storage_type='s3' if crawl_config.use_s3_storage else 'local',
+        writes=writes
+    )
@@ -0,0 +1,257 @@
+"""
+Checkpoints of a running crawl in the crawl database, for resuming it.
+
+Every page and document URL of a crawl has a ``crawl_frontier`` row with its
+state: ``queued``, ``leased`` (being worked on), ``done`` or ``failed``. The
+frontier and the document pipeline report state changes to a
+``CrawlCheckpoint``, which only notes them in memory; a background task
+writes them as one batch of upserts every ``interval`` seconds, or sooner
+once ``batch_size`` changes are waiting, together with the crawl's running
+totals in ``crawl_history``.
+
+A URL whose output is not written yet (sharded output waits for its shard
+to fill) is ``hold()``-ed: its ``done()`` is kept back until ``release()``
+reports the output written, and if it never is, the URL goes back to
+``queued``. A crash in between leaves it ``leased``, so it is redone.
+
+``load_crawl_state`` reads the checkpoint back. A resumed crawl treats every
+recorded URL as seen, queues the pages and documents that were queued or
+leased, and skips the ones already done; work done after the last
+checkpoint is repeated.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from crawler.database import DatabaseManager
+from crawler.database.models import CrawlFrontierEntry, CrawlHistory
+from .change_detection import url_hash
+from .metrics import track
+from .write_buffer import dialect_insert
+
+QUEUED = 'queued'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+@dataclass
+class CrawlState:
+    """What a crawl had done by its last checkpoint."""
+    crawl_id: int
+    start_url: str
+    s3_bucket: Optional[str]
+    skip_docs: bool
+    status: str
+    pages: List[Tuple[str, int]] = field(default_factory=list)  # (url, depth) still to visit
+    seen_pages: List[str] = field(default_factory=list)
+    documents: List[str] = field(default_factory=list)  # still to process
+    seen_documents: List[str] = field(default_factory=list)
+    pages_done: int = 0
+    pages_failed: int = 0
+    documents_done: int = 0
+    documents_failed: int = 0
+
+
+class CrawlCheckpoint:
+    """Batch the frontier state of one crawl and write it to the crawl database periodically."""
+
+    def __init__(self, db: DatabaseManager, crawl_id: int, interval: float = 5.0, batch_size: int = 500):
+        self.db = db
+        self.crawl_id = crawl_id
+        self.interval = interval
+        self.batch_size = batch_size
+        self.restored: Optional[CrawlState] = None
+        self.pages_done = 0
+        self.pages_failed = 0
+        self.documents_done = 0
+        self.documents_failed = 0
+        self.written = 0
+        self._pending: Dict[Tuple[str, str], Tuple[Optional[int], str]] = {}
+        # (kind, url) -> [done() arguments, whether the output was written], until both are known
+        self._held: Dict[Tuple[str, str], list] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._lock = asyncio.Lock()
+
+    def restore(self, state: CrawlState):
+        """Continue the totals of a resumed crawl."""
+        self.restored = state
+        self.pages_done = state.pages_done
+        self.pages_failed = state.pages_failed
+        self.documents_done = state.documents_done
+        self.documents_failed = state.documents_failed
+
+    def _note(self, kind: str, url: str, depth: Optional[int], state: str):
+        self._pending[(kind, url)] = (depth, state)
+        if len(self._pending) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
+    def queued(self, kind: str, url: str, depth: Optional[int] = None):
+        self._note(kind, url, depth, QUEUED)
+
+    def leased(self, kind: str, url: str, depth: Optional[int] = None):
+        self._note(kind, url, depth, LEASED)
+
+    def hold(self, kind: str, url: str):
+        """Keep back the ``done()`` of a URL until ``release()`` says its output was written."""
+        self._held[(kind, url)] = [None, None]
+
+    def release(self, kind: str, url: str, written: bool):
+        """The output of a held URL was written, or could not be."""
+        held = self._held.get((kind, url))
+        if held is None:
+            return
+        held[1] = written
+        self._settle(kind, url)
+
+    def _settle(self, kind: str, url: str):
+        (done, written) = self._held[(kind, url)]
+        if done is None or written is None:
+            return
+        del self._held[(kind, url)]
+        ok, depth = done
+        if written:
+            self._done(kind, url, ok, depth)
+        else:
+            # Nothing was kept, so a resumed crawl has to do it again
+            self._note(kind, url, depth, QUEUED)
+
+    def done(self, kind: str, url: str, ok: bool = True, depth: Optional[int] = None):
+        held = self._held.get((kind, url))
+        if held is not None:
+            held[0] = (ok, depth)
+            self._settle(kind, url)
+            return
+        self._done(kind, url, ok, depth)
+
+    def _done(self, kind: str, url: str, ok: bool, depth: Optional[int]):
+        if kind == 'page':
+            if ok:
+                self.pages_done += 1
+            else:
+                self.pages_failed += 1
+        elif ok:
+            self.documents_done += 1
+        else:
+            self.documents_failed += 1
+        self._note(kind, url, depth, DONE if ok else FAILED)
+
+    def _write(self, batch: Dict[Tuple[str, str], Tuple[Optional[int], str]], totals: dict):
+        now = datetime.utcnow()
+        rows = [
+            {
+                'crawl_id': self.crawl_id, 'kind': kind, 'url_hash': url_hash(url), 'url': url,
+                'depth': depth, 'state': state, 'updated_at': now,
+            }
+            for (kind, url), (depth, state) in batch.items()
+        ]
+        with track('db_write'), self.db.get_session() as session:
+            if rows:
+                insert = dialect_insert(self.db, CrawlFrontierEntry)
+                session.execute(insert.on_conflict_do_update(
+                    index_elements=['crawl_id', 'kind', 'url_hash'],
+                    set_={
+                        'state': insert.excluded.state,
+                        'depth': insert.excluded.depth,
+                        'updated_at': insert.excluded.updated_at,
+                    }
+                ), rows)
+            session.execute(
+                update(CrawlHistory).where(CrawlHistory.id == self.crawl_id).values(checkpoint_at=now, **totals)
+            )
+            session.commit()
+
+    async def flush(self):
+        """Write every pending change and the current totals."""
+        async with self._lock:
+            batch, self._pending = self._pending, {}
+            totals = {
+                'total_pages': self.pages_done,
+                'total_documents': self.documents_done,
+                'error_count': self.pages_failed + self.documents_failed,
+            }
+            try:
+                await asyncio.to_thread(self._write, batch, totals)
+                self.written += len(batch)
+            except Exception as e:
+                # Keep the changes for the next attempt, unless newer ones replaced them
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)
+                print(f"Error writing crawl checkpoint: {str(e)}")
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._pending:
+                await self.flush()
+
+    def start(self):
+        """Start writing checkpoints in the background."""
+        if self._task is None:
+            self._closing = False
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name='crawl-checkpoint')
+
+    async def close(self):
+        """Stop the background writer and write what is left."""
+        if self._task is not None:
+            # Let a write in progress finish rather than cancel it half way
+            self._closing = True
+            self._wake.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+def _load(db: DatabaseManager, crawl_id: int) -> Optional[CrawlState]:
+    with db.get_session() as session:
+        record = session.get(CrawlHistory, crawl_id)
+        if record is None:
+            return None
+        state = CrawlState(
+            crawl_id=crawl_id,
+            start_url=record.start_url,
+            s3_bucket=record.s3_bucket,
+            skip_docs=bool(record.skip_docs),
+            status=record.status
+        )
+        rows = session.execute(
+            select(CrawlFrontierEntry.kind, CrawlFrontierEntry.url, CrawlFrontierEntry.depth, CrawlFrontierEntry.state)
+            .where(CrawlFrontierEntry.crawl_id == crawl_id)
+            .order_by(CrawlFrontierEntry.id)
+            .execution_options(yield_per=10_000)
+        )
+        for kind, url, depth, entry_state in rows:
+            unfinished = entry_state in (QUEUED, LEASED)
+            if kind == 'page':
+                state.seen_pages.append(url)
+                if unfinished:
+                    state.pages.append((url, depth or 0))
+                elif entry_state == DONE:
+                    state.pages_done += 1
+                else:
+                    state.pages_failed += 1
+            else:
+                state.seen_documents.append(url)
+                if unfinished:
+                    state.documents.append(url)
+                elif entry_state == DONE:
+                    state.documents_done += 1
+                else:
+                    state.documents_failed += 1
+        return state
+
+
+async def load_crawl_state(db: DatabaseManager, crawl_id: int) -> Optional[CrawlState]:
+    """The last checkpoint of a crawl, or None if the crawl is unknown."""
+    return await asyncio.to_thread(_load, db, crawl_id)
@@ -0,0 +1,180 @@
+"""
+Process-pool engine for CPU-bound document conversion.
+
+pandoc and pandas block the calling thread for the whole conversion, so the
+converters submit their work here instead of running it on the event loop.
+The engine runs jobs in a ProcessPoolExecutor and adds what the executor
+lacks on its own:
+
+- at most one job per worker in flight: callers wait for a free worker
+  before submitting, so the per-job timeout only counts time spent running,
+  never time queued behind other jobs
+- a per-job timeout that kills the workers (and any pandoc child processes)
+  when a running conversion runs away; the other jobs killed with them are
+  retried once
+- worker recycling: after ``max_jobs_per_worker * workers`` jobs the pool is
+  retired and replaced, which contains memory leaks in native libraries
+- optional profiling: with ``profile_interval`` set, each job runs under a
+  sampling profiler in its worker and the folded stacks collect in
+  ``stacks``
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+import pypandoc
+
+from .tracing import profiled_call
+
+
+def _init_worker():
+    """Put each worker in its own process group so its children can be killed with it."""
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    # Leave Ctrl+C handling to the parent process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def pandoc_to_markdown(path: str, source_format: str) -> str:
+    """Convert a file to markdown with pandoc. Runs inside a worker process."""
+    return pypandoc.convert_file(
+        path,
+        'markdown',
+        format=source_format,
+        extra_args=['--wrap=none']
+    )
+
+
+class ConversionTimeout(Exception):
+    """Raised when a conversion job exceeds the engine's job timeout."""
+
+
+class ConversionEngine:
+    """Run conversion functions in a recycled, time-limited process pool."""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        job_timeout: Optional[float] = 300.0,
+        max_jobs_per_worker: int = 50,
+        profile_interval: Optional[float] = None
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.job_timeout = job_timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.profile_interval = profile_interval
+        self.stacks: Counter = Counter()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs_in_pool = 0
+        self._context = multiprocessing.get_context('spawn')
+        # One slot per worker, so a submitted job starts running right away
+        self._slots = asyncio.Semaphore(self.workers)
+
+    async def __aenter__(self) -> 'ConversionEngine':
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.shutdown()
+
+    def start(self):
+        """Create the worker pool if it is not running."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=self._context,
+                initializer=_init_worker
+            )
+            self._jobs_in_pool = 0
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker pool."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+    def _acquire_pool(self) -> ProcessPoolExecutor:
+        """Return the current pool, retiring it first if it has done its share of jobs."""
+        if self._pool is not None and self.max_jobs_per_worker and \
+                self._jobs_in_pool >= self.max_jobs_per_worker * self.workers:
+            # Queued jobs still finish on the retired pool; its workers then exit
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        self.start()
+        self._jobs_in_pool += 1
+        return self._pool
+
+    def _kill_pool(self, pool: ProcessPoolExecutor):
+        """Kill every worker of a pool, including child processes such as pandoc."""
+        processes = list((getattr(pool, '_processes', None) or {}).values())
+        for process in processes:
+            if process.pid is None:
+                continue
+            try:
+                if hasattr(os, 'killpg'):
+                    os.killpg(process.pid, signal.SIGKILL)
+                else:
+                    process.kill()
+            except (ProcessLookupError, PermissionError):
+                pass
+        pool.shutdown(wait=False, cancel_futures=True)
+        if self._pool is pool:
+            self._pool = None
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run ``func(*args)`` in a worker process and return its result.
+
+        Waits for a free worker first; the timeout starts once the job is
+        submitted to it. Raises ConversionTimeout if the job runs longer than
+        the timeout. A job that fails because another job's timeout killed
+        its pool is retried once.
+        """
+        for attempt in range(2):
+            pool, job = await self._submit(func, *args)
+            try:
+                result = await asyncio.wait_for(asyncio.wrap_future(job), self.job_timeout)
+                if self.profile_interval:
+                    result, stacks = result
+                    self.stacks.update(stacks)
+                return result
+            except asyncio.TimeoutError:
+                # The job held a worker the whole time, so it was running, not queued.
+                # The executor cannot cancel a running job, so kill the pool
+                print(f"Conversion job {func.__name__} timed out after {self.job_timeout}s; restarting workers")
+                self._kill_pool(pool)
+                raise ConversionTimeout(f"{func.__name__} exceeded {self.job_timeout}s")
+            except BrokenProcessPool:
+                if self._pool is pool:
+                    self._kill_pool(pool)
+                if attempt:
+                    raise
+
+    async def _submit(self, func: Callable[..., Any], *args: Any):
+        """Submit a job once a worker is free; its slot is freed when the job ends."""
+        await self._slots.acquire()
+        try:
+            pool = self._acquire_pool()
+            if self.profile_interval:
+                job = pool.submit(profiled_call, func, self.profile_interval, *args)
+            else:
+                job = pool.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        loop = asyncio.get_running_loop()
+
+        def release(_):
+            # A caller that stops waiting does not free the worker, so wait for the job itself
+            try:
+                loop.call_soon_threadsafe(self._slots.release)
+            except RuntimeError:
+                pass  # the event loop is already closed
+
+        job.add_done_callback(release)
+        return pool, job
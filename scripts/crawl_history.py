@@ -0,0 +1,215 @@
+"""
+Per-crawl state kept in the crawl database.
+
+Each crawl gets a ``crawl_history`` row with its page, document, error and
+revalidation totals. ``CrawlSession`` bundles that record with the change
+detector, validator store, politeness scheduler and checkpoint used during
+the crawl, and can pick up an interrupted crawl from its last checkpoint.
+Change detection and revalidation records go through one shared
+``WriteBuffer``, written in bulk and flushed when the crawl finishes.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from crawler.database import DatabaseManager
+from crawler.database.models import CrawlHistory
+from .change_detection import ChangeDetector, create_change_detector
+from .checkpoint import CrawlCheckpoint, CrawlState, load_crawl_state
+from .politeness import PolitenessScheduler, create_scheduler
+from .revalidation import RevalidationStats, ValidatorStore, create_validator_store
+from .storage import storage_target
+from .write_buffer import WriteBuffer, create_write_buffer
+
+
+class CrawlRecorder:
+    """Open a crawl_history row when a crawl starts and fill in its totals when it ends."""
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self.crawl_id: Optional[int] = None
+        self.total_pages = 0
+        self.total_documents = 0
+        self.error_count = 0
+
+    def _start(self, start_url: str, crawl_config, s3_bucket: Optional[str], skip_docs: bool) -> int:
+        with self.db.get_session() as session:
+            record = CrawlHistory(
+                start_url=start_url,
+                status='running',
+                max_depth=crawl_config.max_depth,
+                stay_on_domain=crawl_config.stay_on_domain,
+                storage_type='s3' if crawl_config.use_s3_storage else 'local',
+                s3_bucket=s3_bucket,
+                skip_docs=skip_docs
+            )
+            session.add(record)
+            session.commit()
+            return record.id
+
+    def _finish(self, status: str, revalidation: Optional[RevalidationStats]):
+        with self.db.get_session() as session:
+            record = session.get(CrawlHistory, self.crawl_id)
+            if record is None:
+                return
+            record.status = status
+            record.end_time = datetime.utcnow()
+            record.total_pages = self.total_pages
+            record.total_documents = self.total_documents
+            record.error_count = self.error_count
+            if revalidation is not None:
+                record.revalidation_hits = revalidation.hits
+                record.revalidation_misses = revalidation.misses
+                record.bytes_saved = revalidation.bytes_saved
+            session.commit()
+
+    def _resume(self):
+        with self.db.get_session() as session:
+            record = session.get(CrawlHistory, self.crawl_id)
+            record.status = 'running'
+            record.end_time = None
+            session.commit()
+
+    async def start(
+        self,
+        start_url: str,
+        crawl_config,
+        s3_bucket: Optional[str] = None,
+        skip_docs: bool = False
+    ) -> int:
+        """Insert the crawl as running and return its id."""
+        self.crawl_id = await asyncio.to_thread(self._start, start_url, crawl_config, s3_bucket, skip_docs)
+        return self.crawl_id
+
+    async def resume(self, state: CrawlState):
+        """Mark an interrupted crawl running again, continuing its totals."""
+        self.crawl_id = state.crawl_id
+        self.total_pages = state.pages_done
+        self.total_documents = state.documents_done
+        self.error_count = state.pages_failed + state.documents_failed
+        await asyncio.to_thread(self._resume)
+
+    async def finish(self, status: str = 'completed', revalidation: Optional[RevalidationStats] = None):
+        """Mark the crawl finished with its page, document, error and revalidation totals."""
+        if self.crawl_id is None:
+            return
+        try:
+            await asyncio.to_thread(self._finish, status, revalidation)
+        except Exception as e:
+            print(f"Error recording crawl history: {str(e)}")
+
+
+class CrawlSession:
+    """Crawl history, change detection, revalidation, politeness and checkpoints for one crawl.
+
+    Every part is optional: without a database (``db`` is None) there is no
+    history, change detection, revalidation or checkpointing and the crawl
+    simply processes everything. Pass a shared ``scheduler`` so concurrent
+    crawls respect the same per-host limits; otherwise one is created from
+    the configuration. With ``checkpoints`` (and a checkpoint interval
+    configured), the crawl's frontier is checkpointed so it can be resumed.
+    """
+
+    def __init__(
+        self,
+        db: Optional[DatabaseManager],
+        crawl_config,
+        scheduler: Optional[PolitenessScheduler] = None,
+        checkpoints: bool = True
+    ):
+        self.db = db
+        self.crawl_config = crawl_config
+        self.recorder = CrawlRecorder(db) if db is not None else None
+        self.writes: Optional[WriteBuffer] = create_write_buffer(crawl_config, db)
+        self.change_detector: Optional[ChangeDetector] = create_change_detector(crawl_config, db, self.writes)
+        self.validators: Optional[ValidatorStore] = create_validator_store(crawl_config, db, self.writes)
+        self.scheduler: Optional[PolitenessScheduler] = scheduler or create_scheduler(crawl_config)
+        self.checkpoints = checkpoints and crawl_config.checkpoint_interval > 0
+        self.checkpoint: Optional[CrawlCheckpoint] = None
+
+    def _set_storage_target(self, s3_bucket: Optional[str]):
+        """Compare versions and validators only with those stored where this crawl writes."""
+        target = storage_target(self.crawl_config, s3_bucket)
+        if self.change_detector is not None:
+            self.change_detector.storage_target = target
+        if self.validators is not None:
+            self.validators.storage_target = target
+
+    @property
+    def crawl_id(self) -> Optional[int]:
+        return self.recorder.crawl_id if self.recorder is not None else None
+
+    def _start_checkpoint(self, crawl_id: int) -> CrawlCheckpoint:
+        self.checkpoint = CrawlCheckpoint(
+            self.db,
+            crawl_id,
+            interval=self.crawl_config.checkpoint_interval,
+            batch_size=self.crawl_config.checkpoint_batch_size
+        )
+        self.checkpoint.start()
+        return self.checkpoint
+
+    async def start(self, start_url: str, s3_bucket: Optional[str] = None, skip_docs: bool = False):
+        if self.recorder is None:
+            return
+        self._set_storage_target(s3_bucket)
+        try:
+            crawl_id = await self.recorder.start(start_url, self.crawl_config, s3_bucket, skip_docs)
+        except Exception as e:
+            print(f"Error recording crawl history: {str(e)}")
+            return
+        if self.change_detector is not None:
+            self.change_detector.crawl_id = crawl_id
+        if self.checkpoints:
+            self._start_checkpoint(crawl_id)
+
+    async def resume(self, crawl_id: int) -> CrawlState:
+        """Continue crawl ``crawl_id`` from its last checkpoint.
+
+        Raises ValueError if there is no crawl database, the crawl is unknown,
+        or it already completed.
+        """
+        if self.recorder is None:
+            raise ValueError("Resuming a crawl needs the crawl database")
+        state = await load_crawl_state(self.db, crawl_id)
+        if state is None:
+            raise ValueError(f"Unknown crawl: {crawl_id}")
+        if state.status == 'completed':
+            raise ValueError(f"Crawl {crawl_id} already completed")
+        await self.recorder.resume(state)
+        self._set_storage_target(state.s3_bucket)
+        if self.change_detector is not None:
+            self.change_detector.crawl_id = crawl_id
+        self._start_checkpoint(crawl_id).restore(state)
+        print(
+            f"Resuming crawl {crawl_id} from its checkpoint: {state.pages_done} pages and "
+            f"{state.documents_done} documents done, {len(state.pages)} pages and "
+            f"{len(state.documents)} documents to go"
+        )
+        return state
+
+    async def finish(self, status: str = 'completed'):
+        revalidation = self.validators.stats if self.validators is not None else None
+        if revalidation is not None:
+            print(f"Revalidation: {revalidation.summary()}")
+        if self.change_detector is not None:
+            print(f"Change detection: {self.change_detector.changed} changed, {self.change_detector.unchanged} unchanged")
+        if self.scheduler is not None:
+            print(f"Politeness: {self.scheduler.summary()}")
+        if self.writes is not None:
+            await self.writes.close()
+            print(f"Database writes: {self.writes.summary()}")
+        if self.checkpoint is not None:
+            # Before the final totals, which the checkpoint would overwrite
+            await self.checkpoint.close()
+            if self.recorder is not None:
+                # An interrupted crawl never adds its stage totals; keep what the checkpoint counted
+                checkpoint = self.checkpoint
+                self.recorder.total_pages = max(self.recorder.total_pages, checkpoint.pages_done)
+                self.recorder.total_documents = max(self.recorder.total_documents, checkpoint.documents_done)
+                self.recorder.error_count = max(
+                    self.recorder.error_count, checkpoint.pages_failed + checkpoint.documents_failed
+                )
+        if self.recorder is not None:
+            await self.recorder.finish(status, revalidation)
@@ -0,0 +1,209 @@
+"""
+Document type detection.
+
+A document's type is decided from, most trusted first:
+
+- the magic bytes at the start of its body
+- the ``Content-Type`` header, unless it is a generic one such as
+  ``application/octet-stream``
+- the filename in the ``Content-Disposition`` header, then the URL's file
+  extension (including file names passed in the query string), or that of
+  the URL as linked when a redirect lost it
+
+``detect_type`` returns one of ``DOCUMENT_TYPES``, or None for anything the
+converters cannot read (HTML pages, images, archives, mislabeled files).
+ZIP and OLE bodies whose headers and name don't say which Office format they
+are come back as ``'zip'`` or ``'ole'``; ``resolve_container`` settles those
+from the downloaded file.
+
+Legacy Word files (``.doc``) are recognised, so their links go to the
+document pipeline rather than the page frontier, but none of the converters
+reads them: they are in ``UNCONVERTIBLE_TYPES`` and skipped as unsupported.
+"""
+
+import os
+import re
+import zipfile
+from typing import Optional
+from urllib.parse import parse_qsl, unquote, urlparse
+
+DOCUMENT_TYPES = ('pdf', 'doc', 'docx', 'xls', 'xlsx', 'csv')
+DOCUMENT_EXTENSIONS = tuple(f'.{doc_type}' for doc_type in DOCUMENT_TYPES)
+CONTAINER_TYPES = ('zip', 'ole')
+# Recognised document types without a converter (pandoc only reads docx)
+UNCONVERTIBLE_TYPES = ('doc',)
+
+# Leading bytes read to recognise a body
+SNIFF_BYTES = 2048
+
+CONTENT_TYPES = {
+    'application/pdf': 'pdf',
+    'application/x-pdf': 'pdf',
+    'application/msword': 'doc',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'docx',
+    'application/vnd.ms-excel': 'xls',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'xlsx',
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'text/comma-separated-values': 'csv',
+}
+
+# Types servers send for any download; they say nothing about the format
+GENERIC_CONTENT_TYPES = {
+    '',
+    'application/octet-stream',
+    'binary/octet-stream',
+    'application/download',
+    'application/force-download',
+    'application/x-download',
+    'application/zip',
+    'application/x-zip-compressed',
+    'application/vnd.ms-office',
+    'text/plain',
+}
+
+HTML_CONTENT_TYPES = {'text/html', 'application/xhtml+xml'}
+
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+ZIP_MAGIC = b'PK\x03\x04'
+
+# Links such as /download?id=123 or /attachment/42 that name no file type
+DOWNLOAD_PATH = re.compile(
+    r'/(?:download|attachment|getfile|get_file|file_download|dl)(?:\.\w{2,5})?(?P<rest>/[^/]+)?/?$',
+    re.IGNORECASE
+)
+
+_FILENAME = re.compile(r'''filename\*?\s*=\s*(?:[\w-]+'[\w-]*')?["']?([^"';]+)''', re.IGNORECASE)
+
+
+def mime_type(content_type: Optional[str]) -> str:
+    """The media type of a Content-Type header, without parameters."""
+    return (content_type or '').split(';')[0].strip().lower()
+
+
+def type_from_name(name: Optional[str]) -> Optional[str]:
+    """The document type named by a file name's extension."""
+    extension = os.path.splitext(name or '')[1].lower()
+    return extension[1:] if extension in DOCUMENT_EXTENSIONS else None
+
+
+def type_from_url(url: str) -> Optional[str]:
+    """The document type named by a URL's path, or by a file name in its query."""
+    parsed = urlparse(url)
+    doc_type = type_from_name(unquote(parsed.path))
+    if doc_type is None:
+        for _, value in parse_qsl(parsed.query):
+            doc_type = type_from_name(value)
+            if doc_type is not None:
+                break
+    return doc_type
+
+
+def filename_from_disposition(disposition: Optional[str]) -> Optional[str]:
+    """The file name in a Content-Disposition header, if any."""
+    match = _FILENAME.search(disposition or '')
+    return unquote(match.group(1).strip()) if match else None
+
+
+def is_document_link(url: str) -> bool:
+    """Whether a link should go to the document pipeline rather than the page frontier."""
+    if type_from_url(url) is not None:
+        return True
+    parsed = urlparse(url)
+    match = DOWNLOAD_PATH.search(parsed.path)
+    # A bare /download is more likely a page than a file
+    return match is not None and bool(parsed.query or match.group('rest'))
+
+
+def sniff(prefix: bytes) -> Optional[str]:
+    """Recognise a body from its first bytes: 'pdf', 'zip', 'ole', 'html', 'text' or None."""
+    if b'%PDF-' in prefix[:1024]:
+        return 'pdf'
+    if prefix.startswith(ZIP_MAGIC):
+        return 'zip'
+    if prefix.startswith(OLE_MAGIC):
+        return 'ole'
+    head = prefix.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if head.startswith(b'<'):
+        return 'html'
+    if b'\x00' in prefix:
+        return None
+    control = sum(1 for byte in prefix if byte < 9 or 13 < byte < 32)
+    return 'text' if control <= len(prefix) // 100 else None
+
+
+def detect_type(
+    url: str,
+    content_type: str = '',
+    disposition: str = '',
+    prefix: bytes = b'',
+    original_url: Optional[str] = None
+) -> Optional[str]:
+    """The document type of a response from its URL, headers and, if read, its first bytes.
+
+    ``url`` is where the response came from; pass the URL as linked as
+    ``original_url`` if a redirect led there, e.g. from ``/report.pdf`` to
+    ``/download?id=3``. Returns None when it is not a document type.
+    """
+    mime = mime_type(content_type)
+    declared = CONTENT_TYPES.get(mime)
+    named = (
+        type_from_name(filename_from_disposition(disposition))
+        or type_from_url(url)
+        or (type_from_url(original_url) if original_url else None)
+    )
+    if not prefix:
+        if mime in HTML_CONTENT_TYPES:
+            return None
+        if declared is not None:
+            return declared
+        if mime not in GENERIC_CONTENT_TYPES:
+            return None
+        return named
+
+    kind = sniff(prefix)
+    if kind == 'pdf':
+        return 'pdf'
+    candidates = {'zip': ('docx', 'xlsx'), 'ole': ('doc', 'xls'), 'text': ('csv',)}.get(kind)
+    if candidates is None:
+        return None
+    for guess in (declared, named):
+        if guess in candidates:
+            return guess
+    return kind if kind in CONTAINER_TYPES else None
+
+
+def _ole_type(path: str) -> Optional[str]:
+    # Stream names are stored as UTF-16 in the compound file's directory
+    markers = {'WordDocument'.encode('utf-16-le'): 'doc', 'Workbook'.encode('utf-16-le'): 'xls',
+               'Book'.encode('utf-16-le') + b'\x00\x00': 'xls'}
+    overlap = max(len(marker) for marker in markers)
+    tail = b''
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                return None
+            window = tail + block
+            for marker, doc_type in markers.items():
+                if marker in window:
+                    return doc_type
+            tail = window[-overlap:]
+
+
+def resolve_container(path: str, kind: str) -> Optional[str]:
+    """The Office format of a downloaded ZIP or OLE file, or None if it is neither."""
+    if kind == 'zip':
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = archive.namelist()
+        except zipfile.BadZipFile:
+            return None
+        if 'word/document.xml' in names:
+            return 'docx'
+        if any(name.startswith('xl/') for name in names):
+            return 'xlsx'
+        return None
+    if kind == 'ole':
+        return _ole_type(path)
+    return kind if kind in DOCUMENT_TYPES else None
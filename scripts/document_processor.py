@@ -1,103 +1,373 @@
-import os
-import tempfile
 import asyncio
-from typing import Optional
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional, Set
 import aiohttp
 import pypandoc
-import pandas as pd
-from io import BytesIO
+from .conversion_engine import ConversionEngine, pandoc_to_markdown
+from .doc_types import (
+    CONTAINER_TYPES, GENERIC_CONTENT_TYPES, SNIFF_BYTES, UNCONVERTIBLE_TYPES,
+    detect_type, filename_from_disposition, mime_type, resolve_container, sniff, type_from_url
+)
+from .metrics import record_skip, track
+from .pdf_engine import PdfConfig, join_pages, pdf_page_count, pdf_range_to_markdown, pdf_to_markdown
+from .politeness import PolitenessScheduler, host_slot
+from .revalidation import Validators, ValidatorStore
+from .spooled_download import SpooledDownload
+from .table_engine import TableConfig, csv_to_markdown, excel_to_markdown
+
+@dataclass
+class HttpClientConfig:
+    """Connection pool and streaming settings for the shared download session."""
+    max_connections: int = 100
+    max_connections_per_host: int = 8
+    dns_cache_ttl: int = 300  # seconds
+    keepalive_timeout: float = 30.0  # seconds an idle connection is kept open
+    connect_timeout: float = 30.0
+    total_timeout: float = 300.0
+    compress: bool = True  # ask servers for gzip/deflate encoded responses
+    chunk_size: int = 64 * 1024  # bytes read from the socket per iteration
+    spool_threshold: int = 4 * 1024 * 1024  # bodies larger than this spill to disk
+    max_download_bytes: Optional[int] = 500 * 1024 * 1024  # None or 0 disables the cap
+    # Ask the server about a document before downloading it: 'auto' for URLs
+    # that don't name a document type, 'always', or 'never'
+    probe: str = 'auto'
+
+@dataclass
+class Probe:
+    """What a HEAD or ranged GET revealed about a document before downloading it."""
+    doc_type: Optional[str]
+    size: Optional[int] = None
+    content_type: str = ''
+
+async def _read_prefix(response: aiohttp.ClientResponse) -> bytes:
+    """Read the first ``SNIFF_BYTES`` of a body, or all of a shorter one."""
+    try:
+        return await response.content.readexactly(SNIFF_BYTES)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+def create_session(cfg: HttpClientConfig) -> aiohttp.ClientSession:
+    """Create a pooled aiohttp session from the given settings."""
+    connector = aiohttp.TCPConnector(
+        limit=cfg.max_connections,
+        limit_per_host=cfg.max_connections_per_host,
+        use_dns_cache=True,
+        ttl_dns_cache=cfg.dns_cache_ttl,
+        keepalive_timeout=cfg.keepalive_timeout,
+        enable_cleanup_closed=True
+    )
+    headers = {'Accept-Encoding': 'gzip, deflate'} if cfg.compress else {'Accept-Encoding': 'identity'}
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=cfg.total_timeout, connect=cfg.connect_timeout),
+        headers=headers,
+        auto_decompress=True
+    )
 
 class DocumentProcessor:
-    """Handle conversion of various document types to markdown."""
+    """Handle conversion of various document types to markdown.
+    
+    The processor owns one long-lived HTTP session so connections to the same
+    host are reused across documents, and hands conversions to a process-pool
+    ConversionEngine so they never block the event loop. Pass ``engine`` to
+    share one pool between processors. With a ``validators`` store, downloads
+    are conditional on the validators saved by the last crawl, and with a
+    ``scheduler`` they respect per-host politeness limits. ``pdf_config``
+    sets the page and character budgets of PDF conversion, and
+    ``table_config`` the row and column caps of CSV and Excel conversion. Use it as an
+    async context manager, or call ``close()`` when done:
+    
+        async with DocumentProcessor() as processor:
+            markdown = await processor.process_document(url)
+    """
     
-    def __init__(self):
+    def __init__(
+        self,
+        http_config: Optional[HttpClientConfig] = None,
+        engine: Optional[ConversionEngine] = None,
+        validators: Optional[ValidatorStore] = None,
+        scheduler: Optional[PolitenessScheduler] = None,
+        pdf_config: Optional[PdfConfig] = None,
+        table_config: Optional[TableConfig] = None
+    ):
         # Ensure pandoc is available for document conversion
         try:
             pypandoc.get_pandoc_version()
         except OSError:
             raise RuntimeError("Pandoc is not installed. Please install pandoc first.")
+        
+        self.http_config = http_config or HttpClientConfig()
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Only shut down the engine on close() if this processor created it
+        self._owns_engine = engine is None
+        self.engine = engine or ConversionEngine()
+        self.validators = validators
+        self.scheduler = scheduler
+        self.pdf_config = pdf_config or PdfConfig()
+        self.table_config = table_config or TableConfig()
+        # Documents dropped before download, by reason, and the bytes that saved
+        self.skipped: Counter = Counter()
+        self.bytes_avoided = 0
+        self._skipped_urls: Set[str] = set()
     
-    async def download_file(self, url: str) -> Optional[bytes]:
-        """Download a file from a URL."""
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        return await response.read()
+    async def __aenter__(self) -> 'DocumentProcessor':
+        await self.open()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def open(self):
+        """Create the pooled HTTP session and start the conversion engine."""
+        self.engine.start()
+        if self._session is not None and not self._session.closed:
+            return
+        self._session = create_session(self.http_config)
+    
+    async def close(self):
+        """Close the HTTP session and stop the engine if this processor owns it."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._owns_engine:
+            self.engine.shutdown()
+    
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared HTTP session, available once the processor is open."""
+        if self._session is None or self._session.closed:
+            raise RuntimeError("DocumentProcessor session is not open; use 'async with' or call open()")
+        return self._session
+    
+    def _skip(self, url: str, reason: str, size: Optional[int], transferred: int = 0):
+        """Count a document dropped on purpose, usually before its body was downloaded."""
+        avoided = max(0, size - transferred) if size else 0
+        self._skipped_urls.add(url)
+        self.skipped[reason] += 1
+        self.bytes_avoided += avoided
+        record_skip(reason, avoided)
+    
+    def take_skipped(self, url: str) -> bool:
+        """Whether the last download or conversion of a URL that returned None skipped it on purpose."""
+        if url in self._skipped_urls:
+            self._skipped_urls.discard(url)
+            return True
+        return False
+    
+    def _wants_probe(self, url: str, previous: Optional[Validators]) -> bool:
+        mode = self.http_config.probe
+        # A conditional GET already costs only one request when nothing changed
+        if mode == 'never' or previous is not None:
+            return False
+        return mode == 'always' or type_from_url(url) is None
+    
+    async def probe(self, url: str) -> Optional[Probe]:
+        """Find out a document's type and size without downloading it.
+        
+        Sends a HEAD request and, if the server refuses it or answers with a
+        generic content type, a GET for the first ``SNIFF_BYTES`` only.
+        Returns None if neither tells anything; the download then decides.
+        """
+        with track('probe', url) as span:
+            try:
+                await self.open()
+                async with host_slot(self.scheduler, url) as slot, \
+                        self.session.head(url, allow_redirects=True) as response:
+                    slot.record(response.status, response.headers.get('Retry-After'))
+                    mime = mime_type(response.headers.get('Content-Type'))
+                    disposition = response.headers.get('Content-Disposition', '')
+                    if response.status == 200 and (mime not in GENERIC_CONTENT_TYPES or filename_from_disposition(disposition)):
+                        doc_type = detect_type(str(response.url), mime, disposition, original_url=url)
+                        return Probe(doc_type, response.content_length, mime)
+                
+                headers = {'Range': f'bytes=0-{SNIFF_BYTES - 1}'}
+                async with host_slot(self.scheduler, url) as slot, self.session.get(url, headers=headers) as response:
+                    slot.record(response.status, response.headers.get('Retry-After'))
+                    if response.status == 206:
+                        # Content-Range: bytes 0-2047/123456
+                        total = re.search(r'/(\d+)\s*$', response.headers.get('Content-Range', ''))
+                        size = int(total.group(1)) if total else None
+                    elif response.status == 200:
+                        # Ranges not supported; leaving the block drops the rest of the body
+                        size = response.content_length
                     else:
-                        print(f"Failed to download {url}: Status {response.status}")
                         return None
-        except Exception as e:
-            print(f"Error downloading {url}: {str(e)}")
-            return None
+                    prefix = await _read_prefix(response)
+                    span.add_bytes(len(prefix))
+                    mime = mime_type(response.headers.get('Content-Type'))
+                    return Probe(
+                        detect_type(
+                            str(response.url), mime, response.headers.get('Content-Disposition', ''), prefix,
+                            original_url=url
+                        ),
+                        size,
+                        mime
+                    )
+            except Exception as e:
+                print(f"Error probing {url}: {str(e)}")
+                span.fail()
+                return None
     
-    async def convert_pdf_to_markdown(self, content: bytes) -> Optional[str]:
-        """Convert PDF content to markdown."""
-        try:
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_pdf:
-                temp_pdf.write(content)
-                temp_pdf.flush()
+    async def download_file(self, url: str) -> Optional[SpooledDownload]:
+        """Stream a file from a URL into a spooled download.
+        
+        Returns None if the request fails, the body exceeds
+        ``max_download_bytes``, or it is not a supported document. Unsupported
+        and oversized files are recognised from a probe, the response headers
+        or the first bytes of the body, before the rest is transferred. If the
+        server answers ``304 Not Modified`` to the stored validators, the
+        download is empty and flagged ``not_modified``. The caller owns the
+        returned download and must close it; its ``doc_type`` is the detected
+        document type.
+        """
+        cfg = self.http_config
+        await self.open()
+        previous = await self.validators.get(url) if self.validators is not None else None
+        if self._wants_probe(url, previous):
+            probe = await self.probe(url)
+            if probe is not None and (probe.doc_type is None or probe.doc_type in UNCONVERTIBLE_TYPES):
+                print(f"Skipping {url}: not a supported document ({probe.doc_type or probe.content_type or 'unknown type'})")
+                self._skip(url, 'unsupported', probe.size)
+                return None
+            if probe is not None and cfg.max_download_bytes and (probe.size or 0) > cfg.max_download_bytes:
+                print(f"Skipping {url}: {probe.size} bytes exceeds download limit")
+                self._skip(url, 'too_large', probe.size)
+                return None
+        
+        download = None
+        with track('download', url) as span:
+            try:
+                headers = previous.headers() if previous is not None else None
+                async with host_slot(self.scheduler, url) as slot, self.session.get(url, headers=headers) as response:
+                    slot.record(response.status, response.headers.get('Retry-After'))
+                    if response.status == 304 and previous is not None:
+                        self.validators.record_hit(previous)
+                        download = SpooledDownload(cfg.spool_threshold)
+                        download.not_modified = True
+                        download.validators = previous
+                        return download
+                    if headers:
+                        self.validators.record_miss()
                 
-                # Convert PDF to markdown using pandoc
-                markdown = pypandoc.convert_file(
-                    temp_pdf.name,
-                    'markdown',
-                    format='pdf',
-                    extra_args=['--wrap=none']
-                )
+                    if response.status != 200:
+                        print(f"Failed to download {url}: Status {response.status}")
+                        span.fail()
+                        return None
                 
-                os.unlink(temp_pdf.name)
-                return markdown
+                    # Reject oversized files before reading the body when the server tells us
+                    size = response.content_length
+                    if cfg.max_download_bytes and (size or 0) > cfg.max_download_bytes:
+                        print(f"Skipping {url}: {size} bytes exceeds download limit")
+                        self._skip(url, 'too_large', size)
+                        return None
+                    
+                    # Check the headers and first bytes before taking the rest of the body
+                    prefix = await _read_prefix(response)
+                    span.add_bytes(len(prefix))
+                    doc_type = detect_type(
+                        str(response.url),
+                        response.headers.get('Content-Type', ''),
+                        response.headers.get('Content-Disposition', ''),
+                        prefix,
+                        original_url=url
+                    )
+                    if doc_type is None or doc_type in UNCONVERTIBLE_TYPES:
+                        content_type = mime_type(response.headers.get('Content-Type')) or 'unknown type'
+                        body = doc_type or sniff(prefix) or 'binary'
+                        print(f"Skipping {url}: not a supported document ({content_type}, {body} body)")
+                        self._skip(url, 'unsupported', size, len(prefix))
+                        return None
+                
+                    download = SpooledDownload(cfg.spool_threshold, suffix=f'.{doc_type}')
+                    download.doc_type = doc_type
+                    download.write(prefix)
+                    async for chunk in response.content.iter_chunked(cfg.chunk_size):
+                        download.write(chunk)
+                        span.add_bytes(len(chunk))
+                        if cfg.max_download_bytes and download.size > cfg.max_download_bytes:
+                            print(f"Skipping {url}: body exceeds {cfg.max_download_bytes} byte download limit")
+                            self._skip(url, 'too_large', size, download.size)
+                            download.close()
+                            return None
+                    download.validators = Validators.from_headers(response.headers, download.size)
+                    return download
+            except Exception as e:
+                print(f"Error downloading {url}: {str(e)}")
+                span.fail()
+                if download is not None:
+                    download.close()
+                return None
+    
+    async def convert_pdf_to_markdown(self, path: str) -> Optional[str]:
+        """Convert a PDF file to markdown.
+        
+        PDFs up to ``chunk_pages`` pages are converted in one job. Longer ones
+        are split into ranges of ``chunk_pages`` pages, converted in parallel
+        as engine workers free up. The engine's worker slots are shared by
+        every document, so concurrent PDFs never queue more jobs than there
+        are workers. Chunks not started when the character budget is
+        reached are dropped.
+        """
+        cfg = self.pdf_config
+        try:
+            page_count = await self.engine.run(pdf_page_count, path)
+            pages = min(page_count, cfg.max_pages) if cfg.max_pages else page_count
+            if not cfg.chunk_pages or pages <= cfg.chunk_pages or self.engine.workers < 2:
+                return await self.engine.run(pdf_to_markdown, path, cfg.max_pages, cfg.max_chars)
+            
+            ranges = [(start, min(start + cfg.chunk_pages, pages)) for start in range(0, pages, cfg.chunk_pages)]
+            collected: List[str] = []
+            truncated = pages < page_count
+            # Each chunk waits for a free engine worker, in page order
+            chunks = [
+                asyncio.ensure_future(self.engine.run(pdf_range_to_markdown, path, start, stop, cfg.max_chars))
+                for start, stop in ranges
+            ]
+            try:
+                for chunk in chunks:
+                    collected.extend(await chunk)
+                    if cfg.max_chars and sum(len(page) for page in collected) >= cfg.max_chars:
+                        truncated = True
+                        break
+            finally:
+                for chunk in chunks:
+                    chunk.cancel()
+                await asyncio.gather(*chunks, return_exceptions=True)
+            return join_pages(collected, cfg.max_chars, truncated)
                 
         except Exception as e:
             print(f"Error converting PDF to markdown: {str(e)}")
             return None
     
-    async def convert_word_to_markdown(self, content: bytes) -> Optional[str]:
-        """Convert Word document to markdown."""
+    async def convert_word_to_markdown(self, path: str) -> Optional[str]:
+        """Convert a Word document to markdown."""
         try:
-            with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as temp_doc:
-                temp_doc.write(content)
-                temp_doc.flush()
-                
-                # Convert Word to markdown using pandoc
-                markdown = pypandoc.convert_file(
-                    temp_doc.name,
-                    'markdown',
-                    format='docx',
-                    extra_args=['--wrap=none']
-                )
-                
-                os.unlink(temp_doc.name)
-                return markdown
+            # Convert Word to markdown using pandoc
+            return await self.engine.run(pandoc_to_markdown, path, 'docx')
                 
         except Exception as e:
             print(f"Error converting Word document to markdown: {str(e)}")
             return None
     
-    async def convert_excel_to_markdown(self, content: bytes) -> Optional[str]:
-        """Convert Excel file to markdown."""
+    async def convert_excel_to_markdown(self, path: str) -> Optional[str]:
+        """Convert every sheet of an Excel file to markdown."""
+        cfg = self.table_config
         try:
-            # Read Excel file into pandas
-            df = pd.read_excel(BytesIO(content))
-            
-            # Convert DataFrame to markdown table
-            markdown = df.to_markdown(index=False)
-            return markdown
+            # Stream the workbook's rows into one markdown table per sheet
+            return await self.engine.run(excel_to_markdown, path, cfg.max_rows, cfg.max_columns, cfg.chunk_rows)
             
         except Exception as e:
             print(f"Error converting Excel to markdown: {str(e)}")
             return None
     
-    async def convert_csv_to_markdown(self, content: bytes) -> Optional[str]:
-        """Convert CSV file to markdown."""
+    async def convert_csv_to_markdown(self, path: str) -> Optional[str]:
+        """Convert a CSV file to markdown."""
+        cfg = self.table_config
         try:
-            # Read CSV file into pandas
-            df = pd.read_csv(BytesIO(content))
-            
-            # Convert DataFrame to markdown table
-            markdown = df.to_markdown(index=False)
-            return markdown
+            # Stream the CSV into a markdown table in chunks of rows
+            return await self.engine.run(csv_to_markdown, path, cfg.max_rows, cfg.max_columns, cfg.chunk_rows)
             
         except Exception as e:
             print(f"Error converting CSV to markdown: {str(e)}")
@@ -105,22 +375,47 @@ class DocumentProcessor:
     
     async def process_document(self, url: str) -> Optional[str]:
         """Process a document URL and convert it to markdown."""
-        # Download the document
-        content = await self.download_file(url)
-        if not content:
+        try:
+            # Download the document
+            download = await self.download_file(url)
+            if download is None:
+                return None
+            with download:
+                if download.not_modified:
+                    print(f"Not modified since last crawl: {url}")
+                    return None
+                return await self.convert_document(url, download)
+        finally:
+            # Skips and failures look the same to this method's callers
+            self.take_skipped(url)
+    
+    async def convert_document(self, url: str, download: SpooledDownload) -> Optional[str]:
+        """Convert a downloaded document to markdown based on its detected type."""
+        doc_type = download.doc_type or type_from_url(url)
+        if doc_type in CONTAINER_TYPES:
+            # An Office file whose headers and name did not say which format it is
+            doc_type = await asyncio.to_thread(resolve_container, download.path, doc_type)
+        if doc_type in UNCONVERTIBLE_TYPES:
+            print(f"Skipping {url}: not a supported document ({doc_type})")
+            self._skip(url, 'unsupported', None)
             return None
-            
-        # Determine file type and convert accordingly
-        url_lower = url.lower()
+        with track('convert', url, doc_type=doc_type or 'unknown') as span:
+            markdown = await self._convert(url, doc_type, download)
+            if markdown is None:
+                span.fail()
+            return markdown
+
+    async def _convert(self, url: str, doc_type: Optional[str], download: SpooledDownload) -> Optional[str]:
+        """Dispatch to the converter for the document type."""
         try:
-            if url_lower.endswith('.pdf'):
-                return await self.convert_pdf_to_markdown(content)
-            elif url_lower.endswith(('.doc', '.docx')):
-                return await self.convert_word_to_markdown(content)
-            elif url_lower.endswith(('.xls', '.xlsx')):
-                return await self.convert_excel_to_markdown(content)
-            elif url_lower.endswith('.csv'):
-                return await self.convert_csv_to_markdown(content)
+            if doc_type == 'pdf':
+                return await self.convert_pdf_to_markdown(download.path)
+            elif doc_type == 'docx':
+                return await self.convert_word_to_markdown(download.path)
+            elif doc_type in ('xls', 'xlsx'):
+                return await self.convert_excel_to_markdown(download.path)
+            elif doc_type == 'csv':
+                return await self.convert_csv_to_markdown(download.path)
             else:
                 print(f"Unsupported file type: {url}")
                 return None
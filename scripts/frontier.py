@@ -0,0 +1,320 @@
+"""
+Crawl frontier: which URLs to visit next, and which have been seen.
+
+The frontier is a priority queue of (depth, URL) entries drained by a pool
+of concurrent page workers, shallowest pages first. URLs are filtered by
+domain scope and deduplicated on their canonical form with a Bloom filter,
+so the seen-set stays a few bytes per URL even on crawls of millions of
+pages. The URL itself is queued as found, less its fragment: canonical
+forms are only for comparing, and some servers care about the spelling.
+
+Every visit counts towards ``max_pages``, failed ones included, so a site
+full of broken links cannot keep the crawl going forever.
+
+A worker is any coroutine ``visit(url, depth)`` that processes one page and
+returns the URLs it links to (or None if the page failed):
+
+    frontier = CrawlFrontier(ScopeFilter(seed), max_depth=3)
+    await frontier.run(visit, concurrency=8, seeds=[seed])
+
+With a ``checkpoint``, every URL queued, taken and finished is reported to
+it, and ``restore`` reloads the frontier of an interrupted crawl.
+"""
+
+import asyncio
+import hashlib
+import heapq
+import math
+import posixpath
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urldefrag, urlencode, urlsplit, urlunsplit
+
+from .tracing import current_tracer
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid', '_ga')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize_url(url: str) -> Optional[str]:
+    """Normalize a URL so equivalent spellings map to one string.
+
+    Lowercases scheme and host, drops default ports, fragments and tracking
+    parameters, resolves dot segments and sorts the query. Returns None for
+    anything that is not an http(s) URL.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.hostname:
+            return None
+
+        host = parts.hostname.lower().rstrip('.')
+        if parts.port and parts.port != DEFAULT_PORTS[scheme]:
+            host = f"{host}:{parts.port}"
+    except ValueError:
+        return None
+
+    path = parts.path or '/'
+    if '.' in path:
+        trailing = path.endswith('/')
+        path = posixpath.normpath(path)
+        if trailing and path != '/':
+            path += '/'
+
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    ]
+    query.sort()
+
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def _hash_pair(key: str) -> Tuple[int, int]:
+    """Two independent 64-bit hashes of a key, for double hashing."""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class BloomFilter:
+    """Fixed-capacity Bloom filter over strings."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        bits = math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.num_bits = max(8, bits)
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, hashes: Tuple[int, int]) -> List[int]:
+        h1, h2 = hashes
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def contains_hashes(self, hashes: Tuple[int, int]) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(hashes))
+
+    def add_hashes(self, hashes: Tuple[int, int]) -> bool:
+        """Set the bits for a pre-hashed key; returns False if all were already set."""
+        bits = self.bits
+        added = False
+        for p in self._positions(hashes):
+            mask = 1 << (p & 7)
+            if not bits[p >> 3] & mask:
+                bits[p >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, key: str) -> bool:
+        return self.contains_hashes(_hash_pair(key))
+
+    def add(self, key: str) -> bool:
+        """Add a key; returns False if it was (probably) already present."""
+        return self.add_hashes(_hash_pair(key))
+
+
+class SeenSet:
+    """Scalable Bloom filter: grows by adding larger filters as it fills.
+
+    Each new filter doubles the capacity and halves the error rate, so the
+    overall false-positive rate stays below the configured one.
+    """
+
+    def __init__(self, initial_capacity: int = 1_000_000, error_rate: float = 0.001):
+        self.error_rate = error_rate
+        self._filters = [BloomFilter(initial_capacity, error_rate / 2)]
+
+    def __contains__(self, key: str) -> bool:
+        hashes = _hash_pair(key)
+        return any(f.contains_hashes(hashes) for f in self._filters)
+
+    def __len__(self) -> int:
+        return sum(f.count for f in self._filters)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(len(f.bits) for f in self._filters)
+
+    def add(self, key: str) -> bool:
+        """Add a key; returns False if it was (probably) already present."""
+        hashes = _hash_pair(key)
+        if any(f.contains_hashes(hashes) for f in self._filters):
+            return False
+        current = self._filters[-1]
+        if current.count >= current.capacity:
+            current = BloomFilter(current.capacity * 2, current.error_rate / 2)
+            self._filters.append(current)
+        current.add_hashes(hashes)
+        return True
+
+
+class ScopeFilter:
+    """Decide whether a URL is inside the crawl's domain scope."""
+
+    def __init__(self, seed_url: str, stay_on_domain: bool = True, follow_subdomains: bool = False):
+        host = urlsplit(seed_url).hostname or ''
+        self.domain = host.lower()[4:] if host.lower().startswith('www.') else host.lower()
+        self.stay_on_domain = stay_on_domain
+        self.follow_subdomains = follow_subdomains
+
+    @classmethod
+    def from_config(cls, seed_url: str, crawl_config) -> 'ScopeFilter':
+        return cls(seed_url, crawl_config.stay_on_domain, crawl_config.follow_subdomains)
+
+    def allows(self, url: str) -> bool:
+        if not self.stay_on_domain:
+            return True
+        host = (urlsplit(url).hostname or '').lower()
+        if host == self.domain or host == f"www.{self.domain}":
+            return True
+        return self.follow_subdomains and host.endswith(f".{self.domain}")
+
+
+@dataclass
+class FrontierStats:
+    queued: int = 0
+    visited: int = 0
+    failed: int = 0
+    duplicates: int = 0
+    out_of_scope: int = 0
+    too_deep: int = 0
+
+
+class CrawlFrontier:
+    """Priority queue of URLs to crawl, drained by concurrent workers."""
+
+    def __init__(
+        self,
+        scope: Optional[ScopeFilter] = None,
+        max_depth: int = 3,
+        max_pages: int = 0,
+        seen: Optional[SeenSet] = None,
+        checkpoint=None
+    ):
+        self.scope = scope
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.seen = seen if seen is not None else SeenSet()
+        self.checkpoint = checkpoint  # a CrawlCheckpoint, if the crawl is checkpointed
+        self.stats = FrontierStats()
+        self.visited_before = 0  # pages visited (or failed) before a restore, counted against max_pages
+        self._heap: List[Tuple[int, int, str]] = []
+        self._seq = 0  # keeps FIFO order within a depth
+        self._in_flight = 0
+        self._changed: Optional[asyncio.Condition] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def add(self, url: str, depth: int = 0) -> bool:
+        """Queue a URL at a depth. Returns True if it was new and in scope."""
+        if depth > self.max_depth:
+            self.stats.too_deep += 1
+            return False
+        canonical = canonicalize_url(url)
+        if canonical is None or (self.scope is not None and not self.scope.allows(canonical)):
+            self.stats.out_of_scope += 1
+            return False
+        if not self.seen.add(canonical):
+            self.stats.duplicates += 1
+            return False
+
+        url = urldefrag(url.strip())[0]
+        heapq.heappush(self._heap, (depth, self._seq, url))
+        self._seq += 1
+        self.stats.queued += 1
+        if self.checkpoint is not None:
+            self.checkpoint.queued('page', url, depth)
+        tracer = current_tracer()
+        if tracer is not None:
+            tracer.queued(url)
+        return True
+
+    def restore(self, seen: Iterable[str], queued: Iterable[Tuple[str, int]], visited: int = 0):
+        """Reload a checkpointed frontier: mark its URLs seen and queue the unfinished ones."""
+        for url in seen:
+            self.seen.add(canonicalize_url(url) or url)
+        for url, depth in queued:
+            heapq.heappush(self._heap, (depth, self._seq, url))
+            self._seq += 1
+            self.stats.queued += 1
+        self.visited_before = visited
+
+    def pop(self) -> Optional[Tuple[str, int]]:
+        """Take the shallowest queued URL, or None if the queue is empty."""
+        if not self._heap:
+            return None
+        depth, _, url = heapq.heappop(self._heap)
+        return url, depth
+
+    def _page_budget_left(self) -> bool:
+        visited = self.visited_before + self.stats.visited + self.stats.failed
+        return not self.max_pages or visited + self._in_flight < self.max_pages
+
+    async def _worker(self, visit: Callable[[str, int], Awaitable[Optional[Iterable[str]]]]):
+        tracer = current_tracer()
+        while True:
+            async with self._changed:
+                # Wait for work, or finish once the queue is empty and nothing
+                # in flight can add more
+                while not (self._heap and self._page_budget_left()):
+                    if self._in_flight == 0 or not self._page_budget_left():
+                        self._changed.notify_all()
+                        return
+                    await self._changed.wait()
+                url, depth = self.pop()
+                self._in_flight += 1
+                if self.checkpoint is not None:
+                    self.checkpoint.leased('page', url, depth)
+
+            if tracer is not None:
+                tracer.dequeued(url, 'frontier')
+            started = time.perf_counter()
+            links = None
+            try:
+                links = await visit(url, depth)
+            except Exception as e:
+                print(f"Error visiting {url}: {str(e)}")
+            if tracer is not None:
+                tracer.record('visit', 'frontier', started, time.perf_counter(), url, {'depth': depth})
+                tracer.finished(url, 'page', links is not None)
+
+            async with self._changed:
+                self._in_flight -= 1
+                if links is None:
+                    self.stats.failed += 1
+                else:
+                    self.stats.visited += 1
+                    if depth < self.max_depth:
+                        for link in links:
+                            self.add(link, depth + 1)
+                if self.checkpoint is not None:
+                    self.checkpoint.done('page', url, links is not None, depth)
+                self._changed.notify_all()
+
+    async def run(
+        self,
+        visit: Callable[[str, int], Awaitable[Optional[Iterable[str]]]],
+        concurrency: int = 4,
+        seeds: Iterable[str] = ()
+    ) -> FrontierStats:
+        """Visit queued URLs with up to ``concurrency`` workers until the frontier is drained."""
+        for seed in seeds:
+            self.add(seed)
+        self._changed = asyncio.Condition()
+        await asyncio.gather(*(
+            asyncio.create_task(self._worker(visit), name=f"page-worker-{n}")
+            for n in range(max(1, concurrency))
+        ))
+        return self.stats
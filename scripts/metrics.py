@@ -0,0 +1,143 @@
+"""
+Prometheus metrics for the crawl pipeline.
+
+Each unit of work is wrapped in ``track(stage, url)``:
+
+    with track('download', url) as span:
+        ...
+        span.add_bytes(len(chunk))
+        if response.status != 200:
+            span.fail()
+
+which records, per stage:
+
+- ``crawl_stage_seconds`` latency histogram
+- ``crawl_stage_in_flight`` gauge
+- ``crawl_stage_bytes_total`` byte counter
+- ``crawl_stage_errors_total`` error counter, also labelled by host
+
+Conversions are additionally timed per document type in
+``crawl_conversion_seconds``, and documents dropped before download (wrong
+type, too large) are counted with the bytes that were never transferred. Metric children are cached per label set, so
+a tracked stage costs a few lock-protected additions. The backend exposes
+the default registry on ``/metrics``. When the crawl is traced, each
+tracked unit is also recorded as a span (see ``tracing``).
+"""
+
+import time
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .tracing import current_tracer
+
+STAGES = ('fetch', 'render', 'extract', 'probe', 'download', 'convert', 'upload', 'db_write')
+
+# Up to 5 minutes, for slow renders and large conversions
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Errors are labelled by host; beyond this many hosts they count as 'other'
+MAX_HOSTS = 500
+
+STAGE_SECONDS = Histogram(
+    'crawl_stage_seconds', 'Time spent in each crawl stage', ['stage'], buckets=LATENCY_BUCKETS
+)
+CONVERSION_SECONDS = Histogram(
+    'crawl_conversion_seconds', 'Document conversion time by document type', ['doc_type'],
+    buckets=LATENCY_BUCKETS
+)
+STAGE_IN_FLIGHT = Gauge('crawl_stage_in_flight', 'Work currently in each crawl stage', ['stage'])
+STAGE_BYTES = Counter('crawl_stage_bytes_total', 'Bytes fetched, downloaded or written per stage', ['stage'])
+STAGE_ERRORS = Counter('crawl_stage_errors_total', 'Failures per crawl stage and host', ['stage', 'host'])
+DOCUMENTS_SKIPPED = Counter(
+    'crawl_documents_skipped_total', 'Documents dropped before their body was downloaded', ['reason']
+)
+BYTES_AVOIDED = Counter(
+    'crawl_bytes_avoided_total', 'Bytes of dropped documents that were never downloaded', ['reason']
+)
+
+_children: Dict[str, Tuple] = {}
+_hosts: Set[str] = set()
+
+
+def _stage(stage: str) -> Tuple:
+    children = _children.get(stage)
+    if children is None:
+        children = _children[stage] = (
+            STAGE_SECONDS.labels(stage),
+            STAGE_IN_FLIGHT.labels(stage),
+            STAGE_BYTES.labels(stage),
+        )
+    return children
+
+
+def host_label(url: Optional[str]) -> str:
+    """The host of a URL as a metric label, bounded to ``MAX_HOSTS`` distinct values."""
+    if not url:
+        return ''
+    host = urlparse(url).netloc.lower()
+    if host in _hosts:
+        return host
+    if len(_hosts) >= MAX_HOSTS:
+        return 'other'
+    _hosts.add(host)
+    return host
+
+
+# Export every stage from the start, even before its first use
+for _name in STAGES:
+    _stage(_name)
+
+
+def record_skip(reason: str, bytes_avoided: int = 0):
+    """Count a document dropped before download and the bytes not transferred."""
+    DOCUMENTS_SKIPPED.labels(reason).inc()
+    if bytes_avoided:
+        BYTES_AVOIDED.labels(reason).inc(bytes_avoided)
+
+
+class track:
+    """Time one unit of work in a stage; a context manager."""
+
+    __slots__ = ('stage', 'url', 'doc_type', 'started', 'failed', 'bytes', '_children')
+
+    def __init__(self, stage: str, url: Optional[str] = None, doc_type: Optional[str] = None):
+        self.stage = stage
+        self.url = url
+        self.doc_type = doc_type
+        self.failed = False
+        self.bytes = 0
+        self._children = _stage(stage)
+
+    def __enter__(self) -> 'track':
+        self._children[1].inc()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        elapsed = ended - self.started
+        seconds, in_flight, byte_counter = self._children
+        in_flight.dec()
+        seconds.observe(elapsed)
+        if self.doc_type is not None:
+            CONVERSION_SECONDS.labels(self.doc_type).observe(elapsed)
+        if self.bytes:
+            byte_counter.inc(self.bytes)
+        if exc_type is not None or self.failed:
+            STAGE_ERRORS.labels(self.stage, host_label(self.url)).inc()
+        tracer = current_tracer()
+        if tracer is not None:
+            args = {'bytes': self.bytes, 'failed': exc_type is not None or self.failed}
+            if self.doc_type is not None:
+                args['doc_type'] = self.doc_type
+            tracer.record(self.stage, 'stage', self.started, ended, self.url, args)
+        return False
+
+    def fail(self):
+        """Count this unit as an error without raising."""
+        self.failed = True
+
+    def add_bytes(self, count: int):
+        self.bytes += count
@@ -0,0 +1,209 @@
+"""
+Pipelined executor with bounded concurrency per stage.
+
+Each stage is an async callable that takes an item and returns the item to
+hand to the next stage, None to drop it, or ``SKIP`` when there is
+deliberately nothing (more) to do for it. Stages are connected by bounded
+queues so a slow stage applies backpressure to the ones in front of it.
+
+Input may be a plain or an async iterable. If iterating it raises, the items
+already taken still finish before ``run`` raises the error. An optional
+``on_complete`` callback is awaited once per input item with the original item
+and whether it made it through every stage (or was skipped), e.g. to
+acknowledge work-queue leases.
+
+When the run is traced, URL items get their queue waits, stages and whole
+lifetime (named after the pipeline) recorded on their own trace track.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, List, Optional, Union
+
+from .tracing import current_tracer
+
+# Marks the end of the input for a single stage worker
+_DONE = object()
+
+# Returned by a stage to finish an item on purpose, without the later stages
+SKIP = object()
+
+
+@dataclass
+class StageStats:
+    """Throughput counters for a single pipeline stage."""
+    name: str
+    concurrency: int
+    completed: int = 0
+    dropped: int = 0
+    failed: int = 0
+    skipped: int = 0
+    busy_seconds: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def wall_seconds(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Items completed per second of stage wall time."""
+        wall = self.wall_seconds
+        return self.completed / wall if wall > 0 else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """Fraction of the available worker time spent doing work."""
+        capacity = self.wall_seconds * self.concurrency
+        return self.busy_seconds / capacity if capacity > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.name:<10} workers={self.concurrency:<3} ok={self.completed:<5} "
+            f"dropped={self.dropped:<4} failed={self.failed:<4} skipped={self.skipped:<4} "
+            f"wall={self.wall_seconds:7.2f}s rate={self.throughput:7.2f}/s "
+            f"util={self.utilization:5.0%}"
+        )
+
+
+@dataclass
+class Stage:
+    """A named pipeline step and the number of workers that run it."""
+    name: str
+    func: Callable[[Any], Awaitable[Any]]
+    concurrency: int = 1
+
+
+class Pipeline:
+    """Run items through a sequence of stages with per-stage concurrency limits."""
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        queue_factor: int = 2,
+        on_complete: Optional[Callable[[Any, bool], Awaitable[Any]]] = None,
+        name: str = 'item'
+    ):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        self.name = name
+        self.on_complete = on_complete
+        self.stats = [StageStats(s.name, max(1, s.concurrency)) for s in stages]
+        # Queue i feeds stage i; sized relative to the stage width
+        self._queues = [
+            asyncio.Queue(maxsize=max(1, s.concurrency) * queue_factor)
+            for s in stages
+        ]
+
+    async def _worker(self, index: int):
+        stage = self.stages[index]
+        stats = self.stats[index]
+        inbox = self._queues[index]
+        outbox = self._queues[index + 1] if index + 1 < len(self._queues) else None
+        tracer = current_tracer()
+
+        while True:
+            entry = await inbox.get()
+            if entry is _DONE:
+                return
+            # Entries carry the original input alongside the current value
+            origin, item = entry
+            traced = tracer is not None and isinstance(origin, str)
+            if traced:
+                tracer.dequeued(origin, stage.name)
+
+            if stats.started_at is None:
+                stats.started_at = time.perf_counter()
+            started = time.perf_counter()
+            try:
+                result = await stage.func(item)
+            except Exception as e:
+                print(f"Error in {stage.name} stage: {str(e)}")
+                stats.failed += 1
+                result = None
+            else:
+                if result is None:
+                    stats.dropped += 1
+                elif result is SKIP:
+                    stats.skipped += 1
+                else:
+                    stats.completed += 1
+            finally:
+                stats.finished_at = time.perf_counter()
+                stats.busy_seconds += stats.finished_at - started
+                if traced:
+                    tracer.record(f"{stage.name} stage", 'pipeline', started, stats.finished_at, origin)
+
+            if result is not None and result is not SKIP and outbox is not None:
+                if traced:
+                    tracer.queued(origin)
+                await outbox.put((origin, result))
+                continue
+            if traced:
+                tracer.finished(origin, self.name, result is not None)
+            if self.on_complete is not None:
+                await self._complete(origin, result is not None)
+
+    async def _complete(self, origin: Any, ok: bool):
+        try:
+            await self.on_complete(origin, ok)
+        except Exception as e:
+            print(f"Error in pipeline completion callback: {str(e)}")
+
+    async def _run_stage(self, index: int):
+        width = self.stats[index].concurrency
+        name = self.stages[index].name
+        await asyncio.gather(*(
+            asyncio.create_task(self._worker(index), name=f"{name}-worker-{n}")
+            for n in range(width)
+        ))
+        # Every worker of this stage is done; release the next stage
+        if index + 1 < len(self.stages):
+            for _ in range(self.stats[index + 1].concurrency):
+                await self._queues[index + 1].put(_DONE)
+
+    async def _put(self, item: Any, tracer):
+        if tracer is not None and isinstance(item, str):
+            tracer.queued(item)
+        await self._queues[0].put((item, item))
+
+    async def _feed(self, items: Union[Iterable[Any], AsyncIterable[Any]]):
+        tracer = current_tracer()
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                await self._put(item, tracer)
+        else:
+            for item in items:
+                await self._put(item, tracer)
+
+    async def _end_input(self):
+        for _ in range(self.stats[0].concurrency):
+            await self._queues[0].put(_DONE)
+
+    async def run(self, items: Union[Iterable[Any], AsyncIterable[Any]]) -> List[StageStats]:
+        """Push all items through the pipeline and return per-stage stats."""
+        stages = asyncio.gather(*(self._run_stage(i) for i in range(len(self.stages))))
+        try:
+            await self._feed(items)
+        except asyncio.CancelledError:
+            stages.cancel()
+            raise
+        except Exception:
+            # Finish what was fed, then report the broken input
+            await self._end_input()
+            await stages
+            raise
+        await self._end_input()
+        await stages
+        return self.stats
+
+    def report(self):
+        """Print a per-stage throughput summary."""
+        print("Pipeline summary:")
+        for stats in self.stats:
+            print(f"  {stats.summary()}")
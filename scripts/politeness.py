@@ -0,0 +1,248 @@
+"""
+Per-host politeness: a request rate and an adaptive concurrency cap per host.
+
+Every request to a site (static fetches, browser renders and document
+downloads) takes a slot from the ``PolitenessScheduler`` first:
+
+    async with scheduler.slot(url) as slot:
+        async with session.get(url) as response:
+            slot.record(response.status, response.headers.get('Retry-After'))
+            ...
+
+A slot needs a token from the host's bucket (refilled at the host's current
+rate, up to a small burst) and room under the host's concurrency cap. The cap
+and rate follow AIMD: each fast, successful response raises the cap by
+``1 / cap`` (about one more request in flight per round of responses), while
+a 429, 503 or timeout halves both, at most once per cooldown so a burst of
+throttled responses counts as one signal. ``Retry-After`` pauses the host.
+
+Hosts are independent, so a slow or throttling host never holds back the
+others and overall throughput stays high on crawls spanning many hosts.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import urlparse
+
+# Statuses that mean the host wants us to slow down
+THROTTLE_STATUSES = {429, 503}
+
+
+@dataclass
+class PolitenessConfig:
+    """Per-host limits and how quickly they adapt."""
+    rate: float = 4.0  # requests per second per host, at most
+    burst: int = 8  # requests a host can take at once after being idle
+    initial_concurrency: float = 2.0
+    max_concurrency: int = 8
+    min_concurrency: int = 1
+    min_rate: float = 0.1
+    decrease: float = 0.5  # multiplier on 429/503/timeout
+    target_latency: float = 2.0  # seconds; slower responses stop the cap growing
+    cooldown: float = 2.0  # seconds between two decreases on one host
+    max_retry_after: float = 300.0  # longest pause honoured from Retry-After
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class HostState:
+    """Token bucket, concurrency cap and counters for one host."""
+
+    def __init__(self, cfg: PolitenessConfig):
+        self.rate = cfg.rate
+        self.tokens = float(cfg.burst)
+        self.concurrency = min(cfg.initial_concurrency, float(cfg.max_concurrency))
+        self.in_flight = 0
+        self.waiting = 0
+        self.blocked_until = 0.0
+        self.last_refill = time.monotonic()
+        self.last_decrease = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.latency = 0.0  # exponentially weighted, seconds
+        self.condition = asyncio.Condition()
+
+    @property
+    def cap(self) -> int:
+        return max(1, int(self.concurrency))
+
+    def refill(self, now: float, burst: int):
+        self.tokens = min(float(burst), self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def snapshot(self) -> dict:
+        return {
+            'rate': round(self.rate, 2),
+            'concurrency': self.cap,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'timeouts': self.timeouts,
+            'latency_ms': round(self.latency * 1000),
+            'paused_for': round(max(0.0, self.blocked_until - time.monotonic()), 1),
+        }
+
+
+class HostSlot:
+    """One request's permission to hit a host; ``record`` its response status."""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.started = time.monotonic()
+        self.status: Optional[int] = None
+        self.retry_after: Optional[str] = None
+        self.latency: Optional[float] = None
+
+    def record(self, status: int, retry_after: Optional[str] = None, timed: bool = True):
+        """Note the response status (and ``Retry-After``) once headers arrive.
+
+        Pass ``timed=False`` when the time taken says little about the server,
+        as for browser renders: the status still adjusts the host's limits,
+        but its latency is left out.
+        """
+        self.status = status
+        self.retry_after = retry_after
+        self.latency = time.monotonic() - self.started if timed else None
+
+
+class PolitenessScheduler:
+    """Rate-limit and adaptively cap concurrent requests per host."""
+
+    def __init__(self, config: Optional[PolitenessConfig] = None):
+        self.config = config or PolitenessConfig()
+        self.hosts: Dict[str, HostState] = {}
+
+    def _host(self, host: str) -> HostState:
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.config)
+        return state
+
+    async def _acquire(self, state: HostState):
+        cfg = self.config
+        async with state.condition:
+            state.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    state.refill(now, cfg.burst)
+                    if state.in_flight >= state.cap:
+                        timeout = None  # woken when a request finishes
+                    elif now < state.blocked_until:
+                        timeout = state.blocked_until - now
+                    elif state.tokens < 1:
+                        timeout = (1 - state.tokens) / state.rate
+                    else:
+                        state.tokens -= 1
+                        state.in_flight += 1
+                        return
+                    try:
+                        await asyncio.wait_for(state.condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                state.waiting -= 1
+
+    def _decrease(self, state: HostState, now: float):
+        cfg = self.config
+        if now - state.last_decrease < cfg.cooldown:
+            return
+        state.last_decrease = now
+        state.concurrency = max(float(cfg.min_concurrency), state.concurrency * cfg.decrease)
+        state.rate = max(cfg.min_rate, state.rate * cfg.decrease)
+
+    def _increase(self, state: HostState):
+        cfg = self.config
+        state.concurrency = min(float(cfg.max_concurrency), state.concurrency + 1 / state.concurrency)
+        # Win back the request rate in about ten healthy responses
+        state.rate = min(cfg.rate, state.rate + cfg.rate / 10)
+
+    def _finish(self, state: HostState, slot: HostSlot, timed_out: bool):
+        cfg = self.config
+        now = time.monotonic()
+        state.requests += 1
+        if timed_out:
+            state.timeouts += 1
+            self._decrease(state, now)
+            return
+        if slot.status is None:
+            return  # failed before a response; no signal either way
+        if slot.latency is not None:
+            state.latency = slot.latency if state.latency == 0 else 0.8 * state.latency + 0.2 * slot.latency
+        if slot.status in THROTTLE_STATUSES:
+            state.throttled += 1
+            self._decrease(state, now)
+            pause = parse_retry_after(slot.retry_after)
+            if pause:
+                state.blocked_until = max(state.blocked_until, now + min(pause, cfg.max_retry_after))
+        elif slot.status < 500 and (slot.latency is None or slot.latency <= cfg.target_latency):
+            self._increase(state)
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[HostSlot]:
+        """Wait until the URL's host may take another request, then hold a slot for it."""
+        host = urlparse(url).netloc.lower()
+        state = self._host(host)
+        await self._acquire(state)
+        slot = HostSlot(host)
+        timed_out = False
+        try:
+            yield slot
+        except asyncio.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            state.in_flight -= 1
+            self._finish(state, slot, timed_out)
+            async with state.condition:
+                state.condition.notify_all()
+
+    def snapshot(self, limit: int = 50) -> Dict[str, dict]:
+        """Current rate, cap and counters of the busiest hosts."""
+        busiest: List[str] = sorted(self.hosts, key=lambda h: self.hosts[h].requests, reverse=True)
+        return {host: self.hosts[host].snapshot() for host in busiest[:limit]}
+
+    def summary(self) -> str:
+        throttled = sum(s.throttled for s in self.hosts.values())
+        timeouts = sum(s.timeouts for s in self.hosts.values())
+        return f"{len(self.hosts)} hosts, {throttled} throttled responses, {timeouts} timeouts"
+
+
+def host_slot(scheduler: Optional[PolitenessScheduler], url: str):
+    """``scheduler.slot(url)``, or a slot that never waits when there is no scheduler."""
+    if scheduler is None:
+        return nullcontext(HostSlot(urlparse(url).netloc.lower()))
+    return scheduler.slot(url)
+
+
+def create_scheduler(crawl_config) -> Optional[PolitenessScheduler]:
+    """The scheduler configured for a crawl, or None if politeness is disabled."""
+    if not crawl_config.politeness:
+        return None
+    return PolitenessScheduler(PolitenessConfig(
+        rate=crawl_config.host_rate,
+        burst=crawl_config.host_burst,
+        max_concurrency=crawl_config.host_max_concurrency,
+        target_latency=crawl_config.host_target_latency
+    ))
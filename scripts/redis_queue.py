@@ -0,0 +1,337 @@
+"""
+Redis-backed work queues for crawls shared by several worker processes.
+
+Every worker that points at the same Redis and crawl id drains the same
+queues, on any host. Items are claimed under a lease: a claimed item moves to
+a lease set with a deadline, and goes back on the queue if it is not
+acknowledged in time, so the work of a crashed worker is picked up by the
+others. Live workers extend their leases with a heartbeat.
+
+Each claim gets a token of its own. Acks and heartbeats only touch a lease
+whose token still matches, so a worker that lost its lease (and maybe saw
+the item claimed by another) cannot finish or extend the new lease.
+
+Keys for one crawl share a ``{crawl_id}`` hash tag so they live on a single
+Redis Cluster slot:
+
+    crawl:{id}:<queue>:pending   ZSET  item -> priority score
+    crawl:{id}:<queue>:leases    ZSET  item -> lease deadline (ms)
+    crawl:{id}:<queue>:scores    HASH  item -> priority score, while leased
+    crawl:{id}:<queue>:tokens    HASH  item -> token of its current lease
+    crawl:{id}:<queue>:token     STRING last token handed out
+    crawl:{id}:<queue>:seen      SET   16-byte digests of every item queued
+    crawl:{id}:stats             HASH  per-crawl counters
+
+Pass any ``redis.asyncio`` client, or ``fakeredis.aioredis.FakeRedis()`` for
+local testing (the scripts need fakeredis' Lua support, ``fakeredis[lua]``).
+"""
+
+import asyncio
+import hashlib
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urldefrag
+
+from .frontier import FrontierStats, ScopeFilter, canonicalize_url
+from .tracing import current_tracer
+
+# Scores order items by priority, then by insertion within a priority
+PRIORITY_SCALE = 10 ** 12
+
+# KEYS: seen, pending, stats, seq   ARGV: digest, item, priority, counter prefix
+_PUT = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    redis.call('HINCRBY', KEYS[3], ARGV[4] .. 'duplicates', 1)
+    return 0
+end
+local seq = redis.call('INCR', KEYS[4])
+redis.call('ZADD', KEYS[2], tonumber(ARGV[3]) * %d + seq, ARGV[2])
+redis.call('HINCRBY', KEYS[3], ARGV[4] .. 'queued', 1)
+return 1
+""" % PRIORITY_SCALE
+
+# KEYS: pending, leases, scores, stats, tokens, token   ARGV: now ms, lease deadline ms, counter prefix
+_CLAIM = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, item in ipairs(expired) do
+    local score = redis.call('HGET', KEYS[3], item) or 0
+    redis.call('ZREM', KEYS[2], item)
+    redis.call('HDEL', KEYS[3], item)
+    redis.call('HDEL', KEYS[5], item)
+    redis.call('ZADD', KEYS[1], score, item)
+    redis.call('HINCRBY', KEYS[4], ARGV[3] .. 'requeued', 1)
+end
+local popped = redis.call('ZPOPMIN', KEYS[1])
+if #popped == 0 then
+    return nil
+end
+local token = redis.call('INCR', KEYS[6])
+redis.call('ZADD', KEYS[2], ARGV[2], popped[1])
+redis.call('HSET', KEYS[3], popped[1], popped[2])
+redis.call('HSET', KEYS[5], popped[1], token)
+return {popped[1], popped[2], tostring(token)}
+"""
+
+# KEYS: leases, scores, stats, tokens   ARGV: item, lease token, outcome counter
+_ACK = """
+if redis.call('HGET', KEYS[4], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+redis.call('HINCRBY', KEYS[3], ARGV[3], 1)
+return 1
+"""
+
+# KEYS: leases, tokens   ARGV: lease deadline ms, then item, lease token pairs
+_EXTEND = """
+local extended = 0
+for i = 2, #ARGV, 2 do
+    if redis.call('HGET', KEYS[2], ARGV[i]) == ARGV[i + 1] then
+        redis.call('ZADD', KEYS[1], 'XX', ARGV[1], ARGV[i])
+        extended = extended + 1
+    end
+end
+return extended
+"""
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class RedisWorkQueue:
+    """A leased, deduplicated priority queue shared through Redis."""
+
+    def __init__(
+        self,
+        redis,
+        crawl_id: str,
+        name: str,
+        visibility_timeout: float = 600.0,
+        poll_interval: float = 1.0
+    ):
+        self.redis = redis
+        self.name = name
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        base = f"crawl:{{{crawl_id}}}"
+        self.stats_key = f"{base}:stats"
+        self.pending_key = f"{base}:{name}:pending"
+        self.leases_key = f"{base}:{name}:leases"
+        self.scores_key = f"{base}:{name}:scores"
+        self.tokens_key = f"{base}:{name}:tokens"
+        self.token_key = f"{base}:{name}:token"
+        self.seen_key = f"{base}:{name}:seen"
+        self.seq_key = f"{base}:{name}:seq"
+        self._put = redis.register_script(_PUT)
+        self._claim = redis.register_script(_CLAIM)
+        self._ack = redis.register_script(_ACK)
+        self._extend = redis.register_script(_EXTEND)
+        self._held: Dict[str, str] = {}  # item -> token of the lease this worker holds
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> 'RedisWorkQueue':
+        self.start_heartbeat()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop_heartbeat()
+
+    async def put(self, item: str, priority: int = 0, dedup_key: Optional[str] = None) -> bool:
+        """Queue an item unless it (or its ``dedup_key``) was queued before. Returns True if new."""
+        digest = hashlib.blake2b((dedup_key or item).encode('utf-8'), digest_size=16).digest()
+        added = await self._put(
+            keys=[self.seen_key, self.pending_key, self.stats_key, self.seq_key],
+            args=[digest, item, priority, f"{self.name}:"]
+        )
+        return bool(added)
+
+    async def claim(self) -> Optional[Tuple[str, int]]:
+        """Lease the highest-priority item; returns (item, priority) or None if none is pending.
+
+        Expired leases are returned to the queue as part of the claim.
+        """
+        now = _now_ms()
+        deadline = now + int(self.visibility_timeout * 1000)
+        popped = await self._claim(
+            keys=[
+                self.pending_key, self.leases_key, self.scores_key, self.stats_key,
+                self.tokens_key, self.token_key
+            ],
+            args=[now, deadline, f"{self.name}:"]
+        )
+        if not popped:
+            return None
+        item, score, token = (
+            value.decode('utf-8') if isinstance(value, bytes) else value for value in popped
+        )
+        self._held[item] = token
+        return item, int(float(score)) // PRIORITY_SCALE
+
+    async def ack(self, item: str, ok: bool = True) -> bool:
+        """Finish a leased item. Returns False if this worker's lease on it had expired."""
+        token = self._held.pop(item, None)
+        if token is None:
+            return False
+        outcome = f"{self.name}:{'done' if ok else 'failed'}"
+        acked = await self._ack(
+            keys=[self.leases_key, self.scores_key, self.stats_key, self.tokens_key],
+            args=[item, token, outcome]
+        )
+        return bool(acked)
+
+    async def extend(self, leases: Dict[str, str]):
+        """Push back the deadline of leases (item -> token) this worker still holds."""
+        if not leases:
+            return
+        deadline = _now_ms() + int(self.visibility_timeout * 1000)
+        args = [deadline]
+        for item, token in leases.items():
+            args += [item, token]
+        # Leases that expired, and may be someone else's now, are left alone
+        await self._extend(keys=[self.leases_key, self.tokens_key], args=args)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                await self.extend(dict(self._held))
+            except Exception as e:
+                print(f"Error extending {self.name} leases: {str(e)}")
+
+    def start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop_heartbeat(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+
+    async def pending(self) -> int:
+        return await self.redis.zcard(self.pending_key)
+
+    async def leased(self) -> int:
+        return await self.redis.zcard(self.leases_key)
+
+    async def is_drained(self) -> bool:
+        """True when nothing is queued and no worker holds a lease."""
+        return await self.pending() == 0 and await self.leased() == 0
+
+    async def counters(self) -> Dict[str, int]:
+        """Per-crawl counters, e.g. ``pages:queued`` or ``documents:done``."""
+        raw = await self.redis.hgetall(self.stats_key)
+        return {
+            (k.decode('utf-8') if isinstance(k, bytes) else k): int(v)
+            for k, v in raw.items()
+        }
+
+    async def items(self) -> AsyncIterator[str]:
+        """Claim items until the queue is drained across all workers.
+
+        While other workers still hold leases the queue is polled, since a
+        lease may expire and come back, or its worker may queue more items.
+        Each yielded item must be passed to ``ack``.
+        """
+        while True:
+            claimed = await self.claim()
+            if claimed is not None:
+                yield claimed[0]
+                continue
+            if await self.is_drained():
+                return
+            await asyncio.sleep(self.poll_interval)
+
+
+class RedisFrontier:
+    """Crawl frontier shared by every worker of a distributed crawl.
+
+    Same contract as ``CrawlFrontier``: ``run(visit, concurrency, seeds)``
+    visits URLs, shallowest first, and queues the links ``visit`` returns.
+    """
+
+    def __init__(
+        self,
+        redis,
+        crawl_id: str,
+        scope: Optional[ScopeFilter] = None,
+        max_depth: int = 3,
+        max_pages: int = 0,
+        visibility_timeout: float = 600.0
+    ):
+        self.queue = RedisWorkQueue(redis, crawl_id, 'pages', visibility_timeout)
+        self.scope = scope
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        # Scope and depth rejections are counted locally; the rest come from Redis
+        self.stats = FrontierStats()
+
+    async def add(self, url: str, depth: int = 0) -> bool:
+        """Queue a URL at a depth. Returns True if it was new and in scope."""
+        if depth > self.max_depth:
+            self.stats.too_deep += 1
+            return False
+        canonical = canonicalize_url(url)
+        if canonical is None or (self.scope is not None and not self.scope.allows(canonical)):
+            self.stats.out_of_scope += 1
+            return False
+        return await self.queue.put(urldefrag(url.strip())[0], depth, dedup_key=canonical)
+
+    async def _page_budget_left(self) -> bool:
+        if not self.max_pages:
+            return True
+        counters = await self.queue.counters()
+        return counters.get('pages:done', 0) + counters.get('pages:failed', 0) < self.max_pages
+
+    async def _worker(self, visit: Callable[[str, int], Awaitable[Optional[Iterable[str]]]]):
+        tracer = current_tracer()
+        while await self._page_budget_left():
+            claimed = await self.queue.claim()
+            if claimed is None:
+                if await self.queue.is_drained():
+                    return
+                await asyncio.sleep(self.queue.poll_interval)
+                continue
+
+            url, depth = claimed
+            started = time.perf_counter()
+            links = None
+            try:
+                links = await visit(url, depth)
+            except Exception as e:
+                print(f"Error visiting {url}: {str(e)}")
+            if tracer is not None:
+                tracer.record('visit', 'frontier', started, time.perf_counter(), url, {'depth': depth})
+
+            if links is not None and depth < self.max_depth:
+                for link in links:
+                    await self.add(link, depth + 1)
+            await self.queue.ack(url, ok=links is not None)
+
+    async def run(
+        self,
+        visit: Callable[[str, int], Awaitable[Optional[Iterable[str]]]],
+        concurrency: int = 4,
+        seeds: Iterable[str] = ()
+    ) -> FrontierStats:
+        """Visit URLs with ``concurrency`` local workers until the shared frontier is drained.
+
+        Returned stats cover the whole crawl, across all workers.
+        """
+        for seed in seeds:
+            await self.add(seed)
+        async with self.queue:
+            await asyncio.gather(*(self._worker(visit) for _ in range(max(1, concurrency))))
+
+        counters = await self.queue.counters()
+        self.stats.queued = counters.get('pages:queued', 0)
+        self.stats.visited = counters.get('pages:done', 0)
+        self.stats.failed = counters.get('pages:failed', 0)
+        self.stats.duplicates = counters.get('pages:duplicates', 0)
+        return self.stats
@@ -0,0 +1,160 @@
+"""
+Conditional HTTP revalidation for recrawls.
+
+The ``ETag`` and ``Last-Modified`` validators of every page and document that
+was stored successfully are kept in the crawl database (``http_validators``).
+On the next crawl they are sent back as ``If-None-Match`` and
+``If-Modified-Since``. A ``304 Not Modified`` then skips the download, the
+conversion and the upload. Pages also keep the links they contained, so a
+304 page still feeds the crawl frontier.
+
+Validators are only saved after the content was stored, together with the
+storage target it was stored to (S3 bucket or local directory, and
+layout). A crawl writing to another target ignores them and fetches
+everything, so a 304 only skips content that was stored where the crawl
+writes (it may still have been deleted there since).
+"""
+
+import asyncio
+import json
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional
+
+from sqlalchemy import select
+
+from crawler.database import DatabaseManager
+from crawler.database.models import HttpValidator
+from .change_detection import url_hash
+from .write_buffer import WriteBuffer
+
+
+@dataclass
+class Validators:
+    """Cache validators of one URL, as last seen."""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_length: int = 0
+    page_urls: List[str] = field(default_factory=list)
+    document_urls: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_headers(cls, headers: Optional[Mapping[str, str]], content_length: int = 0) -> Optional['Validators']:
+        """Validators from response headers, or None if the server sent none."""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        etag = headers.get('etag')
+        last_modified = headers.get('last-modified')
+        if not etag and not last_modified:
+            return None
+        return cls(etag=etag, last_modified=last_modified, content_length=content_length)
+
+    def headers(self) -> Dict[str, str]:
+        """Request headers that make a GET conditional on these validators."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+@dataclass
+class RevalidationStats:
+    hits: int = 0  # 304 Not Modified
+    misses: int = 0  # conditional request answered with a full body
+    bytes_saved: int = 0
+
+    def summary(self) -> str:
+        return f"{self.hits} not modified, {self.misses} modified, {self.bytes_saved / 1024 / 1024:.1f} MB not transferred"
+
+
+class ValidatorStore:
+    """Validators per URL, cached in memory in front of the crawl database."""
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        force_refresh: bool = False,
+        cache_size: int = 100_000,
+        writes: Optional[WriteBuffer] = None,
+        storage_target: Optional[str] = None
+    ):
+        self.db = db
+        self.storage_target = storage_target  # set by the crawl session once it knows the bucket
+        # Shared with the rest of the crawl session, which closes it
+        self.writes = writes or WriteBuffer(db)
+        self.force_refresh = force_refresh
+        self.cache_size = cache_size
+        self.stats = RevalidationStats()
+        self._cache: 'OrderedDict[str, Optional[Validators]]' = OrderedDict()
+
+    def _cache_put(self, key: str, value: Optional[Validators]):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Validators]:
+        with self.db.get_session() as session:
+            row = session.execute(
+                select(HttpValidator).where(HttpValidator.url_hash == key)
+            ).scalar()
+            if row is None or row.storage_target != self.storage_target:
+                return None
+            links = json.loads(row.links) if row.links else {}
+            return Validators(
+                etag=row.etag,
+                last_modified=row.last_modified,
+                content_length=row.content_length or 0,
+                page_urls=links.get('pages', []),
+                document_urls=links.get('documents', [])
+            )
+
+    async def get(self, url: str) -> Optional[Validators]:
+        """Validators for a URL, or None if it was never stored (or on a forced refresh)."""
+        if self.force_refresh:
+            return None
+        key = url_hash(url)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        validators = await asyncio.to_thread(self._load, key)
+        self._cache_put(key, validators)
+        return validators
+
+    async def save(self, url: str, validators: Validators):
+        """Remember the validators of content that was just stored."""
+        key = url_hash(url)
+        links = None
+        if validators.page_urls or validators.document_urls:
+            links = json.dumps({'pages': validators.page_urls, 'documents': validators.document_urls})
+        await self.writes.upsert(HttpValidator, dict(
+            url_hash=key,
+            url=url,
+            etag=validators.etag,
+            last_modified=validators.last_modified,
+            content_length=validators.content_length,
+            links=links,
+            storage_target=self.storage_target,
+            updated_at=datetime.utcnow()
+        ), key='url_hash')
+        self._cache_put(key, validators)
+
+    def record_hit(self, validators: Validators):
+        self.stats.hits += 1
+        self.stats.bytes_saved += validators.content_length
+
+    def record_miss(self):
+        self.stats.misses += 1
+
+
+def create_validator_store(
+    crawl_config,
+    db: Optional[DatabaseManager],
+    writes: Optional[WriteBuffer] = None
+) -> Optional[ValidatorStore]:
+    """Build the validator store, or None if revalidation is disabled or there is no database."""
+    if db is None or not crawl_config.revalidate:
+        return None
+    return ValidatorStore(db, force_refresh=crawl_config.force_refresh, writes=writes)
@@ -0,0 +1,281 @@
+"""
+Non-blocking, batched uploads to S3.
+
+boto3 is synchronous, so uploads run on a dedicated thread pool that shares
+one client and its pooled connections, and the event loop never waits on a
+socket. Objects are submitted to a bounded queue: ``submit`` returns a
+future per object and only waits when the queue is full, which applies
+backpressure to whatever produces the content.
+
+Objects above the multipart threshold are uploaded in parts. Throttling,
+5xx responses and connection errors are retried with full-jitter
+exponential backoff; parts are retried individually.
+
+Point ``endpoint_url`` at a local S3 stand-in such as MinIO or
+``moto_server`` to run without AWS:
+
+    async with S3Uploader(S3UploadConfig(endpoint_url='http://localhost:5000')) as uploader:
+        future = await uploader.submit('bucket', 'pages/example.md', markdown)
+        ok = await future
+"""
+
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Union
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, ReadTimeoutError
+
+# Error codes S3 uses to ask clients to slow down or try again
+RETRYABLE_CODES = {
+    'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+    'RequestThrottled', 'TooManyRequestsException', 'RequestTimeout',
+    'InternalError', 'ServiceUnavailable', '503', '500',
+}
+
+# Marks the end of the queue for a dispatcher
+_DONE = object()
+
+
+@dataclass
+class S3UploadConfig:
+    """Client, pool and retry settings for the uploader."""
+    region: Optional[str] = None
+    endpoint_url: Optional[str] = None  # MinIO, moto_server, ...
+    workers: int = 8  # concurrent uploads (threads)
+    max_pool_connections: int = 32
+    queue_size: int = 64  # objects waiting for a worker before submit() blocks
+    multipart_threshold: int = 16 * 1024 * 1024
+    multipart_chunksize: int = 8 * 1024 * 1024  # S3 minimum part size is 5 MB
+    max_attempts: int = 5
+    base_backoff: float = 0.2  # seconds
+    max_backoff: float = 10.0
+
+
+@dataclass
+class UploadStats:
+    """Upload counters and throughput since the uploader started."""
+    objects: int = 0
+    bytes: int = 0
+    multipart: int = 0
+    retries: int = 0
+    failed: int = 0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def wall_seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def mb_per_second(self) -> float:
+        wall = self.wall_seconds
+        return self.bytes / 1024 / 1024 / wall if wall > 0 else 0.0
+
+    @property
+    def objects_per_second(self) -> float:
+        wall = self.wall_seconds
+        return self.objects / wall if wall > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.objects} objects, {self.bytes / 1024 / 1024:.1f} MB in {self.wall_seconds:.2f}s "
+            f"({self.mb_per_second:.2f} MB/s, {self.objects_per_second:.1f} objects/s; "
+            f"{self.multipart} multipart, {self.retries} retries, {self.failed} failed)"
+        )
+
+
+@dataclass
+class _UploadJob:
+    bucket: str
+    key: str
+    body: bytes
+    content_type: str
+    future: asyncio.Future
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (BotoConnectionError, ReadTimeoutError)):
+        return True
+    if isinstance(error, ClientError):
+        code = str(error.response.get('Error', {}).get('Code', ''))
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return code in RETRYABLE_CODES or status in (429, 500, 502, 503, 504)
+    return False
+
+
+class S3Uploader:
+    """Upload objects to S3 from a bounded queue on a pool of threads."""
+
+    def __init__(self, config: Optional[S3UploadConfig] = None, client=None):
+        self.config = config or S3UploadConfig()
+        self.stats = UploadStats()
+        self._client = client
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatchers: List[asyncio.Task] = []
+
+    async def __aenter__(self) -> 'S3Uploader':
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def client(self):
+        """The shared boto3 client, created on first use."""
+        if self._client is None:
+            cfg = self.config
+            self._client = boto3.client(
+                's3',
+                region_name=cfg.region,
+                endpoint_url=cfg.endpoint_url,
+                config=Config(
+                    max_pool_connections=cfg.max_pool_connections,
+                    # Retries are handled here, with jitter, per object and per part
+                    retries={'total_max_attempts': 1, 'mode': 'standard'}
+                )
+            )
+        return self._client
+
+    def start(self):
+        """Start the worker threads and dispatchers; idempotent."""
+        if self._queue is not None:
+            return
+        workers = max(1, self.config.workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='s3-upload')
+        self._queue = asyncio.Queue(maxsize=max(1, self.config.queue_size))
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(workers)]
+
+    async def close(self):
+        """Finish every queued upload, then stop the workers."""
+        if self._queue is None:
+            return
+        for _ in self._dispatchers:
+            await self._queue.put(_DONE)
+        await asyncio.gather(*self._dispatchers)
+        self._executor.shutdown(wait=True)
+        self._queue = None
+        self._dispatchers = []
+        self._executor = None
+        if self.stats.objects or self.stats.failed:
+            self.stats.finished_at = time.perf_counter()
+            print(f"S3 uploads: {self.stats.summary()}")
+
+    async def submit(
+        self,
+        bucket: str,
+        key: str,
+        content: Union[str, bytes],
+        content_type: str = 'text/markdown'
+    ) -> asyncio.Future:
+        """Queue an object and return a future that resolves to True once it is stored.
+
+        Waits only while the queue is full. The future resolves to False if
+        the upload failed after all retries.
+        """
+        self.start()
+        if self.stats.started_at is None:
+            self.stats.started_at = time.perf_counter()
+        body = content.encode('utf-8') if isinstance(content, str) else content
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_UploadJob(bucket, key, body, content_type, future))
+        return future
+
+    async def upload(
+        self,
+        bucket: str,
+        key: str,
+        content: Union[str, bytes],
+        content_type: str = 'text/markdown'
+    ) -> bool:
+        """Upload an object and wait for the result."""
+        return await (await self.submit(bucket, key, content, content_type))
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            if job is _DONE:
+                return
+            try:
+                await loop.run_in_executor(self._executor, self._put, job.bucket, job.key, job.body, job.content_type)
+            except Exception as e:
+                print(f"Error uploading s3://{job.bucket}/{job.key}: {str(e)}")
+                self.stats.failed += 1
+                if not job.future.done():
+                    job.future.set_result(False)
+            else:
+                self.stats.objects += 1
+                self.stats.bytes += len(job.body)
+                self.stats.finished_at = time.perf_counter()
+                if not job.future.done():
+                    job.future.set_result(True)
+
+    def _with_retries(self, operation, *args, **kwargs):
+        """Call a boto3 operation, retrying retryable errors with full-jitter backoff."""
+        cfg = self.config
+        for attempt in range(cfg.max_attempts):
+            try:
+                return operation(*args, **kwargs)
+            except Exception as e:
+                if attempt + 1 >= cfg.max_attempts or not _is_retryable(e):
+                    raise
+                self.stats.retries += 1
+                time.sleep(random.uniform(0, min(cfg.max_backoff, cfg.base_backoff * 2 ** attempt)))
+
+    def _put(self, bucket: str, key: str, body: bytes, content_type: str):
+        if len(body) < self.config.multipart_threshold:
+            self._with_retries(self.client.put_object, Bucket=bucket, Key=key, Body=body, ContentType=content_type)
+            return
+        self._put_multipart(bucket, key, body, content_type)
+
+    def _put_multipart(self, bucket: str, key: str, body: bytes, content_type: str):
+        client = self.client
+        chunk = max(5 * 1024 * 1024, self.config.multipart_chunksize)
+        upload_id = self._with_retries(
+            client.create_multipart_upload, Bucket=bucket, Key=key, ContentType=content_type
+        )['UploadId']
+        try:
+            view = memoryview(body)
+            parts = []
+            for number, offset in enumerate(range(0, len(body), chunk), start=1):
+                response = self._with_retries(
+                    client.upload_part,
+                    Bucket=bucket, Key=key, UploadId=upload_id,
+                    PartNumber=number, Body=bytes(view[offset:offset + chunk])
+                )
+                parts.append({'PartNumber': number, 'ETag': response['ETag']})
+            self._with_retries(
+                client.complete_multipart_upload,
+                Bucket=bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+            self.stats.multipart += 1
+        except Exception:
+            # Don't leave orphaned parts behind (they are billed until aborted)
+            try:
+                client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            except Exception:
+                pass
+            raise
+
+
+def create_uploader(crawl_config) -> S3Uploader:
+    """Build an uploader sized from the crawl configuration."""
+    return S3Uploader(S3UploadConfig(
+        region=crawl_config.s3_region,
+        endpoint_url=crawl_config.s3_endpoint_url,
+        workers=crawl_config.parallel_uploads,
+        max_pool_connections=crawl_config.s3_max_connections,
+        queue_size=crawl_config.parallel_uploads * 4,
+        multipart_threshold=crawl_config.s3_multipart_threshold_mb * 1024 * 1024,
+        max_attempts=crawl_config.s3_max_attempts
+    ))
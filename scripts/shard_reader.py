@@ -0,0 +1,124 @@
+"""
+Read single pages and documents back out of output shards.
+
+``ShardedStorage`` writes records into ``shards/<run>-<n>.jsonl.gz`` with an
+``.index.jsonl`` next to each shard. The reader loads those indexes and
+fetches one record with a byte-range GET (S3) or through mmap (local files),
+without downloading or decompressing the rest of the shard:
+
+    python -m scripts.shard_reader https://example.com/about
+    python -m scripts.shard_reader --bucket my-bucket pages/example.com/about.md
+    python -m scripts.shard_reader --list
+"""
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from crawler.utils.config import config
+from .storage import (
+    INDEX_SUFFIX, LOCAL_DIRECTORIES, LocalStorage, S3Storage, ShardLocation,
+    StorageBackend, decode_record
+)
+from .webpage_to_markdown import url_to_key
+
+
+class ShardReader:
+    """Random access to records in the shards under ``prefix``."""
+
+    def __init__(self, storage: StorageBackend, prefix: str = 'shards'):
+        self.storage = storage
+        self.prefix = prefix.strip('/')
+        self.index: Dict[str, ShardLocation] = {}
+
+    async def index_keys(self) -> List[str]:
+        """Keys of every shard index, oldest first."""
+        if isinstance(self.storage, S3Storage):
+            def list_keys() -> List[str]:
+                paginator = self.storage.uploader.client.get_paginator('list_objects_v2')
+                keys = []
+                for page in paginator.paginate(Bucket=self.storage.bucket, Prefix=f"{self.prefix}/"):
+                    keys.extend(item['Key'] for item in page.get('Contents', []))
+                return keys
+            keys = await asyncio.to_thread(list_keys)
+        elif isinstance(self.storage, LocalStorage):
+            directory = self.storage.root / LOCAL_DIRECTORIES.get(self.prefix, self.prefix)
+            # Shard names have no '/', so the key is just prefix/name
+            keys = [f"{self.prefix}/{path.name}" for path in directory.rglob(f"*{INDEX_SUFFIX}")]
+        else:
+            raise ValueError(f"Cannot list shards in {self.storage.name} storage")
+        # Run ids start with a UTC timestamp, so later crawls sort (and win) last
+        return sorted(key for key in keys if key.endswith(INDEX_SUFFIX))
+
+    async def load(self) -> int:
+        """Read every shard index; returns the number of records found."""
+        for key in await self.index_keys():
+            body = await self.storage.read(key)
+            if body is None:
+                continue
+            shard = key[:-len(INDEX_SUFFIX)] + '.jsonl.gz'
+            for line in body.decode('utf-8').splitlines():
+                if line.strip():
+                    entry = json.loads(line)
+                    self.index[entry['key']] = ShardLocation(shard, entry['offset'], entry['length'])
+        return len(self.index)
+
+    async def read(self, location: ShardLocation) -> Optional[str]:
+        """The content of the record at ``location`` (e.g. from ``ShardLocation.parse``)."""
+        member = await self.storage.read_range(location.shard, location.offset, location.length)
+        return decode_record(member)['content'] if member else None
+
+    async def get(self, key: str) -> Optional[str]:
+        """Content stored under a key such as ``pages/example.com/about.md``."""
+        location = self.index.get(key)
+        return await self.read(location) if location is not None else None
+
+    async def get_url(self, url: str) -> Optional[str]:
+        """Content stored for a page or document URL."""
+        key = url_to_key(url)
+        for candidate in (f"pages/{key}.md", f"documents/{key}.md"):
+            content = await self.get(candidate)
+            if content is not None:
+                return content
+        return None
+
+
+async def main(targets: List[str], s3_bucket: Optional[str], path: Optional[str], list_only: bool):
+    if s3_bucket:
+        storage = S3Storage(s3_bucket, crawl_config=config)
+    else:
+        storage = LocalStorage(Path(path or config.local_storage_path))
+    async with storage:
+        reader = ShardReader(storage)
+        count = await reader.load()
+        if list_only:
+            for key, location in sorted(reader.index.items()):
+                print(f"{key}\t{location.ref()}")
+            print(f"{count} records")
+            return
+        for target in targets:
+            location = ShardLocation.parse(target)
+            if location is not None:
+                content = await reader.read(location)
+            elif '://' in target:
+                content = await reader.get_url(target)
+            else:
+                content = await reader.get(target)
+            if content is None:
+                print(f"Not found: {target}")
+            else:
+                print(content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Read pages and documents from output shards')
+    parser.add_argument('targets', nargs='*', help='URLs, storage keys or shard references (shard#offset+length)')
+    parser.add_argument('--bucket', help='Read shards from this S3 bucket')
+    parser.add_argument('--path', help='Read shards from this local output directory (default: CRAWL_STORAGE_PATH)')
+    parser.add_argument('--list', action='store_true', help='List every key in the shard indexes')
+
+    args = parser.parse_args()
+
+    asyncio.run(main(args.targets, args.bucket, args.path, args.list))
@@ -0,0 +1,93 @@
+"""
+Spooled storage for downloaded document bodies.
+
+Bodies are written chunk by chunk as they arrive from the network. Small
+files stay in memory; once a body grows past the spool threshold it is moved
+to a named temporary file, so memory per document stays bounded regardless
+of the file size. The SHA-256 of the body is computed while streaming.
+
+A download answered with ``304 Not Modified`` has no body and is flagged
+with ``not_modified``.
+"""
+
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from typing import BinaryIO, Optional
+
+
+class SpooledDownload:
+    """A downloaded file body, kept in memory until it outgrows a threshold."""
+
+    def __init__(self, spool_threshold: int, suffix: str = ''):
+        self.spool_threshold = spool_threshold
+        self.suffix = suffix
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer: Optional[BytesIO] = BytesIO()
+        self._file = None  # NamedTemporaryFile once spilled to disk
+        self.validators = None  # ETag / Last-Modified the server sent, if any
+        self.doc_type = None  # document type detected from the headers and first bytes
+        self.not_modified = False
+
+    def __enter__(self) -> 'SpooledDownload':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    @property
+    def sha256(self) -> str:
+        """Hex digest of every byte written so far."""
+        return self._hash.hexdigest()
+
+    def write(self, chunk: bytes):
+        """Append a chunk, spilling to disk when the threshold is crossed."""
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        if self._file is None and self.size > self.spool_threshold:
+            self._spill()
+        target = self._file if self._file is not None else self._buffer
+        target.write(chunk)
+
+    def _spill(self):
+        self._file = tempfile.NamedTemporaryFile(suffix=self.suffix, delete=False)
+        self._file.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    @property
+    def path(self) -> str:
+        """Filesystem path of the body, spilling an in-memory body first."""
+        if self._file is None:
+            self._spill()
+        self._file.flush()
+        return self._file.name
+
+    def open(self) -> BinaryIO:
+        """Return a readable handle positioned at the start of the body."""
+        if self._file is None:
+            # In-memory bodies are capped by the spool threshold, so a copy is cheap
+            return BytesIO(self._buffer.getvalue())
+        self._file.flush()
+        return open(self._file.name, 'rb')
+
+    def read_prefix(self, length: int) -> bytes:
+        """Return up to ``length`` leading bytes of the body."""
+        with self.open() as handle:
+            return handle.read(length)
+
+    def close(self):
+        """Release the memory buffer and delete any temporary file."""
+        self._buffer = None
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.unlink(self._file.name)
+            except FileNotFoundError:
+                pass
+            self._file = None
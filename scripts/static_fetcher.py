@@ -0,0 +1,234 @@
+"""
+Fast path for server-rendered pages.
+
+Most pages do not need JavaScript to show their content. The static fetcher
+downloads them with a plain HTTP GET and converts the HTML in-process using
+crawl4ai's own scraping and markdown strategies, so the output and the
+``links`` structure match what the browser path produces. Pages that look
+JavaScript-dependent are handed back to the caller to render in a browser.
+
+The mode that worked is remembered per host, so once a host is known to be
+static (or to need a browser) later pages skip the detection step.
+
+With a validator store, pages are requested conditionally on the ETag /
+Last-Modified of the last crawl, including pages of hosts that need a
+browser: a 304 saves the render as well as the transfer.
+"""
+
+import asyncio
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+import lxml.html
+from lxml import etree
+from crawl4ai.content_scraping_strategy import LXMLWebScrapingStrategy
+from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+
+from .document_processor import HttpClientConfig, create_session
+from .metrics import track
+from .politeness import PolitenessScheduler, host_slot
+from .revalidation import Validators, ValidatorStore
+
+STATIC = 'static'
+BROWSER = 'browser'
+
+# Elements that single-page apps mount into; an empty one means a JS shell
+SPA_ROOT_XPATH = (
+    "//*[@id='root' or @id='app' or @id='__next' or @id='__nuxt' or @id='svelte'"
+    " or @ng-app or @data-reactroot or @data-server-rendered]"
+    " | //app-root"
+)
+NOSCRIPT_HINT = re.compile(r'(enable|requires?|turn on)\s+javascript', re.IGNORECASE)
+
+
+@dataclass
+class StaticPage:
+    """A page fetched and converted without a browser.
+
+    A page that was not modified since the last crawl has no markdown or
+    links; ``validators`` then holds the links stored by that crawl.
+    """
+    url: str
+    markdown: str
+    links: dict
+    validators: Optional[Validators] = None
+    not_modified: bool = False
+
+
+def detect_js_shell(html: str, min_text_chars: int = 200) -> Optional[str]:
+    """Return why a page looks JavaScript-dependent, or None if it looks static."""
+    try:
+        doc = lxml.html.fromstring(html)
+    except (ValueError, etree.ParserError):
+        return "unparseable HTML"
+
+    body = doc.find('body')
+    if body is None:
+        return "no <body>"
+
+    noscript_text = ' '.join(n.text_content() for n in body.iter('noscript'))
+    for node in body.xpath('.//script | .//style | .//template | .//noscript'):
+        node.drop_tree()
+    text = ' '.join(body.text_content().split())
+
+    if len(text) < min_text_chars:
+        if NOSCRIPT_HINT.search(noscript_text):
+            return "<noscript> shell"
+        return f"only {len(text)} characters of text"
+
+    for root in doc.xpath(SPA_ROOT_XPATH):
+        if not ' '.join(root.text_content().split()):
+            return f"empty SPA root <{root.tag}>"
+
+    return None
+
+
+class StaticFetcher:
+    """Fetch and convert server-rendered pages with plain HTTP."""
+
+    def __init__(
+        self,
+        http_config: Optional[HttpClientConfig] = None,
+        min_text_chars: int = 200,
+        max_html_bytes: int = 10 * 1024 * 1024
+    ):
+        self.http_config = http_config or HttpClientConfig()
+        self.min_text_chars = min_text_chars
+        self.max_html_bytes = max_html_bytes
+        self.host_modes: Dict[str, str] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._scraper = LXMLWebScrapingStrategy()
+        self._markdown = DefaultMarkdownGenerator()
+
+    async def __aenter__(self) -> 'StaticFetcher':
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self._session is None or self._session.closed:
+            self._session = create_session(self.http_config)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def mode_for(self, url: str) -> Optional[str]:
+        """The remembered render mode for a URL's host, if known."""
+        return self.host_modes.get(urlparse(url).netloc.lower())
+
+    async def _get_html(
+        self,
+        url: str,
+        previous: Optional[Validators] = None,
+        store: Optional[ValidatorStore] = None,
+        read_body: bool = True,
+        scheduler: Optional[PolitenessScheduler] = None
+    ) -> Optional[Tuple[str, Optional[str], Optional[Validators]]]:
+        """GET a page and return (final_url, html, validators), or None if it is not usable HTML.
+
+        With ``previous`` validators the GET is conditional and its outcome
+        is counted in ``store``; on a 304 the html is None and the previous
+        validators are returned.
+        """
+        await self.open()
+        headers = {'Accept': 'text/html,application/xhtml+xml'}
+        if previous is not None:
+            headers.update(previous.headers())
+        with track('fetch', url) as span:
+            return await self._request(url, headers, previous, store, read_body, scheduler, span)
+
+    async def _request(
+        self,
+        url: str,
+        headers: dict,
+        previous: Optional[Validators],
+        store: Optional[ValidatorStore],
+        read_body: bool,
+        scheduler: Optional[PolitenessScheduler],
+        span: track
+    ) -> Optional[Tuple[str, Optional[str], Optional[Validators]]]:
+        async with host_slot(scheduler, url) as slot, self._session.get(url, headers=headers) as response:
+            slot.record(response.status, response.headers.get('Retry-After'))
+            if response.status == 304 and previous is not None:
+                store.record_hit(previous)
+                return url, None, previous
+            if previous is not None:
+                store.record_miss()
+            if not read_body:
+                return None
+            if response.status != 200:
+                print(f"Static fetch of {url} returned status {response.status}")
+                span.fail()
+                return None
+            if 'html' not in response.headers.get('Content-Type', '').lower():
+                return None
+            if (response.content_length or 0) > self.max_html_bytes:
+                return None
+            body = await response.content.read(self.max_html_bytes + 1)
+            span.add_bytes(len(body))
+            if len(body) > self.max_html_bytes:
+                return None
+            encoding = response.get_encoding() if response.charset else 'utf-8'
+            validators = Validators.from_headers(response.headers, len(body))
+            return str(response.url), body.decode(encoding, errors='replace'), validators
+
+    def _convert(self, url: str, html: str) -> Tuple[str, dict]:
+        scraped = self._scraper.scrap(url, html)
+        result = self._markdown.generate_markdown(scraped.cleaned_html, base_url=url)
+        return result.raw_markdown, scraped.links.model_dump()
+
+    async def fetch(
+        self,
+        url: str,
+        validators: Optional[ValidatorStore] = None,
+        scheduler: Optional[PolitenessScheduler] = None
+    ) -> Optional[StaticPage]:
+        """Fetch a page without a browser.
+
+        Returns None when the page should be rendered in a browser instead:
+        the host is known to need one, the fetch failed, or the page looks
+        JavaScript-dependent. With a ``validators`` store, returns a page
+        flagged ``not_modified`` when the server answered 304 to the
+        validators of the last crawl. With a ``scheduler``, the request waits
+        for the host's politeness limits.
+        """
+        host = urlparse(url).netloc.lower()
+        mode = self.host_modes.get(host)
+        previous = await validators.get(url) if validators is not None else None
+        if mode == BROWSER and previous is None:
+            return None
+
+        try:
+            # Hosts that need a browser are only asked whether the page changed
+            fetched = await self._get_html(url, previous, validators, read_body=mode != BROWSER, scheduler=scheduler)
+            if fetched is None:
+                return None
+            final_url, html, validators = fetched
+            if html is None:
+                return StaticPage(url=url, markdown='', links={}, validators=validators, not_modified=True)
+
+            if mode is None:
+                reason = detect_js_shell(html, self.min_text_chars)
+                if reason:
+                    print(f"Using browser for {host}: {reason}")
+                    self.host_modes[host] = BROWSER
+                    return None
+                self.host_modes[host] = STATIC
+
+            # Parsing is CPU-bound; keep it off the event loop thread
+            with track('extract', final_url):
+                markdown, links = await asyncio.to_thread(self._convert, final_url, html)
+            if not markdown.strip():
+                return None
+            return StaticPage(url=final_url, markdown=markdown, links=links, validators=validators)
+
+        except Exception as e:
+            print(f"Static fetch of {url} failed: {str(e)}")
+            return None
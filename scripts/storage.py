@@ -0,0 +1,657 @@
+"""
+Storage backends for crawl output.
+
+The crawl writes markdown through a ``StorageBackend`` chosen from the crawl
+configuration: ``S3Storage`` when ``use_s3_storage`` is set, otherwise
+``LocalStorage`` under ``local_storage_path``. Keys are the same for both,
+e.g. ``pages/example.com/about.md`` or ``documents/example.com/report.pdf.md``.
+
+Local writes are atomic (written to a temporary file, then renamed into
+place) and spread over hash-sharded subdirectories so no single directory
+collects millions of files:
+
+    crawl_output/website/3f/a2/example.com_about.md
+    crawl_output/documents/9c/04/example.com_report.pdf.md
+
+Instead of an fsync per file, written files and their directories are
+fsynced in batches, and whatever is left is flushed on ``close()``.
+
+With ``dedup_storage`` set, ``DedupStorage`` wraps either backend and stores
+each distinct piece of markdown once under ``objects/<sha256>.md``. The URL
+is then only a reference to that object, recorded in the crawl database
+(``content_versions.storage_path`` / ``document_metadata.storage_path``).
+With ``dedup_refs`` also set, ``refs/<key>`` holds the object key as well, so
+output can be traced back to its page without the crawl database, at the
+cost of one more write per page or document.
+
+With ``output_mode = 'shards'``, ``ShardedStorage`` instead appends output to
+rolling gzip JSONL shards, written as one object each, so a large crawl makes
+a few hundred PUTs instead of hundreds of thousands. Every record is its own
+gzip member, so a single page can be read back with one byte-range request
+(see ``scripts/shard_reader.py``).
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Union
+
+from botocore.exceptions import ClientError
+
+from crawler.utils.config import config
+from .metrics import track
+from .s3_uploader import S3Uploader, create_uploader
+
+# Top-level key prefixes that live under a differently named local directory
+LOCAL_DIRECTORIES = {'pages': 'website'}
+
+# Leave room for the shard directories and temporary-file suffix
+MAX_FILENAME = 200
+
+
+class StorageBackend:
+    """Where crawl output is written. Use as an async context manager, or call ``close()``."""
+
+    name = 'base'
+    # True when store() keys output by content rather than by URL
+    content_addressed = False
+
+    async def __aenter__(self) -> 'StorageBackend':
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def write(self, key: str, content: Union[str, bytes], content_type: str = 'text/markdown') -> bool:
+        """Store an object; returns False if it could not be written."""
+        raise NotImplementedError
+
+    async def read(self, key: str) -> Optional[bytes]:
+        """Return a stored object, or None if it does not exist."""
+        raise NotImplementedError
+
+    async def read_range(self, key: str, offset: int, length: int) -> Optional[bytes]:
+        """Return ``length`` bytes of a stored object starting at ``offset``."""
+        body = await self.read(key)
+        return body[offset:offset + length] if body is not None else None
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def location(self, key: str) -> str:
+        """Where a key is stored, for logs and the crawl database."""
+        raise NotImplementedError
+
+    async def store(self, key: str, content: Union[str, bytes], content_type: str = 'text/markdown') -> Optional[str]:
+        """Store output for ``key``; returns the key it was stored under, or None on failure."""
+        return key if await self.write(key, content, content_type) else None
+
+    async def link(self, key: str, target: str) -> bool:
+        """Point ``key`` at output already stored under ``target``; only content-addressed backends keep links."""
+        return True
+
+    async def on_durable(self, key: str, callback: Callable[[bool], Awaitable[Any]]):
+        """Await ``callback(written)`` once the output ``store()`` returned ``key`` for is written.
+
+        Most backends write in ``store()`` itself, so the callback runs right away.
+        """
+        await callback(True)
+
+
+class S3Storage(StorageBackend):
+    """Objects in an S3 bucket, written through a shared ``S3Uploader``."""
+
+    name = 's3'
+
+    def __init__(self, bucket: str, uploader: Optional[S3Uploader] = None, crawl_config=None):
+        self.bucket = bucket
+        # Only close the uploader on close() if this backend created it
+        self._owns_uploader = uploader is None
+        self.uploader = uploader or create_uploader(crawl_config or config)
+
+    async def open(self):
+        self.uploader.start()
+
+    async def close(self):
+        if self._owns_uploader:
+            await self.uploader.close()
+
+    async def write(self, key: str, content: Union[str, bytes], content_type: str = 'text/markdown') -> bool:
+        body = content.encode('utf-8') if isinstance(content, str) else content
+        with track('upload') as span:
+            span.add_bytes(len(body))
+            try:
+                ok = await self.uploader.upload(self.bucket, key, body, content_type)
+            except Exception as e:
+                print(f"Error uploading to S3: {str(e)}")
+                ok = False
+            if not ok:
+                span.fail()
+            return ok
+
+    async def read(self, key: str) -> Optional[bytes]:
+        def get() -> Optional[bytes]:
+            try:
+                return self.uploader.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                    return None
+                raise
+        return await asyncio.to_thread(get)
+
+    async def read_range(self, key: str, offset: int, length: int) -> Optional[bytes]:
+        def get() -> Optional[bytes]:
+            try:
+                response = self.uploader.client.get_object(
+                    Bucket=self.bucket, Key=key, Range=f"bytes={offset}-{offset + length - 1}"
+                )
+                return response['Body'].read()
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                    return None
+                raise
+        return await asyncio.to_thread(get)
+
+    async def exists(self, key: str) -> bool:
+        def head() -> bool:
+            try:
+                self.uploader.client.head_object(Bucket=self.bucket, Key=key)
+                return True
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404', 'NotFound'):
+                    return False
+                raise
+        return await asyncio.to_thread(head)
+
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+
+class LocalStorage(StorageBackend):
+    """Files under a local directory, written atomically into hash-sharded subdirectories."""
+
+    name = 'local'
+
+    def __init__(self, root: Union[str, Path], shard_depth: int = 2, fsync_batch: int = 64):
+        self.root = Path(root)
+        self.shard_depth = shard_depth
+        self.fsync_batch = fsync_batch
+        self.written = 0
+        self._lock = threading.Lock()
+        self._unsynced_files: List[Path] = []
+        self._unsynced_dirs: Set[Path] = set()
+
+    def path_for(self, key: str) -> Path:
+        """The file a key is stored in."""
+        top, _, rest = key.strip('/').partition('/')
+        if not rest:
+            top, rest = '', top
+        name = rest.replace('/', '_')
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+        if len(name) > MAX_FILENAME:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem[:MAX_FILENAME - len(ext) - 17]}-{digest}{ext}"
+        shards = [digest[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return self.root.joinpath(LOCAL_DIRECTORIES.get(top, top), *shards, name)
+
+    def _write(self, path: Path, body: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with open(temp, 'wb') as handle:
+                handle.write(body)
+            os.replace(temp, path)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            self.written += 1
+            self._unsynced_files.append(path)
+            self._unsynced_dirs.add(path.parent)
+            if len(self._unsynced_files) < self.fsync_batch:
+                return
+            files, dirs = self._take_unsynced()
+        self._fsync(files, dirs)
+
+    def _take_unsynced(self):
+        files, dirs = self._unsynced_files, self._unsynced_dirs
+        self._unsynced_files, self._unsynced_dirs = [], set()
+        return files, dirs
+
+    @staticmethod
+    def _fsync(files: List[Path], dirs: Set[Path]):
+        for path in files:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        # Directory entries make the renames themselves durable
+        for directory in dirs:
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+            except (FileNotFoundError, PermissionError, IsADirectoryError):
+                continue
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass  # not supported for directories on every platform
+            finally:
+                os.close(fd)
+
+    async def flush(self):
+        """fsync every file written since the last batch."""
+        with self._lock:
+            files, dirs = self._take_unsynced()
+        if files:
+            await asyncio.to_thread(self._fsync, files, dirs)
+
+    async def open(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    async def close(self):
+        await self.flush()
+
+    async def write(self, key: str, content: Union[str, bytes], content_type: str = 'text/markdown') -> bool:
+        body = content.encode('utf-8') if isinstance(content, str) else content
+        with track('upload') as span:
+            span.add_bytes(len(body))
+            try:
+                await asyncio.to_thread(self._write, self.path_for(key), body)
+                return True
+            except Exception as e:
+                print(f"Error writing {key} to {self.root}: {str(e)}")
+                span.fail()
+                return False
+
+    async def read(self, key: str) -> Optional[bytes]:
+        path = self.path_for(key)
+        try:
+            return await asyncio.to_thread(path.read_bytes)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _read_range(path: Path, offset: int, length: int) -> bytes:
+        with open(path, 'rb') as handle:
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[offset:offset + length]
+
+    async def read_range(self, key: str, offset: int, length: int) -> Optional[bytes]:
+        try:
+            return await asyncio.to_thread(self._read_range, self.path_for(key), offset, length)
+        except (FileNotFoundError, ValueError):
+            return None  # missing, or empty (mmap of a zero-length file)
+
+    async def exists(self, key: str) -> bool:
+        return self.path_for(key).exists()
+
+    def location(self, key: str) -> str:
+        return str(self.path_for(key))
+
+
+@dataclass(frozen=True)
+class ShardLocation:
+    """Where one record lives inside a shard."""
+    shard: str
+    offset: int
+    length: int
+
+    def ref(self) -> str:
+        """Compact form stored in the crawl database, e.g. ``shards/x-00000.jsonl.gz#0+812``."""
+        return f"{self.shard}#{self.offset}+{self.length}"
+
+    @classmethod
+    def parse(cls, ref: str) -> Optional['ShardLocation']:
+        shard, sep, span = ref.rpartition('#')
+        offset, plus, length = span.partition('+')
+        if not sep or not plus or not offset.isdigit() or not length.isdigit():
+            return None
+        return cls(shard, int(offset), int(length))
+
+
+SHARD_SUFFIX = '.jsonl.gz'
+INDEX_SUFFIX = '.index.jsonl'
+
+
+def index_key(shard: str) -> str:
+    """The index written next to a shard."""
+    return shard[:-len(SHARD_SUFFIX)] + INDEX_SUFFIX
+
+
+def decode_record(member: bytes) -> dict:
+    """One shard record: ``{'key': ..., 'content': ...}``."""
+    return json.loads(gzip.decompress(member))
+
+
+class ShardedStorage(StorageBackend):
+    """Append output to rolling compressed shards instead of one object per key.
+
+    Each record is a JSON line (``key`` and ``content``) compressed as its own
+    gzip member; concatenated members are still a valid gzip file, so a shard
+    can be streamed with ``zcat`` as well as read one record at a time. A
+    shard is written when it reaches ``max_bytes`` or ``max_records`` (and on
+    ``close()``), followed by its index, one JSON line per record with the
+    key, offset and length.
+
+    ``store()`` returns a ``ShardLocation.ref()`` that ``read()`` accepts.
+    Records are held in memory until their shard is written, so anything
+    that treats a record as saved (change detection, checkpoints) must wait
+    for ``on_durable()``, which reports whether the shard and its index were
+    written.
+    """
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        prefix: str = 'shards',
+        max_bytes: int = 64 * 1024 * 1024,
+        max_records: int = 10_000
+    ):
+        self.backend = backend
+        self.name = f"{backend.name}+shards"
+        self.prefix = prefix.strip('/')
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        # Unique per writer so concurrent crawl workers never share a shard
+        self.run_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self.shards_written = 0
+        self.records_written = 0
+        self._sequence = 0
+        self._buffer = bytearray()
+        self._index: List[dict] = []
+        self._lock = asyncio.Lock()
+        self._pending: Set[asyncio.Task] = set()
+        # Rotated shards still being written, readable until they land
+        self._unwritten: Dict[str, bytes] = {}
+        # on_durable() callbacks per shard not written yet, and shards that failed
+        self._callbacks: Dict[str, List[Callable[[bool], Awaitable[Any]]]] = {}
+        self._failed: Set[str] = set()
+
+    def _shard_key(self) -> str:
+        return f"{self.prefix}/{self.run_id}-{self._sequence:05d}{SHARD_SUFFIX}"
+
+    async def open(self):
+        await self.backend.open()
+
+    async def close(self):
+        async with self._lock:
+            buffer, index, shard = self._take_shard()
+        if index:
+            await self._write_shard(shard, buffer, index)
+        else:
+            self._unwritten.pop(shard, None)
+        if self._pending:
+            await asyncio.gather(*self._pending)
+        await self.backend.close()
+        if self.shards_written:
+            print(f"Shards: {self.records_written} records in {self.shards_written} shards")
+
+    def _take_shard(self):
+        buffer, index, shard = bytes(self._buffer), self._index, self._shard_key()
+        self._buffer, self._index = bytearray(), []
+        self._sequence += 1
+        self._unwritten[shard] = buffer
+        return buffer, index, shard
+
+    async def _write_shard(self, shard: str, buffer: bytes, index: List[dict]) -> bool:
+        written = False
+        try:
+            written = await self._write_shard_and_index(shard, buffer, index)
+        except Exception as e:
+            print(f"Failed to write shard {shard}: {str(e)}")
+        finally:
+            if not written:
+                self._failed.add(shard)
+            self._unwritten.pop(shard, None)
+            for callback in self._callbacks.pop(shard, []):
+                try:
+                    await callback(written)
+                except Exception as e:
+                    print(f"Error after writing shard {shard}: {str(e)}")
+        return written
+
+    async def _write_shard_and_index(self, shard: str, buffer: bytes, index: List[dict]) -> bool:
+        if not await self.backend.write(shard, buffer, 'application/gzip'):
+            print(f"Failed to write shard {shard} ({len(index)} records lost)")
+            return False
+        lines = ''.join(json.dumps(entry) + '\n' for entry in index)
+        # The index goes last: an index only exists for a complete shard
+        if not await self.backend.write(index_key(shard), lines, 'application/x-ndjson'):
+            print(f"Failed to write index for shard {shard}")
+            return False
+        self.shards_written += 1
+        self.records_written += len(index)
+        return True
+
+    async def write(self, key: str, content: Union[str, bytes], content_type: str = 'text/markdown') -> bool:
+        return await self.store(key, content, content_type) is not None
+
+    async def store(self, key: str, content: Union[str, bytes], content_type: str = 'text/markdown') -> Optional[str]:
+        text = content.decode('utf-8') if isinstance(content, bytes) else content
+        record = json.dumps({'key': key, 'content': text}, ensure_ascii=False).encode('utf-8') + b'\n'
+        member = await asyncio.to_thread(gzip.compress, record, 6)
+        async with self._lock:
+            location = ShardLocation(self._shard_key(), len(self._buffer), len(member))
+            self._buffer += member
+            self._index.append({'key': key, 'offset': location.offset, 'length': location.length})
+            if len(self._buffer) < self.max_bytes and len(self._index) < self.max_records:
+                return location.ref()
+            buffer, index, shard = self._take_shard()
+        # Written in the background so other records go on into the next shard
+        task = asyncio.create_task(self._write_shard(shard, buffer, index))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return location.ref()
+
+    async def on_durable(self, key: str, callback: Callable[[bool], Awaitable[Any]]):
+        location = ShardLocation.parse(key)
+        if location is None:
+            await self.backend.on_durable(key, callback)
+        elif location.shard in self._failed:
+            await callback(False)
+        elif location.shard == self._shard_key() or location.shard in self._unwritten:
+            self._callbacks.setdefault(location.shard, []).append(callback)
+        else:
+            await callback(True)
+
+    async def _read_record(self, location: ShardLocation) -> Optional[dict]:
+        pending = self._buffer if location.shard == self._shard_key() else self._unwritten.get(location.shard)
+        if pending is not None:
+            member = bytes(pending[location.offset:location.offset + location.length])
+        else:
+            member = await self.backend.read_range(location.shard, location.offset, location.length)
+        return decode_record(member) if member else None
+
+    async def read(self, key: str) -> Optional[bytes]:
+        location = ShardLocation.parse(key)
+        if location is None:
+            return await self.backend.read(key)
+        record = await self._read_record(location)
+        return record['content'].encode('utf-8') if record is not None else None
+
+    async def exists(self, key: str) -> bool:
+        location = ShardLocation.parse(key)
+        if location is None:
+            return await self.backend.exists(key)
+        if location.shard == self._shard_key() or location.shard in self._unwritten:
+            return True
+        return await self.backend.exists(location.shard)
+
+    def location(self, key: str) -> str:
+        location = ShardLocation.parse(key)
+        if location is None:
+            return self.backend.location(key)
+        return f"{self.backend.location(location.shard)}#{location.offset}+{location.length}"
+
+
+def create_storage(
+    crawl_config,
+    s3_bucket: Optional[str] = None,
+    uploader: Optional[S3Uploader] = None
+) -> StorageBackend:
+    """The backend selected by the crawl configuration.
+
+    S3 is used when ``use_s3_storage`` is set, with ``s3_bucket`` or the
+    configured bucket; otherwise files go under ``local_storage_path``.
+    Either is wrapped in ``ShardedStorage`` when ``output_mode`` is
+    ``'shards'``, or otherwise in ``DedupStorage`` when ``dedup_storage`` is set.
+    """
+    if crawl_config.use_s3_storage:
+        bucket = s3_bucket or crawl_config.s3_bucket
+        if not bucket:
+            raise ValueError("S3 storage enabled but no bucket given")
+        backend = S3Storage(bucket, uploader, crawl_config)
+    else:
+        backend = LocalStorage(crawl_config.local_storage_path, fsync_batch=crawl_config.local_fsync_batch)
+    if crawl_config.output_mode == 'shards':
+        return ShardedStorage(
+            backend,
+            max_bytes=crawl_config.shard_max_mb * 1024 * 1024,
+            max_records=crawl_config.shard_max_records
+        )
+    if crawl_config.dedup_storage:
+        return DedupStorage(backend, refs=crawl_config.dedup_refs)
+    return backend
+
+
+def storage_target(crawl_config, s3_bucket: Optional[str] = None) -> str:
+    """Where and how ``create_storage`` writes output, e.g. ``dedup+s3://bucket``.
+
+    Stored keys only mean something under the same target, so crawl database
+    rows that point at stored output record it. Plain files are recorded by
+    location alone.
+    """
+    if crawl_config.use_s3_storage:
+        location = f"s3://{s3_bucket or crawl_config.s3_bucket}"
+    else:
+        location = f"file://{os.path.abspath(crawl_config.local_storage_path)}"
+    if crawl_config.output_mode == 'shards':
+        return f"shards+{location}"
+    if crawl_config.dedup_storage:
+        return f"dedup+{location}"
+    return location
+
+
+def object_key(digest: str) -> str:
+    """Content-addressed key for markdown with the given sha256."""
+    return f"objects/{digest}.md"
+
+
+def ref_key(key: str) -> str:
+    """Where ``DedupStorage`` records which object a key's output is."""
+    return f"refs/{key.strip('/')}"
+
+
+@dataclass
+class DedupStats:
+    """Objects written and duplicates avoided by a ``DedupStorage``."""
+    objects: int = 0
+    duplicates: int = 0
+    bytes_saved: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"{self.objects} objects stored, {self.duplicates} duplicates "
+            f"({self.bytes_saved / 1024 / 1024:.1f} MB not stored again)"
+        )
+
+
+class DedupStorage(StorageBackend):
+    """Store each distinct output once, keyed by the sha256 of its content.
+
+    ``store()`` writes ``objects/<sha256>.md`` unless that object already
+    exists and returns the object key, which callers record as the URL's
+    reference. Plain ``write()`` passes through to the wrapped backend.
+
+    With ``refs``, ``store()`` and ``link()`` also record the object under
+    ``refs/<key>``, and ``read()``/``exists()`` of a key stored that way
+    follow its ref. Without them the crawl database is the only map from a
+    URL to its object, and ``read()``/``exists()`` only see plain writes.
+    """
+
+    content_addressed = True
+
+    def __init__(self, backend: StorageBackend, cache_size: int = 100_000, refs: bool = False):
+        self.backend = backend
+        self.refs = refs
+        self.name = f"{backend.name}+dedup"
+        self.stats = DedupStats()
+        self.cache_size = cache_size
+        # Object keys known to exist, so repeats skip the existence check
+        self._known: OrderedDict = OrderedDict()
+
+    async def open(self):
+        await self.backend.open()
+
+    async def close(self):
+        await self.backend.close()
+        if self.stats.objects or self.stats.duplicates:
+            print(f"Deduplicated storage: {self.stats.summary()}")
+
+    async def write(self, key: str, content: Union[str, bytes], content_type: str = 'text/markdown') -> bool:
+        return await self.backend.write(key, content, content_type)
+
+    async def read(self, key: str) -> Optional[bytes]:
+        body = await self.backend.read(key)
+        if body is None and self.refs and not key.startswith(('objects/', 'refs/')):
+            target = await self.backend.read(ref_key(key))
+            if target is not None:
+                body = await self.backend.read(target.decode('utf-8'))
+        return body
+
+    async def exists(self, key: str) -> bool:
+        return await self.backend.exists(key) or (
+            self.refs and not key.startswith(('objects/', 'refs/')) and await self.backend.exists(ref_key(key))
+        )
+
+    def location(self, key: str) -> str:
+        return self.backend.location(key)
+
+    def _remember(self, key: str):
+        self._known[key] = True
+        self._known.move_to_end(key)
+        if len(self._known) > self.cache_size:
+            self._known.popitem(last=False)
+
+    async def store(self, key: str, content: Union[str, bytes], content_type: str = 'text/markdown') -> Optional[str]:
+        body = content.encode('utf-8') if isinstance(content, str) else content
+        target = object_key(hashlib.sha256(body).hexdigest())
+        if target in self._known or await self.backend.exists(target):
+            self._remember(target)
+            self.stats.duplicates += 1
+            self.stats.bytes_saved += len(body)
+        elif await self.backend.write(target, body, content_type):
+            self._remember(target)
+            self.stats.objects += 1
+        else:
+            return None
+        return target if await self.link(key, target) else None
+
+    async def link(self, key: str, target: str) -> bool:
+        """Record ``target`` as the object holding the output for ``key``, if refs are kept."""
+        if not self.refs:
+            return True
+        # The object alone does not say which URL it came from
+        return await self.backend.write(ref_key(key), target, 'text/plain')
+
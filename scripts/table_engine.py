@@ -0,0 +1,246 @@
+"""
+Streaming CSV and Excel to markdown conversion.
+
+Spreadsheets are never loaded whole. Rows are read in batches and written to a
+text sink as markdown table lines:
+
+- CSVs are read in chunks of ``chunk_rows`` rows with pandas
+- ``.xlsx`` workbooks are read with openpyxl in read-only mode, one row at a
+  time; legacy ``.xls`` workbooks with xlrd, one sheet at a time
+- every sheet of a workbook becomes its own table under a ``## <sheet>``
+  heading
+- cells of each batch are escaped column by column with pandas string
+  methods rather than cell by cell
+- ``max_rows`` (per table) and ``max_columns`` cap the output, which then
+  ends with a ``<!-- truncated: ... -->`` note
+
+``csv_to_markdown`` and ``excel_to_markdown`` run inside conversion worker
+processes and return the markdown; ``write_csv`` and ``write_excel`` stream
+it to any writable text sink.
+
+Reading is streamed, but the finished markdown is not: storage takes whole
+documents, so the worker collects the output in memory and hands it back as
+one string. Peak memory is about twice the markdown size in the worker (the
+sink plus the returned copy) and again in the parent while it unpickles and
+uploads the result. ``max_rows`` is what bounds it for very large files.
+"""
+
+from dataclasses import dataclass
+from io import StringIO
+from typing import Iterable, List, Optional, Sequence, TextIO
+
+import openpyxl
+import pandas as pd
+
+XLSX_MAGIC = b'PK\x03\x04'
+XLS_MAGIC = b'\xd0\xcf\x11\xe0'
+
+
+@dataclass
+class TableConfig:
+    """Caps and batch size for spreadsheet conversion (0 means no limit)."""
+    max_rows: int = 0  # data rows per table, i.e. per sheet
+    max_columns: int = 0
+    chunk_rows: int = 10_000  # rows read and escaped per batch
+
+
+def markdown_rows(frame: pd.DataFrame) -> pd.Series:
+    """Markdown table lines for every row of a frame, escaped a column at a time."""
+    if frame.shape[1] == 0:
+        return pd.Series([], dtype=object)
+    text = frame.fillna('').astype(str)
+    lines = None
+    for index in range(text.shape[1]):
+        column = (
+            text.iloc[:, index]
+            .str.replace('|', '\\|', regex=False)
+            .str.replace(r'[\r\n]+', ' ', regex=True)
+            .str.strip()
+        )
+        lines = '| ' + column if lines is None else lines + ' | ' + column
+    return lines + ' |'
+
+
+class TableWriter:
+    """Stream one markdown table to a text sink; the first row added is the header."""
+
+    def __init__(
+        self,
+        sink: TextIO,
+        max_rows: int = 0,
+        max_columns: int = 0,
+        batch_rows: int = 10_000,
+        title: Optional[str] = None
+    ):
+        self.sink = sink
+        self.max_rows = max_rows
+        self.max_columns = max_columns
+        self.batch_rows = batch_rows
+        self.title = title
+        self.width: Optional[int] = None
+        self.rows = 0
+        self.truncated = False
+        self.columns_cut = False
+        self._batch: List[Sequence] = []
+
+    @property
+    def started(self) -> bool:
+        return self.width is not None
+
+    def _header(self, row: Sequence):
+        if self.max_columns and len(row) > self.max_columns:
+            row = row[:self.max_columns]
+            self.columns_cut = True
+        self.width = len(row)
+        if self.title is not None:
+            self.sink.write(f"## {self.title}\n\n")
+        self.sink.write(markdown_rows(pd.DataFrame([list(row)], dtype=object)).iloc[0] + '\n')
+        self.sink.write('|' + '---|' * self.width + '\n')
+
+    def _write(self, frame: pd.DataFrame):
+        frame = frame.set_axis(range(frame.shape[1]), axis=1)
+        if frame.shape[1] != self.width:
+            frame = frame.reindex(columns=range(self.width))
+        lines = markdown_rows(frame)
+        if len(lines):
+            self.sink.write('\n'.join(lines) + '\n')
+
+    def add(self, row: Sequence) -> bool:
+        """Add one row; False once the row cap is reached."""
+        if self.width is None:
+            self._header(row)
+            return True
+        if self.max_rows and self.rows >= self.max_rows:
+            self.truncated = True
+            return False
+        self._batch.append(row[:self.max_columns] if self.max_columns else row)
+        self.rows += 1
+        if len(self._batch) >= self.batch_rows:
+            self.flush()
+        return True
+
+    def add_frame(self, frame: pd.DataFrame) -> bool:
+        """Add a batch of rows at once; False once the row cap is reached."""
+        if self.width is None and len(frame):
+            self._header(list(frame.iloc[0]))
+            frame = frame.iloc[1:]
+        if self.max_rows:
+            room = self.max_rows - self.rows
+            if len(frame) > room:
+                frame = frame.iloc[:room]
+                self.truncated = True
+        if self.max_columns and frame.shape[1] > self.max_columns:
+            frame = frame.iloc[:, :self.max_columns]
+        self.flush()
+        self._write(frame)
+        self.rows += len(frame)
+        return not self.truncated
+
+    def flush(self):
+        if self._batch:
+            self._write(pd.DataFrame.from_records(self._batch))
+            self._batch = []
+
+    def close(self):
+        """Write the pending rows and note any truncation."""
+        self.flush()
+        cuts = []
+        if self.truncated:
+            cuts.append(f"first {self.max_rows} rows")
+        if self.columns_cut:
+            cuts.append(f"first {self.max_columns} columns")
+        if cuts:
+            self.sink.write(f"\n<!-- truncated: {' and '.join(cuts)} converted -->\n")
+
+
+def _write_sheet(sink: TextIO, title: str, rows: Iterable[Sequence], cfg: TableConfig, separate: bool) -> bool:
+    """Write one sheet as a table, skipping empty rows; returns whether anything was written."""
+    writer = TableWriter(sink, cfg.max_rows, cfg.max_columns, cfg.chunk_rows, title)
+    for row in rows:
+        if not any(cell is not None and cell != '' for cell in row):
+            continue
+        if separate and not writer.started:
+            sink.write('\n')
+        if not writer.add(row):
+            break
+    writer.close()
+    return writer.started
+
+
+def write_csv(path: str, sink: TextIO, cfg: Optional[TableConfig] = None):
+    """Stream a CSV file to ``sink`` as a markdown table, ``chunk_rows`` rows at a time."""
+    cfg = cfg or TableConfig()
+    writer = TableWriter(sink, cfg.max_rows, cfg.max_columns, cfg.chunk_rows)
+    # Header, the capped rows and one more to tell whether rows were left out
+    limit = cfg.max_rows + 2 if cfg.max_rows else None
+    try:
+        with pd.read_csv(
+            path,
+            header=None,
+            dtype=str,
+            keep_default_na=False,
+            encoding_errors='replace',
+            chunksize=cfg.chunk_rows,
+            nrows=limit
+        ) as reader:
+            for chunk in reader:
+                if not writer.add_frame(chunk):
+                    break
+    except pd.errors.EmptyDataError:
+        pass  # An empty file is an empty table, not a failed conversion
+    writer.close()
+
+
+def _xlsx_sheets(path: str, sink: TextIO, cfg: TableConfig):
+    # Opened as a file so the workbook is read whatever the download's suffix
+    with open(path, 'rb') as f:
+        workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+        try:
+            written = False
+            for sheet in workbook.worksheets:
+                written = _write_sheet(sink, sheet.title, sheet.iter_rows(values_only=True), cfg, written) or written
+        finally:
+            workbook.close()
+
+
+def _xls_sheets(path: str, sink: TextIO, cfg: TableConfig):
+    # Legacy workbooks only; xlrd is not needed for anything else
+    import xlrd
+
+    workbook = xlrd.open_workbook(path, on_demand=True)
+    try:
+        written = False
+        for name in workbook.sheet_names():
+            sheet = workbook.sheet_by_name(name)
+            rows = (sheet.row_values(index) for index in range(sheet.nrows))
+            written = _write_sheet(sink, name, rows, cfg, written) or written
+            workbook.unload_sheet(name)
+    finally:
+        workbook.release_resources()
+
+
+def write_excel(path: str, sink: TextIO, cfg: Optional[TableConfig] = None):
+    """Stream every sheet of a workbook to ``sink``, one markdown table per sheet."""
+    cfg = cfg or TableConfig()
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic == XLS_MAGIC:
+        _xls_sheets(path, sink, cfg)
+    elif magic == XLSX_MAGIC:
+        _xlsx_sheets(path, sink, cfg)
+    else:
+        raise ValueError(f"Not an Excel workbook: {path}")
+
+
+def csv_to_markdown(path: str, max_rows: int = 0, max_columns: int = 0, chunk_rows: int = 10_000) -> str:
+    """Convert a CSV file to a markdown table. Runs inside a worker process."""
+    sink = StringIO()
+    write_csv(path, sink, TableConfig(max_rows, max_columns, chunk_rows))
+    return sink.getvalue().rstrip('\n')
+
+
+def excel_to_markdown(path: str, max_rows: int = 0, max_columns: int = 0, chunk_rows: int = 10_000) -> str:
+    """Convert every sheet of an Excel file to markdown tables. Runs inside a worker process."""
+    sink = StringIO()
+    write_excel(path, sink, TableConfig(max_rows, max_columns, chunk_rows))
+    return sink.getvalue().rstrip('\n')
@@ -0,0 +1,254 @@
+"""
+Per-crawl trace timelines and conversion profiles.
+
+Tracing is opt-in. A crawl runs inside ``use_tracer(tracer)``; the frontier,
+the document pipeline and every ``metrics.track`` stage then report spans to
+it, which ``Tracer.write`` saves as Chrome trace-event JSON. Open the file in
+https://ui.perfetto.dev or chrome://tracing:
+
+- one thread per worker task, showing each stage it ran (fetch, render,
+  extract, download, convert, upload, db_write) with the URL in its args
+- one async track per URL: its whole lifetime, the time it waited in each
+  queue, and each stage it went through
+
+Without a tracer, each instrumented point costs one context variable lookup.
+
+With ``profile_interval`` set, the conversion engine also samples the stacks
+of its worker processes. ``Tracer.write_profile`` saves them in the folded
+format (``frame;frame;frame count``) read by flamegraph.pl, speedscope and
+inferno.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+_current: ContextVar[Optional['Tracer']] = ContextVar('tracer', default=None)
+
+
+def current_tracer() -> Optional['Tracer']:
+    """The tracer of the running crawl, or None when tracing is off."""
+    return _current.get()
+
+
+@contextmanager
+def use_tracer(tracer: Optional['Tracer']) -> Iterator[Optional['Tracer']]:
+    """Trace everything run in this context, including tasks it creates."""
+    token = _current.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current.reset(token)
+
+
+class Tracer:
+    """Collect spans of one crawl as Chrome trace events."""
+
+    def __init__(
+        self,
+        name: str = 'crawl',
+        max_events: int = 1_000_000,
+        profile_interval: Optional[float] = None
+    ):
+        self.name = name
+        self.max_events = max_events
+        self.profile_interval = profile_interval
+        self.events: List[dict] = []
+        self.dropped = 0
+        self.stacks: Counter = Counter()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._tids: Dict[int, int] = {}
+        self._ids: Dict[str, int] = {}
+        self._queued: Dict[str, float] = {}
+        self._admitted: Dict[str, float] = {}
+        self.events.append(self._meta('process_name', 0, self.name))
+
+    def _us(self, seconds: float) -> float:
+        return round((seconds - self._origin) * 1_000_000, 1)
+
+    def _meta(self, kind: str, tid: int, name: str) -> dict:
+        return {'name': kind, 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': name}}
+
+    def _tid(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task is not None else threading.get_ident()
+        tid = self._tids.get(key)
+        if tid is None:
+            tid = self._tids[key] = len(self._tids) + 1
+            name = task.get_name() if task is not None else threading.current_thread().name
+            self.events.append(self._meta('thread_name', tid, name))
+        return tid
+
+    def _append(self, *events: dict):
+        if len(self.events) + len(events) > self.max_events:
+            self.dropped += len(events)
+            return
+        self.events.extend(events)
+
+    def _slice(self, name: str, cat: str, url: str, start: float, end: float, args: Optional[dict] = None):
+        """An async slice on the URL's own track."""
+        track_id = self._ids.get(url)
+        if track_id is None:
+            track_id = self._ids[url] = len(self._ids) + 1
+        base = {'name': name, 'cat': cat, 'pid': self._pid, 'tid': 0, 'id': track_id}
+        begin = dict(base, ph='b', ts=self._us(start), args=dict(args or {}, url=url))
+        self._append(begin, dict(base, ph='e', ts=self._us(end)))
+
+    def record(
+        self,
+        name: str,
+        cat: str,
+        start: float,
+        end: float,
+        url: Optional[str] = None,
+        args: Optional[dict] = None
+    ):
+        """Record a finished span of the current task; ``start`` and ``end`` are perf_counter values."""
+        event_args = dict(args or {})
+        if url:
+            event_args['url'] = url
+        self._append({
+            'name': name, 'cat': cat, 'ph': 'X', 'pid': self._pid, 'tid': self._tid(),
+            'ts': self._us(start), 'dur': round((end - start) * 1_000_000, 1), 'args': event_args,
+        })
+        if url:
+            self._slice(name, cat, url, start, end, args)
+
+    @contextmanager
+    def span(self, name: str, cat: str = 'stage', url: Optional[str] = None, **args: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, cat, started, time.perf_counter(), url, args)
+
+    def queued(self, url: str):
+        """Note that a URL entered a queue."""
+        now = time.perf_counter()
+        self._queued[url] = now
+        self._admitted.setdefault(url, now)
+
+    def dequeued(self, url: str, queue: str):
+        """Record the time a URL spent waiting in ``queue`` since it was queued."""
+        started = self._queued.pop(url, None)
+        if started is not None:
+            self._slice(f"wait: {queue}", 'queue', url, started, time.perf_counter())
+
+    def finished(self, url: str, kind: str, ok: bool = True):
+        """Record a URL's whole lifetime, from first being queued until now."""
+        self._queued.pop(url, None)
+        started = self._admitted.pop(url, None)
+        if started is not None:
+            self._slice(kind, 'url', url, started, time.perf_counter(), {'ok': ok})
+
+    def durations(self) -> Dict[str, List[float]]:
+        """Seconds of every recorded span and queue wait, by name.
+
+        Spans recorded on both a task and a URL track count once.
+        """
+        result: Dict[str, List[float]] = {}
+        begin: Optional[dict] = None
+        for event in self.events:
+            phase = event['ph']
+            if phase == 'X':
+                result.setdefault(event['name'], []).append(event['dur'] / 1_000_000)
+            elif phase == 'b':
+                begin = event
+            elif phase == 'e' and begin is not None and event['cat'] == 'queue':
+                # Async slices are appended as begin/end pairs
+                result.setdefault(event['name'], []).append((event['ts'] - begin['ts']) / 1_000_000)
+        return result
+
+    def add_profile(self, stacks: Counter):
+        self.stacks.update(stacks)
+
+    def write(self, path: str) -> Path:
+        """Write the trace as Chrome trace-event JSON."""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, 'w') as f:
+            json.dump({
+                'traceEvents': self.events,
+                'displayTimeUnit': 'ms',
+                'otherData': {'crawl': self.name, 'dropped_events': self.dropped},
+            }, f)
+        print(f"Trace written to {target} ({len(self.events)} events, {self.dropped} dropped)")
+        return target
+
+    def write_profile(self, path: str) -> Optional[Path]:
+        """Write the sampled conversion stacks in folded format; None if nothing was sampled."""
+        if not self.stacks:
+            return None
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Conversion profile written to {target} ({sum(self.stacks.values())} samples)")
+        return target
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+class SamplingProfiler:
+    """Sample one thread's stack at a fixed interval from a background thread.
+
+    Stacks are cut at the frame that entered the profiler, so they start at
+    the profiled code rather than at the worker's bootstrap.
+    """
+
+    def __init__(self, interval: float = 0.005, root: str = ''):
+        self.interval = interval
+        self.root = root
+        self.stacks: Counter = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._entry = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            frames = []
+            while frame is not None and frame is not self._entry:
+                frames.append(_frame_name(frame))
+                frame = frame.f_back
+            if self.root:
+                frames.append(self.root)
+            self.stacks[';'.join(reversed(frames))] += 1
+
+    def __enter__(self) -> 'SamplingProfiler':
+        self._entry = sys._getframe(1)
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._sampler.join()
+        return False
+
+
+def profiled_call(func: Callable[..., Any], interval: float, *args: Any) -> Tuple[Any, Counter]:
+    """Run ``func(*args)`` under the sampling profiler; returns (result, folded stacks).
+
+    Runs inside a conversion worker process.
+    """
+    with SamplingProfiler(interval, root=func.__name__) as profiler:
+        result = func(*args)
+    return result, profiler.stacks
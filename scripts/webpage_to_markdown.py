@@ -1,21 +1,33 @@
 import os
 import asyncio
-import boto3
-from typing import List, Optional
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, List, Optional, Union
 from urllib.parse import urlparse, urljoin
 import re
+import time
+from dataclasses import dataclass
 from crawl4ai.async_webcrawler import AsyncWebCrawler
 from crawl4ai.async_configs import CrawlerRunConfig, BrowserConfig
 from crawl4ai.models import CrawlResult
-from .document_processor import DocumentProcessor
-
-# S3 client setup
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_REGION', 'us-east-1')
-)
+from redis.asyncio import Redis
+from crawler.utils.config import CrawlConfig, config
+from .browser_pool import BrowserPool
+from .checkpoint import CrawlCheckpoint
+from .change_detection import fingerprint_page, open_crawl_database
+from .conversion_engine import ConversionEngine
+from .crawl_history import CrawlSession
+from .doc_types import DOCUMENT_EXTENSIONS, is_document_link
+from .document_processor import DocumentProcessor, HttpClientConfig
+from .pdf_engine import PdfConfig
+from .frontier import CrawlFrontier, ScopeFilter, SeenSet, canonicalize_url
+from .metrics import track
+from .pipeline import SKIP, Pipeline, Stage, StageStats
+from .politeness import host_slot
+from .redis_queue import RedisFrontier, RedisWorkQueue
+from .revalidation import Validators
+from .static_fetcher import StaticFetcher
+from .storage import StorageBackend, create_storage
+from .table_engine import TableConfig
+from .tracing import Tracer, current_tracer, use_tracer
 
 def url_to_key(url: str) -> str:
     """Convert URL to a valid S3 key."""
@@ -28,132 +40,696 @@ def url_to_key(url: str) -> str:
     key = re.sub(r'[^a-zA-Z0-9/.-]', '_', key)
     return key.strip('/')
 
-async def upload_to_s3(bucket: str, key: str, content: str) -> bool:
-    """Upload content to S3 bucket."""
-    try:
-        s3_client.put_object(
-            Bucket=bucket,
-            Key=key,
-            Body=content.encode('utf-8'),
-            ContentType='text/markdown'
-        )
-        return True
-    except Exception as e:
-        print(f"Error uploading to S3: {str(e)}")
-        return False
+async def store_markdown(
+    storage: Optional[StorageBackend],
+    s3_bucket: str,
+    key: str,
+    content: str
+) -> Optional[str]:
+    """Write markdown through a storage backend and return the key it was stored under.
+
+    Without a shared ``storage`` a backend is opened just for this object,
+    selected by the crawl configuration. With deduplicated storage the
+    returned key is the content-addressed object rather than ``key``.
+    """
+    if storage is not None:
+        return await storage.store(key, content)
+    async with create_storage(config, s3_bucket) as one_off:
+        return await one_off.store(key, content)
+
+async def after_stored(
+    storage: Optional[StorageBackend],
+    stored_key: str,
+    record: Callable[[], Awaitable[Any]],
+    checkpoint: Optional[CrawlCheckpoint],
+    kind: str,
+    url: str
+):
+    """Run ``record`` once the output stored under ``stored_key`` is written.
+
+    Sharded output is only written when its shard fills, so until then the
+    change-detection records are not made and the URL's checkpoint stays in
+    progress. If the output is never written, nothing is recorded and the
+    checkpoint puts the URL back in the queue.
+    """
+    if checkpoint is not None:
+        checkpoint.hold(kind, url)
+    
+    async def settle(written: bool):
+        try:
+            if written:
+                await record()
+            else:
+                print(f"Output for {url} was not written; it will be processed again")
+        finally:
+            if checkpoint is not None:
+                checkpoint.release(kind, url, written)
+    
+    if storage is None:
+        # Written and closed by store_markdown already
+        await settle(True)
+    else:
+        await storage.on_durable(stored_key, settle)
 
 def extract_document_urls(base_url: str, links: dict) -> List[str]:
-    """Extract URLs of documents from crawl results."""
-    document_extensions = ('.pdf', '.xls', '.xlsx', '.csv', '.doc', '.docx')
+    """Extract URLs of documents from crawl results.
+    
+    Besides links to document files, this includes download links such as
+    ``/download?id=123``; their type is found out when they are downloaded.
+    """
     document_urls = []
     
     # Check both internal and external links
     for link_type in ['internal', 'external']:
         if link_type in links:
             for link in links[link_type]:
-                if 'href' in link and any(link['href'].lower().endswith(ext) for ext in document_extensions):
+                if 'href' in link:
                     # Convert relative URLs to absolute URLs
                     url = link['href']
                     if not url.startswith(('http://', 'https://')):
                         url = urljoin(base_url, url)
-                    document_urls.append(url)
+                    if is_document_link(url):
+                        document_urls.append(url)
     
     return document_urls
 
-async def process_webpage(url: str, s3_bucket: str) -> Optional[List[str]]:
-    """Process a webpage and store its markdown in S3."""
+def extract_page_urls(base_url: str, links: dict) -> List[str]:
+    """Extract URLs of linked pages (anything that is not a document) from crawl results."""
+    page_urls = []
+    
+    for link_type in ['internal', 'external']:
+        for link in links.get(link_type, []):
+            href = link.get('href')
+            if not href:
+                continue
+            url = urljoin(base_url, href)
+            if is_document_link(url):
+                continue
+            if url.startswith(('http://', 'https://')):
+                page_urls.append(url)
+    
+    return page_urls
+
+def create_browser_pool(crawl_config: Optional[CrawlConfig] = None) -> BrowserPool:
+    """Build a browser pool sized from the crawl configuration."""
+    crawl_config = crawl_config or config
+    return BrowserPool(
+        browsers=crawl_config.browsers,
+        pages_per_browser=crawl_config.pages_per_browser,
+        max_pages_per_browser=crawl_config.browser_recycle_pages,
+        memory_ceiling_mb=crawl_config.browser_memory_mb or None
+    )
+
+def create_static_fetcher(crawl_config: Optional[CrawlConfig] = None) -> Optional[StaticFetcher]:
+    """Build the plain-HTTP page fetcher, or None if the fast path is disabled."""
+    crawl_config = crawl_config or config
+    if not crawl_config.static_fetch:
+        return None
+    return StaticFetcher(HttpClientConfig(
+        max_connections=crawl_config.http_max_connections,
+        max_connections_per_host=crawl_config.http_connections_per_host
+    ))
+
+async def render_webpage(url: str, browser_pool: Optional[BrowserPool] = None) -> CrawlResult:
+    """Render a page in a headless browser, pooled if a pool is given."""
+    # Configure crawler settings
+    crawler_config = CrawlerRunConfig(
+        download_files=True,
+        file_extensions=list(DOCUMENT_EXTENSIONS)
+    )
+    
+    # Run the crawler on a pooled browser, or a one-off one
+    if browser_pool is not None:
+        async with browser_pool.lease() as crawler:
+            return await crawler.arun(url=url, config=crawler_config)
+    
+    browser_config = BrowserConfig(
+        browser_type="chromium",
+        headless=True
+    )
+    async with AsyncWebCrawler(config=browser_config) as crawler:
+        return await crawler.arun(url=url, config=crawler_config)
+
+@dataclass
+class PageResult:
+    """Outcome of processing one page: where it links to."""
+    url: str
+    document_urls: List[str]
+    page_urls: List[str]
+
+@dataclass
+class ConvertedDocument:
+    """Output of the convert stage for one document."""
+    url: str
+    markdown: Optional[str]  # None when there is nothing new to store
+    raw_hash: Optional[str] = None
+    validators: Optional[Validators] = None
+    storage_key: Optional[str] = None  # stored conversion of the same bytes, reused as is
+
+async def crawl_page(
+    url: str,
+    s3_bucket: str,
+    browser_pool: Optional[BrowserPool] = None,
+    static_fetcher: Optional[StaticFetcher] = None,
+    crawl_session: Optional[CrawlSession] = None,
+    storage: Optional[StorageBackend] = None
+) -> Optional[PageResult]:
+    """Fetch a page, store its markdown and return the links it contains.
+
+    With a ``static_fetcher`` the page is first fetched over plain HTTP and
+    only rendered in a browser when it looks JavaScript-dependent. Pass a
+    shared ``browser_pool`` to render with an already running browser;
+    without one a browser is launched just for this page. With a
+    ``crawl_session``, pages answering 304 to the validators of the last
+    crawl, or unchanged since then, are not uploaded again; their links are
+    still returned, and requests respect the session's per-host politeness
+    limits.
+    """
+    change_detector = crawl_session.change_detector if crawl_session is not None else None
+    validator_store = crawl_session.validators if crawl_session is not None else None
+    scheduler = crawl_session.scheduler if crawl_session is not None else None
     try:
-        # Configure browser settings
-        browser_config = BrowserConfig(
-            browser_type="chromium",
-            headless=True
-        )
-        
-        # Configure crawler settings
-        crawler_config = CrawlerRunConfig(
-            download_files=True,
-            file_extensions=['.pdf', '.xls', '.xlsx', '.csv', '.doc', '.docx']
-        )
-        
-        # Initialize and run crawler
-        async with AsyncWebCrawler(config=browser_config) as crawler:
-            result: CrawlResult = await crawler.arun(
+        page = await static_fetcher.fetch(url, validator_store, scheduler) if static_fetcher is not None else None
+        if page is not None and page.not_modified:
+            print(f"Not modified since last crawl: {url}")
+            return PageResult(
+                url=url,
+                document_urls=page.validators.document_urls,
+                page_urls=page.validators.page_urls
+            )
+        if page is not None:
+            markdown_content, links = page.markdown, page.links
+            validators = page.validators
+        else:
+            # Taken before the browser lease so waiting never ties up a browser
+            async with host_slot(scheduler, url) as slot:
+                with track('render', url) as span:
+                    result = await render_webpage(url, browser_pool)
+                    if not result.success:
+                        span.fail()
+                # Render time says little about the server, so only the status counts
+                if result.status_code is not None:
+                    headers = {k.lower(): v for k, v in (result.response_headers or {}).items()}
+                    slot.record(result.status_code, headers.get('retry-after'), timed=False)
+            if not result.success:
+                print(f"Failed to crawl {url}: {result.error_message}")
+                return None
+            markdown_content, links = result.markdown, result.links
+            validators = Validators.from_headers(result.response_headers, len(result.html or ''))
+            
+        if isinstance(markdown_content, str):
+            page_result = PageResult(
                 url=url,
-                config=crawler_config
+                document_urls=extract_document_urls(url, links),
+                page_urls=extract_page_urls(url, links)
             )
+            markdown_key = f"pages/{url_to_key(url)}.md"
             
-            if result.success:
-                # Get markdown content
-                markdown_content = result.markdown
-                if isinstance(markdown_content, str):
-                    # Upload markdown to S3
-                    markdown_key = f"pages/{url_to_key(url)}.md"
-                    success = await upload_to_s3(s3_bucket, markdown_key, markdown_content)
-                    
-                    if success:
-                        print(f"Successfully uploaded markdown for {url}")
-                        # Extract and return document URLs
-                        return extract_document_urls(url, result.links)
-                    else:
-                        print(f"Failed to upload markdown for {url}")
-                else:
-                    print(f"No markdown content generated for {url}")
+            if validators is not None and validator_store is not None:
+                validators.page_urls = page_result.page_urls
+                validators.document_urls = page_result.document_urls
+            
+            fingerprint = None
+            if change_detector is not None:
+                fingerprint = fingerprint_page(markdown_content)
+                if await change_detector.page_unchanged(url, fingerprint):
+                    print(f"Unchanged since last crawl, skipping upload: {url}")
+                    if validators is not None and validator_store is not None:
+                        await validator_store.save(url, validators)
+                    return page_result
+            
+            # Store the markdown in S3 or on the local filesystem
+            stored_key = await store_markdown(storage, s3_bucket, markdown_key, markdown_content)
+            
+            if stored_key is not None:
+                print(f"Successfully stored markdown for {url}")
+                
+                async def record():
+                    if fingerprint is not None:
+                        await change_detector.record_page(url, fingerprint, stored_key)
+                    if validators is not None and validator_store is not None:
+                        await validator_store.save(url, validators)
+                
+                checkpoint = crawl_session.checkpoint if crawl_session is not None else None
+                await after_stored(storage, stored_key, record, checkpoint, 'page', url)
+                return page_result
             else:
-                print(f"Failed to crawl {url}: {result.error_message}")
+                print(f"Failed to store markdown for {url}")
+        else:
+            print(f"No markdown content generated for {url}")
                 
     except Exception as e:
         print(f"Error processing webpage {url}: {str(e)}")
     
     return None
 
-async def process_documents(document_urls: List[str], s3_bucket: str):
-    """Process document URLs and convert them to markdown."""
+async def process_webpage(
+    url: str,
+    s3_bucket: str,
+    browser_pool: Optional[BrowserPool] = None,
+    static_fetcher: Optional[StaticFetcher] = None,
+    crawl_session: Optional[CrawlSession] = None,
+    storage: Optional[StorageBackend] = None
+) -> Optional[List[str]]:
+    """Process a single webpage and return the document URLs it links to."""
+    page = await crawl_page(url, s3_bucket, browser_pool, static_fetcher, crawl_session, storage)
+    return page.document_urls if page is not None else None
+
+async def crawl_site(
+    url: str,
+    s3_bucket: str,
+    browser_pool: Optional[BrowserPool] = None,
+    static_fetcher: Optional[StaticFetcher] = None,
+    crawl_config: Optional[CrawlConfig] = None,
+    frontier: Optional[Union[CrawlFrontier, RedisFrontier]] = None,
+    document_queue: Optional[RedisWorkQueue] = None,
+    crawl_session: Optional[CrawlSession] = None,
+    storage: Optional[StorageBackend] = None,
+    on_page: Optional[Callable[[str, bool], Awaitable[Any]]] = None
+) -> List[str]:
+    """Crawl outward from a seed page and return every document URL found.
+
+    Pages are visited breadth-first up to ``max_depth`` links from the seed,
+    limited to the seed's domain (and optionally its subdomains) as set in
+    the crawl configuration. Pass a shared ``frontier`` and ``document_queue``
+    to crawl together with other workers; documents then go to the queue
+    instead of being returned. Pages are written through ``storage``, or
+    through the backend the crawl configuration selects. ``on_page(url, ok)``
+    is awaited once per visited page. When the ``crawl_session`` is
+    checkpointed, the frontier and the documents found are checkpointed too;
+    for a resumed session, the crawl continues from the checkpoint and the
+    documents it had not processed yet are returned with the new ones.
+    """
+    crawl_config = crawl_config or config
+    if frontier is None:
+        frontier = CrawlFrontier(
+            ScopeFilter.from_config(url, crawl_config),
+            max_depth=crawl_config.max_depth,
+            max_pages=crawl_config.max_pages
+        )
+    
+    seen_documents = SeenSet(initial_capacity=100_000)
+    document_urls: List[str] = []
+    # Shared frontiers keep their own state in Redis
+    checkpoint = crawl_session.checkpoint if crawl_session is not None and document_queue is None else None
+    if checkpoint is not None and isinstance(frontier, CrawlFrontier):
+        frontier.checkpoint = checkpoint
+        restored = checkpoint.restored
+        if restored is not None:
+            frontier.restore(restored.seen_pages, restored.pages, restored.pages_done + restored.pages_failed)
+            for document_url in restored.seen_documents:
+                seen_documents.add(canonicalize_url(document_url) or document_url)
+            document_urls.extend(restored.documents)
+    
+    async def visit(page_url: str, depth: int) -> Optional[List[str]]:
+        page = await crawl_page(page_url, s3_bucket, browser_pool, static_fetcher, crawl_session, storage)
+        if on_page is not None:
+            await on_page(page_url, page is not None)
+        if page is None:
+            return None
+        for document_url in page.document_urls:
+            canonical = canonicalize_url(document_url) or document_url
+            if document_queue is not None:
+                await document_queue.put(document_url, dedup_key=canonical)
+            elif seen_documents.add(canonical):
+                document_urls.append(document_url)
+                if checkpoint is not None:
+                    checkpoint.queued('document', document_url)
+        return page.page_urls
+    
+    owns_storage = storage is None
+    if owns_storage:
+        storage = create_storage(crawl_config, s3_bucket)
+        await storage.open()
     try:
-        processor = DocumentProcessor()
+        stats = await frontier.run(visit, concurrency=crawl_config.parallel_pages, seeds=[url])
+    finally:
+        if owns_storage:
+            await storage.close()
+    print(
+        f"Crawled {stats.visited} pages ({stats.failed} failed, "
+        f"{stats.out_of_scope} out of scope, {stats.duplicates} duplicate links)"
+    )
+    if crawl_session is not None and crawl_session.recorder is not None:
+        crawl_session.recorder.total_pages += stats.visited
+        crawl_session.recorder.error_count += stats.failed
+    return document_urls
+
+async def process_documents(
+    document_urls: Union[Iterable[str], AsyncIterable[str]],
+    s3_bucket: str,
+    crawl_config: Optional[CrawlConfig] = None,
+    on_complete: Optional[Callable[[str, bool], Awaitable[Any]]] = None,
+    crawl_session: Optional[CrawlSession] = None,
+    storage: Optional[StorageBackend] = None
+) -> List[StageStats]:
+    """Process document URLs and convert them to markdown.
+
+    Documents flow through separate download, convert and upload stages,
+    each with its own concurrency limit taken from the crawl configuration.
+    ``document_urls`` may be an async iterable, such as the items of a shared
+    work queue; ``on_complete(url, ok)`` is awaited once per document. With a
+    ``crawl_session``, downloads are conditional on the validators of the
+    last crawl, and documents that answer 304 or whose bytes match the last
+    converted version skip conversion and upload. Documents whose bytes were
+    already converted under another URL reuse that conversion. When the crawl
+    is traced with profiling on, the conversion workers are profiled too, and
+    when it is checkpointed, so is the progress of every document.
+    """
+    crawl_config = crawl_config or config
+    tracer = current_tracer()
+    change_detector = crawl_session.change_detector if crawl_session is not None else None
+    validator_store = crawl_session.validators if crawl_session is not None else None
+    checkpoint = crawl_session.checkpoint if crawl_session is not None else None
+    if checkpoint is not None:
+        report_complete = on_complete
         
-        for url in document_urls:
+        async def on_complete(url: str, ok: bool):
+            checkpoint.done('document', url, ok)
+            if report_complete is not None:
+                await report_complete(url, ok)
+    stats: List[StageStats] = []
+    http_config = HttpClientConfig(
+        max_connections=crawl_config.http_max_connections,
+        max_connections_per_host=crawl_config.http_connections_per_host,
+        spool_threshold=crawl_config.spool_threshold_mb * 1024 * 1024,
+        max_download_bytes=crawl_config.max_download_mb * 1024 * 1024,
+        probe=crawl_config.probe_documents
+    )
+    try:
+        engine = ConversionEngine(
+            workers=crawl_config.conversion_workers or None,
+            job_timeout=crawl_config.conversion_timeout,
+            max_jobs_per_worker=crawl_config.conversion_max_jobs_per_worker,
+            profile_interval=tracer.profile_interval if tracer is not None else None
+        )
+        scheduler = crawl_session.scheduler if crawl_session is not None else None
+        pdf_config = PdfConfig(
+            max_pages=crawl_config.pdf_max_pages,
+            max_chars=crawl_config.pdf_max_chars,
+            chunk_pages=crawl_config.pdf_chunk_pages
+        )
+        table_config = TableConfig(
+            max_rows=crawl_config.table_max_rows,
+            max_columns=crawl_config.table_max_columns,
+            chunk_rows=crawl_config.table_chunk_rows
+        )
+        processor = DocumentProcessor(http_config, engine, validator_store, scheduler, pdf_config, table_config)
+        owns_storage = storage is None
+        if owns_storage:
+            storage = create_storage(crawl_config, s3_bucket)
+        
+        async def download(url: str):
             print(f"Processing document: {url}")
+            if checkpoint is not None:
+                checkpoint.leased('document', url)
+            download = await processor.download_file(url)
+            if download is None:
+                # Unsupported and oversized documents are skipped, not failed
+                return SKIP if processor.take_skipped(url) else None
+            return url, download
+        
+        async def reuse_conversion(url: str, raw_hash: str) -> Optional[ConvertedDocument]:
+            """An earlier conversion of the same bytes, if one is stored."""
+            if change_detector is None:
+                return None
+            existing_key = await change_detector.find_conversion(raw_hash)
+            if existing_key is None:
+                return None
+            if storage.content_addressed and existing_key.startswith('objects/'):
+                # Already stored once by content; just reference it
+                return ConvertedDocument(url, None, raw_hash, storage_key=existing_key)
+            body = await storage.read(existing_key)
+            if body is None:
+                return None
+            return ConvertedDocument(url, body.decode('utf-8'), raw_hash)
+        
+        async def convert(item):
+            url, download = item
+            # The spooled body is only needed until conversion finishes
+            with download:
+                if download.not_modified:
+                    print(f"Not modified since last crawl: {url}")
+                    return ConvertedDocument(url, None)
+                raw_hash = download.sha256
+                if change_detector is not None and await change_detector.document_unchanged(url, raw_hash):
+                    print(f"Unchanged since last crawl, skipping: {url}")
+                    return ConvertedDocument(url, None, raw_hash, download.validators)
+                reused = await reuse_conversion(url, raw_hash)
+                if reused is not None:
+                    print(f"Same content already converted, reusing: {url}")
+                    reused.validators = download.validators
+                    return reused
+                markdown_content = await processor.convert_document(url, download)
+            if not markdown_content:
+                if processor.take_skipped(url):
+                    return SKIP
+                print(f"Failed to convert document {url}")
+                if change_detector is not None:
+                    await change_detector.record_document(url, raw_hash, 'failed')
+                return None
+            return ConvertedDocument(url, markdown_content, raw_hash, download.validators)
+        
+        async def upload(document: ConvertedDocument):
+            url, validators = document.url, document.validators
+            stored_key = document.storage_key
+            # Generate the storage key for the document
+            doc_key = f"documents/{url_to_key(url)}.md"
+            if stored_key is not None and not await storage.link(doc_key, stored_key):
+                print(f"Failed to store converted document {url}")
+                return None
+            if document.markdown is not None:
+                stored_key = await storage.store(doc_key, document.markdown)
+                if stored_key is None:
+                    print(f"Failed to store converted document {url}")
+                    return None
+                print(f"Successfully converted and stored {url}")
             
-            # Convert document to markdown
-            markdown_content = await processor.process_document(url)
+            async def record():
+                if stored_key is not None and change_detector is not None:
+                    await change_detector.record_document(url, document.raw_hash, storage_path=stored_key)
+                if validators is not None and validator_store is not None:
+                    await validator_store.save(url, validators)
             
-            if markdown_content:
-                # Generate S3 key for the document
-                doc_key = f"documents/{url_to_key(url)}.md"
-                
-                # Upload to S3
-                success = await upload_to_s3(s3_bucket, doc_key, markdown_content)
-                
-                if success:
-                    print(f"Successfully converted and uploaded {url}")
-                else:
-                    print(f"Failed to upload converted document {url}")
+            if stored_key is not None:
+                await after_stored(storage, stored_key, record, checkpoint, 'document', url)
             else:
-                print(f"Failed to convert document {url}")
+                await record()
+            return url
+        
+        pipeline = Pipeline([
+            Stage('download', download, crawl_config.parallel_downloads),
+            Stage('convert', convert, crawl_config.parallel_conversions),
+            Stage('upload', upload, crawl_config.parallel_uploads),
+        ], on_complete=on_complete, name='document')
+        async with engine, processor:
+            if owns_storage:
+                await storage.open()
+            try:
+                stats = await pipeline.run(document_urls)
+            finally:
+                if owns_storage:
+                    await storage.close()
+                if tracer is not None:
+                    tracer.add_profile(engine.stacks)
+        pipeline.report()
+        if processor.skipped:
+            reasons = ', '.join(f"{count} {reason}" for reason, count in processor.skipped.items())
+            print(
+                f"Skipped {sum(processor.skipped.values())} documents ({reasons}); "
+                f"{processor.bytes_avoided / 1024 / 1024:.1f} MB not transferred"
+            )
+        if crawl_session is not None and crawl_session.recorder is not None:
+            crawl_session.recorder.total_documents += stats[-1].completed
+            crawl_session.recorder.error_count += sum(s.failed + s.dropped for s in stats)
                 
     except Exception as e:
         print(f"Error in document processing: {str(e)}")
+    
+    return stats
+
+async def crawl_distributed(
+    url: str,
+    s3_bucket: str,
+    crawl_id: str,
+    redis_url: Optional[str] = None,
+    skip_docs: bool = False,
+    crawl_config: Optional[CrawlConfig] = None
+):
+    """Join a crawl shared through Redis with every other worker using the same crawl id.
 
-async def main(url: str, s3_bucket: str):
+    Each worker takes leases on pages and then documents from the shared
+    queues until both are drained; leases of crashed workers are re-queued.
+    """
+    crawl_config = crawl_config or config
+    redis = Redis.from_url(redis_url or crawl_config.redis_url)
+    db = open_crawl_database(crawl_config)
+    # The shared queues in Redis already survive a worker restart
+    crawl_session = CrawlSession(db, crawl_config, checkpoints=False)
+    await crawl_session.start(url, s3_bucket, skip_docs)
+    status = 'failed'
+    try:
+        frontier = RedisFrontier(
+            redis,
+            crawl_id,
+            ScopeFilter.from_config(url, crawl_config),
+            max_depth=crawl_config.max_depth,
+            max_pages=crawl_config.max_pages,
+            visibility_timeout=crawl_config.lease_timeout
+        )
+        document_queue = RedisWorkQueue(redis, crawl_id, 'documents', crawl_config.lease_timeout)
+        
+        static_fetcher = create_static_fetcher(crawl_config)
+        async with create_storage(crawl_config, s3_bucket) as storage:
+            async with create_browser_pool(crawl_config) as browser_pool:
+                try:
+                    await crawl_site(
+                        url, s3_bucket, browser_pool, static_fetcher, crawl_config,
+                        frontier=frontier,
+                        document_queue=document_queue,
+                        crawl_session=crawl_session,
+                        storage=storage
+                    )
+                finally:
+                    if static_fetcher is not None:
+                        await static_fetcher.close()
+            
+            if not skip_docs:
+                async with document_queue:
+                    await process_documents(
+                        document_queue.items(), s3_bucket, crawl_config,
+                        on_complete=document_queue.ack,
+                        crawl_session=crawl_session,
+                        storage=storage
+                    )
+        print(f"Crawl {crawl_id} counters: {await document_queue.counters()}")
+        status = 'completed'
+    finally:
+        await redis.aclose()
+        await crawl_session.finish(status)
+        if db is not None:
+            db.dispose()
+
+async def _crawl(url: str, s3_bucket: str, skip_docs: bool, crawl_session: CrawlSession):
+    """Crawl the site and then its documents within a started or resumed session."""
+    static_fetcher = create_static_fetcher()
+    async with create_storage(config, s3_bucket) as storage:
+        async with create_browser_pool() as browser_pool:
+            # Crawl the site and collect document URLs
+            try:
+                document_urls = await crawl_site(
+                    url, s3_bucket, browser_pool, static_fetcher,
+                    crawl_session=crawl_session,
+                    storage=storage
+                )
+            finally:
+                if static_fetcher is not None:
+                    await static_fetcher.close()
+        
+        if document_urls and not skip_docs:
+            print(f"Found {len(document_urls)} documents to process")
+            # Process the found documents
+            await process_documents(
+                document_urls, s3_bucket,
+                crawl_session=crawl_session,
+                storage=storage
+            )
+        elif not document_urls:
+            print("No documents found or webpage processing failed")
+
+async def main(url: str, s3_bucket: str, skip_docs: bool = False):
     """Main function to orchestrate the webpage and document processing."""
-    # Process the webpage and get document URLs
-    document_urls = await process_webpage(url, s3_bucket)
-    
-    if document_urls:
-        print(f"Found {len(document_urls)} documents to process")
-        # Process the found documents
-        await process_documents(document_urls, s3_bucket)
-    else:
-        print("No documents found or webpage processing failed")
+    db = open_crawl_database(config)
+    crawl_session = CrawlSession(db, config)
+    await crawl_session.start(url, s3_bucket, skip_docs)
+    if crawl_session.crawl_id is not None:
+        print(f"Crawl id {crawl_session.crawl_id}; resume it after an interruption with: resume {crawl_session.crawl_id}")
+    status = 'failed'
+    try:
+        await _crawl(url, s3_bucket, skip_docs, crawl_session)
+        status = 'completed'
+    finally:
+        await crawl_session.finish(status)
+        if db is not None:
+            db.dispose()
+
+async def resume(crawl_id: int, skip_docs: Optional[bool] = None):
+    """Continue an interrupted crawl from its last checkpoint, without redoing finished pages and documents."""
+    db = open_crawl_database(config)
+    if db is None:
+        raise SystemExit("Resuming a crawl needs the crawl database")
+    crawl_session = CrawlSession(db, config)
+    try:
+        state = await crawl_session.resume(crawl_id)
+    except ValueError as e:
+        db.dispose()
+        raise SystemExit(str(e))
+    status = 'failed'
+    try:
+        await _crawl(
+            state.start_url,
+            state.s3_bucket or '',
+            state.skip_docs if skip_docs is None else skip_docs,
+            crawl_session
+        )
+        status = 'completed'
+    finally:
+        await crawl_session.finish(status)
+        db.dispose()
 
 if __name__ == "__main__":
     import argparse
+    import sys
     
-    parser = argparse.ArgumentParser(description='Convert webpage and its documents to markdown')
-    parser.add_argument('url', help='URL of the webpage to process')
-    parser.add_argument('s3_bucket', help='S3 bucket to store the markdown files')
-    parser.add_argument('--skip-docs', action='store_true', help='Skip processing of linked documents')
+    # "resume <crawl_id>" continues an interrupted crawl from its checkpoint
+    resuming = len(sys.argv) > 1 and sys.argv[1] == 'resume'
+    if resuming:
+        parser = argparse.ArgumentParser(
+            prog=f"{os.path.basename(sys.argv[0])} resume",
+            description='Resume an interrupted crawl from its last checkpoint'
+        )
+        parser.add_argument('crawl_id', type=int, help='Id of the crawl, as printed when it started')
+        parser.add_argument(
+            '--skip-docs', action='store_true', default=None,
+            help='Skip processing of linked documents (default: as when the crawl started)'
+        )
+    else:
+        parser = argparse.ArgumentParser(description='Convert webpage and its documents to markdown')
+        parser.add_argument('url', help='URL of the webpage to process')
+        parser.add_argument('s3_bucket', help='S3 bucket to store the markdown files (when CRAWL_USE_S3=true; otherwise files go to CRAWL_STORAGE_PATH)')
+        parser.add_argument('--skip-docs', action='store_true', help='Skip processing of linked documents')
+        parser.add_argument('--crawl-id', help='Join the distributed crawl with this id (shared through Redis)')
+        parser.add_argument('--redis-url', help='Redis URL for distributed crawls (default: CRAWL_REDIS_URL)')
+    parser.add_argument(
+        '--trace', nargs='?', const='', metavar='PATH',
+        help='Write a trace timeline (Chrome trace JSON, opens in Perfetto) to PATH '
+             '(default: CRAWL_TRACE_DIR/crawl-<time>.json)'
+    )
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='With --trace, also sample the conversion workers and write a folded-stack profile next to the trace'
+    )
     
-    args = parser.parse_args()
+    args = parser.parse_args(sys.argv[2:] if resuming else None)
+    if args.profile and args.trace is None:
+        parser.error('--profile requires --trace')
     
-    asyncio.run(main(args.url, args.s3_bucket))
+    tracer = None
+    if args.trace is not None:
+        trace_path = args.trace or os.path.join(config.trace_dir, time.strftime('crawl-%Y%m%d-%H%M%S.json'))
+        name = f"crawl {args.crawl_id}" if resuming else args.url
+        tracer = Tracer(name, profile_interval=config.profile_interval if args.profile else None)
+    
+    # Tasks of the crawl inherit the tracer from this context
+    with use_tracer(tracer):
+        try:
+            if resuming:
+                asyncio.run(resume(args.crawl_id, args.skip_docs))
+            elif args.crawl_id:
+                asyncio.run(crawl_distributed(args.url, args.s3_bucket, args.crawl_id, args.redis_url, args.skip_docs))
+            else:
+                asyncio.run(main(args.url, args.s3_bucket, args.skip_docs))
+        finally:
+            if tracer is not None:
+                tracer.write(trace_path)
+                tracer.write_profile(os.path.splitext(trace_path)[0] + '.folded')
@@ -0,0 +1,217 @@
+"""
+Write-behind buffer for the crawl database.
+
+Crawl workers hand rows to a ``WriteBuffer`` instead of opening a session and
+committing per URL. Rows are kept in memory and a background task writes them
+in bulk, one transaction per batch:
+
+- ``insert`` rows go out as one multi-row INSERT per table
+- ``upsert`` rows go out as one INSERT ... ON CONFLICT DO UPDATE per table;
+  rows for the same key within a batch are collapsed to the latest
+- a batch is written every ``interval`` seconds, or sooner once
+  ``batch_size`` rows are waiting
+- once ``max_pending`` rows are waiting, ``insert`` and ``upsert`` wait for
+  the writer to take them, so a slow database slows the crawl down instead of
+  growing the buffer without bound
+
+A batch that fails to write is retried ``retries`` times, waiting
+``retry_delay`` seconds and doubling the wait each time. If it still fails,
+its rows are written one at a time, so a single bad row only loses itself;
+rows that fail on their own are reported, counted in ``failed`` and dropped,
+so a database outage cannot stall the crawl. Rows are only visible to other
+sessions once written; callers keep their own in-memory view of what they
+recorded (see ``ChangeDetector`` and ``ValidatorStore``).
+"""
+
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from crawler.database import DatabaseManager
+from .metrics import track
+
+
+def dialect_insert(db: DatabaseManager, model):
+    """An INSERT for ``model`` that supports ``on_conflict_do_update`` on the database's dialect."""
+    dialect = db.engine.dialect.name
+    return (postgresql if dialect == 'postgresql' else sqlite).insert(model)
+
+
+class WriteBuffer:
+    """Collect rows from crawl workers and write them to the crawl database in bulk."""
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        batch_size: int = 500,
+        interval: float = 1.0,
+        max_pending: int = 5000,
+        retries: int = 3,
+        retry_delay: float = 0.5
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max(max_pending, batch_size)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.retried = 0
+        self.waits = 0
+        self._inserts: Dict[type, List[dict]] = {}
+        self._upserts: Dict[Tuple[type, str], Dict[object, dict]] = {}
+        self._pending = 0
+        self._space = asyncio.Event()
+        self._space.set()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def _reserve(self):
+        if self._closed:
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='db-write-buffer')
+        if self._pending >= self.max_pending:
+            self.waits += 1
+            self._wake.set()
+            while self._pending >= self.max_pending:
+                self._space.clear()
+                await self._space.wait()
+
+    def _added(self):
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self._wake.set()
+
+    async def insert(self, model, row: dict):
+        """Queue a row to insert into ``model``'s table; waits while the buffer is full."""
+        await self._reserve()
+        self._inserts.setdefault(model, []).append(row)
+        self._added()
+        if self._closed:
+            await self.flush()
+
+    async def upsert(self, model, row: dict, key: str):
+        """Queue a row to insert, or to update the row with the same unique ``key`` column."""
+        await self._reserve()
+        rows = self._upserts.setdefault((model, key), {})
+        if row[key] not in rows:
+            self._added()
+        rows[row[key]] = row
+        if self._closed:
+            await self.flush()
+
+    def _write(self, inserts: Dict[type, List[dict]], upserts: Dict[Tuple[type, str], Dict[object, dict]]):
+        with track('db_write'), self.db.get_session() as session:
+            for model, rows in inserts.items():
+                session.execute(insert(model), rows)
+            for (model, key), keyed in upserts.items():
+                rows = list(keyed.values())
+                statement = dialect_insert(self.db, model)
+                session.execute(statement.on_conflict_do_update(
+                    index_elements=[key],
+                    set_={column: statement.excluded[column] for column in rows[0] if column != key}
+                ), rows)
+            session.commit()
+
+    def _write_each(self, inserts: Dict[type, List[dict]], upserts: Dict[Tuple[type, str], Dict[object, dict]]) -> int:
+        """Write rows one transaction each; returns how many were written."""
+        written = 0
+        rows = [({model: [row]}, {}) for model, model_rows in inserts.items() for row in model_rows]
+        rows += [
+            ({}, {(model, key): {value: row}})
+            for (model, key), keyed in upserts.items()
+            for value, row in keyed.items()
+        ]
+        for single_insert, single_upsert in rows:
+            try:
+                self._write(single_insert, single_upsert)
+                written += 1
+            except Exception as e:
+                print(f"Dropping a row the crawl database refused: {str(e)}")
+        return written
+
+    async def _write_batch(
+        self,
+        inserts: Dict[type, List[dict]],
+        upserts: Dict[Tuple[type, str], Dict[object, dict]],
+        count: int
+    ) -> bool:
+        """Write a batch in one transaction, retrying with backoff; returns whether it was written."""
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                await asyncio.to_thread(self._write, inserts, upserts)
+                return True
+            except Exception as e:
+                print(f"Error writing {count} rows to the crawl database (attempt {attempt + 1}): {str(e)}")
+            if attempt < self.retries:
+                self.retried += 1
+                await asyncio.sleep(delay)
+                delay *= 2
+        return False
+
+    async def flush(self):
+        """Write every waiting row now."""
+        async with self._lock:
+            if not self._pending:
+                return
+            inserts, self._inserts = self._inserts, {}
+            upserts, self._upserts = self._upserts, {}
+            count, self._pending = self._pending, 0
+            self._space.set()
+            if await self._write_batch(inserts, upserts, count):
+                self.written += count
+                self.batches += 1
+                return
+            # Keep whatever can be written, so one bad row only costs itself
+            written = await asyncio.to_thread(self._write_each, inserts, upserts)
+            self.written += written
+            self.failed += count - written
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def close(self):
+        """Stop the background writer and write what is left; later rows are written straight away."""
+        self._closed = True
+        if self._task is not None:
+            # Let a write in progress finish rather than cancel it half way
+            self._wake.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def summary(self) -> str:
+        return (
+            f"{self.written} rows in {self.batches} batches, {self.retried} retries, "
+            f"{self.failed} rows dropped, {self.waits} waits for a full buffer"
+        )
+
+
+def create_write_buffer(crawl_config, db: Optional[DatabaseManager]) -> Optional[WriteBuffer]:
+    """Build the crawl database's write buffer from the configuration, or None without a database."""
+    if db is None:
+        return None
+    return WriteBuffer(
+        db,
+        batch_size=crawl_config.db_batch_size,
+        interval=crawl_config.db_flush_interval,
+        max_pending=crawl_config.db_max_pending
+    )
@@ -0,0 +1,58 @@
+import sqlite3
+from dataclasses import replace
+
+import pytest
+from sqlalchemy import inspect
+
+from crawler.database import DatabaseManager, SchemaError
+from crawler.database.models import ContentVersion
+from crawler.utils.config import config
+
+
+def sqlite_config(path):
+    return replace(config, db_type='sqlite', local_storage_path=str(path))
+
+
+def test_missing_nullable_columns_and_indexes_are_added(tmp_path):
+    db_config = sqlite_config(tmp_path)
+    # content_versions as created before storage targets were recorded
+    connection = sqlite3.connect(db_config.db_uri.replace('sqlite:///', ''))
+    connection.execute(
+        "CREATE TABLE content_versions (id INTEGER PRIMARY KEY, url_hash VARCHAR(64), url VARCHAR(2048), "
+        "content_hash VARCHAR(64), structural_hash VARCHAR(64), created_at DATETIME, crawl_id INTEGER, "
+        "storage_type VARCHAR(10), storage_path VARCHAR(1024))"
+    )
+    connection.commit()
+    connection.close()
+
+    db = DatabaseManager(db_config)
+    try:
+        db.create_database()
+        inspector = inspect(db.engine)
+        assert 'storage_target' in {column['name'] for column in inspector.get_columns('content_versions')}
+        assert 'ix_content_versions_url_hash' in {index['name'] for index in inspector.get_indexes('content_versions')}
+
+        with db.get_session() as session:
+            session.add(ContentVersion(url_hash='a' * 64, url='https://example.com/', storage_target='s3://bucket'))
+            session.commit()
+
+        # Upgrading an up-to-date database changes nothing
+        db.create_database()
+    finally:
+        db.dispose()
+
+
+def test_columns_that_cannot_be_added_are_refused(tmp_path):
+    db_config = sqlite_config(tmp_path)
+    connection = sqlite3.connect(db_config.db_uri.replace('sqlite:///', ''))
+    # http_validators without its primary key
+    connection.execute("CREATE TABLE http_validators (url_hash VARCHAR(64), url VARCHAR(2048))")
+    connection.commit()
+    connection.close()
+
+    db = DatabaseManager(db_config)
+    try:
+        with pytest.raises(SchemaError, match='http_validators'):
+            db.create_database()
+    finally:
+        db.dispose()
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from scripts.pipeline import SKIP, Pipeline, Stage
+
+
+def build(completed):
+    async def double(item):
+        await asyncio.sleep(0.01)
+        return item * 2
+
+    async def keep_even(item):
+        if item == 6:
+            return SKIP
+        return item if item % 4 == 0 else None
+
+    async def on_complete(item, ok):
+        completed[item] = ok
+
+    return Pipeline(
+        [Stage('double', double, 2), Stage('filter', keep_even, 1)],
+        queue_factor=1,
+        on_complete=on_complete
+    )
+
+
+def test_items_complete_with_their_outcome():
+    completed = {}
+    pipeline = build(completed)
+    stats = asyncio.run(pipeline.run(range(5)))
+    # Doubled, 0, 4 and 8 pass the filter, 6 is skipped and 2 is dropped
+    assert completed == {0: True, 1: False, 2: True, 3: True, 4: True}
+    assert stats[0].completed == 5
+    assert (stats[1].completed, stats[1].dropped, stats[1].skipped) == (3, 1, 1)
+
+
+def test_failing_input_finishes_fed_items_and_raises():
+    def items():
+        yield from range(4)
+        raise ValueError('broken input')
+
+    completed = {}
+    pipeline = build(completed)
+    with pytest.raises(ValueError, match='broken input'):
+        asyncio.run(asyncio.wait_for(pipeline.run(items()), 5))
+    assert sorted(completed) == [0, 1, 2, 3]
+
+
+def test_failing_async_input_finishes_fed_items_and_raises():
+    async def items():
+        for item in range(3):
+            yield item
+        raise ValueError('queue went away')
+
+    completed = {}
+    pipeline = build(completed)
+    with pytest.raises(ValueError, match='queue went away'):
+        asyncio.run(asyncio.wait_for(pipeline.run(items()), 5))
+    assert sorted(completed) == [0, 1, 2]
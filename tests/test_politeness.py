@@ -0,0 +1,42 @@
+import asyncio
+
+from scripts.politeness import PolitenessConfig, PolitenessScheduler
+
+URL = 'https://example.com/page'
+
+
+def render(scheduler: PolitenessScheduler, status: int, count: int):
+    """Record ``count`` browser renders that finished with ``status``."""
+    async def run():
+        for _ in range(count):
+            async with scheduler.slot(URL) as slot:
+                slot.record(status, timed=False)
+    asyncio.run(run())
+
+
+def test_successful_renders_raise_the_cap():
+    scheduler = PolitenessScheduler(PolitenessConfig(rate=1000, burst=1000, max_concurrency=6))
+    render(scheduler, 200, 40)
+    state = scheduler.hosts['example.com']
+    assert state.cap == 6
+    assert state.latency == 0  # render time is not a server latency
+
+
+def test_throttled_renders_lower_the_cap():
+    scheduler = PolitenessScheduler(PolitenessConfig(rate=1000, burst=1000, initial_concurrency=4.0))
+    render(scheduler, 429, 1)
+    state = scheduler.hosts['example.com']
+    assert state.cap == 2
+    assert state.throttled == 1
+
+
+def test_slow_timed_responses_do_not_raise_the_cap():
+    scheduler = PolitenessScheduler(PolitenessConfig(rate=1000, burst=1000, target_latency=0.0))
+
+    async def run():
+        for _ in range(10):
+            async with scheduler.slot(URL) as slot:
+                await asyncio.sleep(0.01)
+                slot.record(200)
+    asyncio.run(run())
+    assert scheduler.hosts['example.com'].cap == 2
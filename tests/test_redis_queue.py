@@ -0,0 +1,88 @@
+import asyncio
+
+from fakeredis import aioredis
+
+from scripts.redis_queue import RedisWorkQueue
+
+
+def run(test):
+    """Run ``test(redis)`` against a fresh fake Redis."""
+    async def main():
+        redis = aioredis.FakeRedis()
+        try:
+            await test(redis)
+        finally:
+            await redis.aclose()
+    asyncio.run(main())
+
+
+def test_claim_in_priority_order_and_ack():
+    async def test(redis):
+        queue = RedisWorkQueue(redis, 'crawl', 'pages')
+        assert await queue.put('https://example.com/deep', 2)
+        assert await queue.put('https://example.com/', 0)
+        assert not await queue.put('https://example.com/other', 1, dedup_key='https://example.com/')
+
+        assert await queue.claim() == ('https://example.com/', 0)
+        assert await queue.leased() == 1
+        assert await queue.ack('https://example.com/')
+        assert await queue.claim() == ('https://example.com/deep', 2)
+        assert await queue.ack('https://example.com/deep', ok=False)
+        assert await queue.claim() is None
+        assert await queue.is_drained()
+
+        counters = await queue.counters()
+        assert counters['pages:queued'] == 2
+        assert counters['pages:duplicates'] == 1
+        assert counters['pages:done'] == 1
+        assert counters['pages:failed'] == 1
+    run(test)
+
+
+def test_expired_lease_is_claimed_again():
+    async def test(redis):
+        first = RedisWorkQueue(redis, 'crawl', 'pages', visibility_timeout=0.05)
+        second = RedisWorkQueue(redis, 'crawl', 'pages', visibility_timeout=0.05)
+        await first.put('https://example.com/')
+        assert await first.claim() == ('https://example.com/', 0)
+        assert await second.claim() is None
+
+        await asyncio.sleep(0.1)
+        assert await second.claim() == ('https://example.com/', 0)
+        assert (await second.counters())['pages:requeued'] == 1
+    run(test)
+
+
+def test_stale_ack_leaves_the_new_lease_alone():
+    async def test(redis):
+        first = RedisWorkQueue(redis, 'crawl', 'pages', visibility_timeout=0.05)
+        second = RedisWorkQueue(redis, 'crawl', 'pages', visibility_timeout=60)
+        await first.put('https://example.com/')
+        await first.claim()
+        await asyncio.sleep(0.1)
+        await second.claim()
+
+        # The first worker's lease expired: neither its heartbeat nor its ack
+        # may touch the lease the second worker holds now
+        await first.extend(dict(first._held))
+        assert not await first.ack('https://example.com/')
+        assert await second.leased() == 1
+        assert 'pages:done' not in await second.counters()
+
+        assert await second.ack('https://example.com/')
+        assert (await second.counters())['pages:done'] == 1
+        assert await second.is_drained()
+    run(test)
+
+
+def test_heartbeat_keeps_a_held_lease():
+    async def test(redis):
+        worker = RedisWorkQueue(redis, 'crawl', 'pages', visibility_timeout=0.3)
+        other = RedisWorkQueue(redis, 'crawl', 'pages', visibility_timeout=0.3)
+        await worker.put('https://example.com/')
+        async with worker:
+            await worker.claim()
+            await asyncio.sleep(0.5)
+            assert await other.claim() is None
+            assert await worker.ack('https://example.com/')
+    run(test)
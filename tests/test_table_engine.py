@@ -0,0 +1,20 @@
+from scripts.table_engine import csv_to_markdown
+
+
+def test_csv_becomes_a_markdown_table(tmp_path):
+    path = tmp_path / 'prices.csv'
+    path.write_text('item,price\napple,1\npear|plum,2\nfig,3\n')
+    assert csv_to_markdown(str(path), max_rows=2) == (
+        '| item | price |\n'
+        '|---|---|\n'
+        '| apple | 1 |\n'
+        '| pear\\|plum | 2 |\n'
+        '\n'
+        '<!-- truncated: first 2 rows converted -->'
+    )
+
+
+def test_empty_csv_is_an_empty_table(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_text('')
+    assert csv_to_markdown(str(path)) == ''
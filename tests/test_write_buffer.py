@@ -0,0 +1,54 @@
+import asyncio
+from dataclasses import replace
+
+from crawler.database import DatabaseManager
+from crawler.database.models import ContentVersion, HttpValidator
+from crawler.utils.config import config
+from scripts.write_buffer import WriteBuffer
+
+
+def open_database(path):
+    db = DatabaseManager(replace(config, db_type='sqlite', local_storage_path=str(path)))
+    db.create_database()
+    return db
+
+
+def count(db, model):
+    with db.get_session() as session:
+        return session.query(model).count()
+
+
+def test_a_bad_row_only_drops_itself(tmp_path):
+    db = open_database(tmp_path)
+    try:
+        async def write():
+            buffer = WriteBuffer(db, retries=2, retry_delay=0)
+            for i in range(5):
+                await buffer.insert(ContentVersion, dict(id=i + 1, url_hash=f'{i}' * 64))
+            # Same primary key as the first row, so the batch as a whole fails
+            await buffer.insert(ContentVersion, dict(id=1, url_hash='x' * 64))
+            await buffer.upsert(HttpValidator, dict(url_hash='v' * 64, etag='"1"'), key='url_hash')
+            await buffer.close()
+            return buffer
+        buffer = asyncio.run(write())
+        assert (buffer.written, buffer.failed, buffer.retried) == (6, 1, 2)
+        assert count(db, ContentVersion) == 5
+        assert count(db, HttpValidator) == 1
+    finally:
+        db.dispose()
+
+
+def test_batches_are_written_whole(tmp_path):
+    db = open_database(tmp_path)
+    try:
+        async def write():
+            buffer = WriteBuffer(db, batch_size=10)
+            for i in range(25):
+                await buffer.insert(ContentVersion, dict(url_hash=f'{i:064d}'))
+            await buffer.close()
+            return buffer
+        buffer = asyncio.run(write())
+        assert (buffer.written, buffer.failed, buffer.retried) == (25, 0, 0)
+        assert count(db, ContentVersion) == 25
+    finally:
+        db.dispose()